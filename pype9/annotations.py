@@ -16,6 +16,9 @@ EXTERNAL_CURRENTS = 'ExternalCurrents'
 NO_TIME_DERIVS = 'StateVariablesThatHaveNoTimeDerivatives'
 NUM_TIME_DERIVS = 'NumberOfTimeDerivatives'
 
+# Aliases that only depend on the membrane voltage and are tabulated
+TABULATED_ALIASES = 'TabulatedAliases'
+
 # Discarded parameters
 DISCARDED = 'Discarded'
 DISCARD_PARAM = 'DiscardedParameter'
@@ -39,6 +42,11 @@ ARTIFICIAL_CELL_MECH = 'ArtificialCellMech'
 # Build properties
 BUILD_PROPS = 'BuildProperties'
 
+# State variables that hold absolute times (e.g. the end of a refractory
+# period), which are shifted when simulations are checkpointed and restored
+TIME_PROPS = 'TimeProperties'
+ABSOLUTE_TIME = 'AbsoluteTime'
+
 # Additional variables (temporary until 9MLv2)
 ADDITIONAL_VARS = 'AdditionalVariables'
 INITIAL_REGIME = 'InitialRegime'
@@ -1,4 +1,5 @@
 from . import convert
 from . import simulate
 from . import plot
+from . import serve
 from . import help  # @ReservedAssignment
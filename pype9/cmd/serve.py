@@ -0,0 +1,84 @@
+"""
+Starts a persistent simulation worker, which keeps the simulator and the
+libraries of previously loaded models warm between jobs. Jobs (a model
+reference, properties, inputs and the ports to record) are sent to the worker
+over a local socket by the pype9.server.Client class and the recordings are
+sent back as arrays, e.g.::
+
+    $ pype9 serve nest --address localhost 6001
+
+Multiple workers can be started on separate ports to run jobs concurrently.
+Clients authenticate with the worker using the key given by the '--authkey'
+or '--authkey_file' options or the PYPE9_SERVE_AUTHKEY environment variable.
+If none are provided, a random key is generated and saved in
+'~/.pype9/serve_authkey' (readable only by the user). A key needs to be
+explicitly provided to listen on a non-loopback host.
+"""
+from argparse import ArgumentParser
+from pype9.simulate.common.code_gen import BaseCodeGenerator
+from pype9.utils.logging import logger
+
+
+def argparser():
+    parser = ArgumentParser(prog='pype9 serve',
+                            description=__doc__)
+    parser.add_argument('simulator', choices=('neuron', 'nest'), type=str,
+                        help="Which simulator backend to use")
+    parser.add_argument('--address', nargs=2, metavar=('HOST', 'PORT'),
+                        default=None,
+                        help=("The host and port to listen on (default "
+                              "localhost 6001)"))
+    parser.add_argument('--socket', type=str, default=None,
+                        help=("Path of a Unix domain socket to listen on "
+                              "instead of a host and port"))
+    parser.add_argument('--authkey', type=str, default=None,
+                        help=("Key that clients need to authenticate with the "
+                              "worker"))
+    parser.add_argument('--authkey_file', type=str, default=None,
+                        help=("File containing the key that clients need to "
+                              "authenticate with the worker (generated with "
+                              "a random key if it doesn't exist)"))
+    parser.add_argument('--build_mode', type=str, default='lazy',
+                        help=("The strategy used to build and compile the "
+                              "models. Can be one of '{}' (default "
+                              "%(default)s)".format("', '".join(
+                                  BaseCodeGenerator.BUILD_MODE_OPTIONS))))
+    parser.add_argument('--build_profile', type=str, default=None,
+                        choices=BaseCodeGenerator.BUILD_PROFILE_OPTIONS,
+                        help=("The optimisation profile used to compile the "
+                              "generated code. If not provided the default "
+                              "flags of the simulator's toolchain are used"))
+    parser.add_argument('--build_dir', default=None, type=str,
+                        help=("Base build directory"))
+    parser.add_argument('--recv_timeout', type=float, default=10.0,
+                        help=("The time (s) clients have to send their job "
+                              "after connecting (default %(default)s)"))
+    return parser
+
+
+def run(argv):
+    """
+    Runs the simulation worker until it is sent a 'shutdown' message
+    """
+    from pype9.exceptions import Pype9UsageError
+    from pype9.server import Server, DEFAULT_ADDRESS
+
+    args = argparser().parse_args(argv)
+
+    if args.socket is not None:
+        if args.address is not None:
+            raise Pype9UsageError(
+                "Only one of '--address' and '--socket' options can be "
+                "provided")
+        address = args.socket
+    elif args.address is not None:
+        address = (args.address[0], int(args.address[1]))
+    else:
+        address = DEFAULT_ADDRESS
+    server = Server(args.simulator, address=address, authkey=args.authkey,
+                    authkey_path=args.authkey_file,
+                    build_mode=args.build_mode, build_base_dir=args.build_dir,
+                    build_profile=args.build_profile,
+                    recv_timeout=args.recv_timeout)
+    server.serve()
+    logger.info("Finished serving {} simulations".format(args.simulator))
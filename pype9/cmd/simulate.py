@@ -88,11 +88,20 @@ def argparser():
                         help=("The delay applied to signals played into ports "
                               "of the model (only applicable for NEST "
                               "simulations)"))
+    parser.add_argument('--threads', type=int, default=1,
+                        help=("The number of threads to run on each MPI "
+                              "process (only applicable for NEST "
+                              "simulations, default %(default)s)"))
     parser.add_argument('--build_mode', type=str, default='lazy',
                         help=("The strategy used to build and compile the "
                               "model. Can be one of '{}' (default %(default)s)"
                               .format("', '".join(
                                   BaseCodeGenerator.BUILD_MODE_OPTIONS))))
+    parser.add_argument('--build_profile', type=str, default=None,
+                        choices=BaseCodeGenerator.BUILD_PROFILE_OPTIONS,
+                        help=("The optimisation profile used to compile the "
+                              "generated code. If not provided the default "
+                              "flags of the simulator's toolchain are used"))
     parser.add_argument('--build_dir', default=None, type=str,
                         help=("Base build directory"))
     parser.add_argument('--build_version', type=str, default=None,
@@ -121,6 +130,11 @@ def run(argv):
     else:
         assert False
 
+    if args.threads != 1 and args.simulator != 'nest':
+        raise Pype9UsageError(
+            "Multiple threads per process ({}) are only supported for NEST "
+            "simulations".format(args.threads))
+
     if not args.record:
         raise Pype9UsageError(
             "No recorders set, please specify at least one with the '--record'"
@@ -158,6 +172,9 @@ def run(argv):
     # For convenience
     model = args.model
 
+    code_generator = Simulation.CodeGenerator(
+        base_dir=args.build_dir, build_profile=args.build_profile)
+
     if isinstance(model, nineml.Network) and not model.num_projections:
         raise Pype9UsageError(
             "Provided network model '{}' (may have been implicitly created "
@@ -168,11 +185,12 @@ def run(argv):
         with Simulation(dt=timestep, seed=args.seed,
                         properties_seed=args.properties_seed,
                         device_delay=device_delay,
+                        threads_per_proc=args.threads,
+                        code_generator=code_generator,
                         **model.delay_limits()) as sim:
             # Construct the network
             logger.info("Constructing network")
-            network = Network(model, build_mode=args.build_mode,
-                              build_base_dir=args.build_dir)
+            network = Network(model, build_mode=args.build_mode)
             logger.info("Finished constructing the '{}' network"
                         .format(model.name))
             for rspec in record_specs:
@@ -228,12 +246,13 @@ def run(argv):
                              build_mode=args.build_mode,
                              external_currents=external_currents,
                              build_version=args.build_version,
-                             build_base_dir=args.build_dir)
+                             code_generator=code_generator)
         record_regime = False
         with Simulation(dt=timestep, seed=args.seed,
                         min_delay=min_delay,
                         device_delay=device_delay,
-                        build_base_dir=args.build_dir) as sim:
+                        threads_per_proc=args.threads,
+                        code_generator=code_generator) as sim:
             # Create cell
             cell = Cell(props, regime_=init_regime, **init_state)
             # Play inputs
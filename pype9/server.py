@@ -0,0 +1,461 @@
+"""
+A persistent simulation worker that keeps the simulator and the libraries of
+the models it has loaded "warm" between jobs, so that small single-cell
+simulations don't pay for Python start-up, importing the simulator, toolchain
+discovery and loading of the model libraries every time they are run.
+
+Workers are started with the 'pype9 serve' command and listen on a local
+socket for simulation jobs, which can be submitted with the Client class,
+e.g.::
+
+    $ pype9 serve nest --address localhost 6001 &
+
+    from pype9.server import Client
+
+    client = Client([('localhost', 6001)])
+    result = client.simulate(
+        'catalog://neuron/Izhikevich#SampleIzhikevich', 100.0 * un.ms,
+        0.01 * un.ms, record=['V'], properties={'a': 0.03 / un.ms},
+        regime='subthreshold_regime')
+    times, V = result['V'].times, result['V'].signal
+
+Jobs submitted to a client with more than one worker address are distributed
+between the workers.
+
+As the messages sent to the workers are pickled, clients need to
+authenticate with the workers using a secret key. The key is taken from the
+'authkey' argument, the PYPE9_SERVE_AUTHKEY environment variable or a key
+file (by default '~/.pype9/serve_authkey', which is generated with a random
+key by the worker if it doesn't exist), in that order. Workers only listen on
+non-loopback hosts if a key is explicitly provided.
+
+  Author: Thomas G. Close (tclose@oist.jp)
+  Copyright: 2012-2014 Thomas G. Close.
+  License: This file is part of the "NineLine" package, which is released under
+           the MIT Licence, see LICENSE for details.
+"""
+from builtins import object
+from past.builtins import basestring
+import os
+import errno
+import socket
+import binascii
+import collections
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import (
+    Listener, Client as Connection)
+from multiprocessing.pool import ThreadPool
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+import numpy
+import neo
+import nineml
+from nineml.exceptions import NineMLUsageError
+from pype9.exceptions import Pype9RuntimeError, Pype9UsageError
+from pype9.utils.arguments import nineml_document
+from pype9.utils.logging import logger
+
+
+DEFAULT_ADDRESS = ('localhost', 6001)
+
+AUTHKEY_ENV_VAR = 'PYPE9_SERVE_AUTHKEY'
+DEFAULT_AUTHKEY_PATH = os.path.join(os.path.expanduser('~'), '.pype9',
+                                    'serve_authkey')
+
+# Times are returned in ms, signals in the units given by 'units'
+Recording = collections.namedtuple('Recording', 'times signal units')
+
+
+def load_authkey(authkey=None, path=None, create=False):
+    """
+    Returns the key used to authenticate clients with the workers, from (in
+    order of precedence) the provided key, the PYPE9_SERVE_AUTHKEY
+    environment variable or a key file
+
+    Parameters
+    ----------
+    authkey : bytes | str | None
+        An explicitly provided key
+    path : str | None
+        Path of the key file. If None DEFAULT_AUTHKEY_PATH is used
+    create : bool
+        Whether to generate a random key and save it (readable only by the
+        user) if the key file doesn't exist
+
+    Returns
+    -------
+    authkey : bytes
+        The key
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    if authkey is not None:
+        if not isinstance(authkey, bytes):
+            authkey = authkey.encode()
+        return authkey
+    if path is None:
+        path = DEFAULT_AUTHKEY_PATH
+    if not os.path.exists(path):
+        if not create:
+            raise Pype9UsageError(
+                "No key to authenticate with simulation workers was provided "
+                "and key file '{}' doesn't exist".format(path))
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except OSError as e:
+            if e.errno != errno.EEXIST:  # Created by a concurrent worker
+                raise
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(binascii.hexlify(os.urandom(32)))
+            logger.info("Generated key to authenticate clients in '{}'"
+                        .format(path))
+    with open(path, 'rb') as f:
+        authkey = f.read().strip()
+    if not authkey:
+        raise Pype9UsageError("Key file '{}' is empty".format(path))
+    return authkey
+
+
+def _is_loopback(host):
+    try:
+        return socket.gethostbyname(host).startswith('127.')
+    except socket.error:
+        return host == '::1'
+
+
+class Server(object):
+    """
+    Listens for simulation jobs and runs them one after another, keeping the
+    cell classes of the models it has simulated loaded between jobs
+
+    Parameters
+    ----------
+    simulator : str
+        Name of the simulator to use, either 'nest' or 'neuron'
+    address : tuple(str, int) | str
+        The address to listen on, either a (host, port) tuple or a path to a
+        Unix domain socket
+    authkey : bytes | str | None
+        The key clients need to authenticate with the server. If None it is
+        loaded from the environment or the key file (see load_authkey)
+    authkey_path : str | None
+        Path of the key file, generated if it doesn't exist. If None
+        DEFAULT_AUTHKEY_PATH is used
+    build_mode : str
+        The build mode used to build the models
+    build_base_dir : str | None
+        Base build directory
+    build_profile : str | None
+        The optimisation profile used to compile the generated code
+    recv_timeout : float
+        The time (s) clients have to send their message after connecting
+        before the connection is dropped
+    """
+
+    def __init__(self, simulator, address=DEFAULT_ADDRESS, authkey=None,
+                 authkey_path=None, build_mode='lazy', build_base_dir=None,
+                 build_profile=None, recv_timeout=10.0):
+        if (not isinstance(address, basestring) and
+                not _is_loopback(address[0]) and authkey is None and
+                authkey_path is None and AUTHKEY_ENV_VAR not in os.environ):
+            raise Pype9UsageError(
+                "A key to authenticate clients needs to be explicitly "
+                "provided to listen on the non-loopback host '{}'".format(
+                    address[0]))
+        authkey = load_authkey(authkey, authkey_path, create=True)
+        if simulator == 'nest':
+            import pype9.simulate.nest as module
+        elif simulator == 'neuron':
+            import pype9.simulate.neuron as module
+        else:
+            raise Pype9UsageError(
+                "Unrecognised simulator '{}', can be one of 'nest' or "
+                "'neuron'".format(simulator))
+        self._CellMetaClass = module.CellMetaClass
+        self._Simulation = module.Simulation
+        self._code_generator = module.Simulation.CodeGenerator(
+            base_dir=build_base_dir, build_profile=build_profile)
+        self._address = address
+        self._authkey = authkey
+        self._build_mode = build_mode
+        self._recv_timeout = recv_timeout
+        # Loaded models and cell classes, keyed by their model reference and
+        # build options
+        self._models = {}
+        self._cell_classes = {}
+
+    @property
+    def address(self):
+        return self._address
+
+    def serve(self):
+        """
+        Accepts connections from clients and runs the jobs sent over them
+        until a 'shutdown' message is received. Each connection carries a
+        single message, which is dropped if it isn't sent within
+        'recv_timeout' of connecting, so a client can't block the others
+        """
+        listener = Listener(self._address, authkey=self._authkey)
+        logger.info("Serving {} simulations on {}"
+                    .format(self._Simulation.name, listener.address))
+        try:
+            running = True
+            while running:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError as e:
+                    logger.warning("Rejected connection: {}".format(e))
+                    continue
+                try:
+                    running = self._handle(conn)
+                finally:
+                    conn.close()
+        finally:
+            listener.close()
+        logger.info("Shut down {} simulation server".format(
+            self._Simulation.name))
+
+    def _handle(self, conn):
+        """
+        Handles the message sent over a connection, returns False if the
+        server should shut down
+        """
+        if not conn.poll(self._recv_timeout):
+            logger.warning("Dropped connection that didn't send a message "
+                           "within {} s".format(self._recv_timeout))
+            return True
+        try:
+            msg, job = conn.recv()
+        except EOFError:
+            return True
+        if msg == 'shutdown':
+            conn.send(('ok', None))
+            return False
+        elif msg == 'ping':
+            conn.send(('ok', self._Simulation.name))
+        elif msg == 'simulate':
+            try:
+                conn.send(('ok', self.simulate(**job)))
+            except (Pype9RuntimeError, NineMLUsageError) as e:
+                logger.error(e)
+                conn.send(('error', str(e)))
+            except Exception:
+                logger.error(traceback.format_exc())
+                conn.send(('error', traceback.format_exc()))
+        else:
+            conn.send(('error', "Unrecognised message '{}'".format(msg)))
+        return True
+
+    def simulate(self, model, duration, dt, record, properties=None,
+                 initial_values=None, regime=None, play=None, seed=None,
+                 build_version=None):
+        """
+        Runs a single-cell simulation
+
+        Parameters
+        ----------
+        model : str
+            Reference to the 9ML Dynamics or DynamicsProperties to simulate,
+            in the format of the 'model' argument of 'pype9 simulate'
+        duration : nineml.Quantity (time)
+            The time to run the simulation for
+        dt : nineml.Quantity (time)
+            The timestep of the simulation
+        record : list(str)
+            Names of the send ports and state variables to record
+        properties : dict(str, nineml.Quantity | pq.Quantity) | None
+            Properties overriding those of the model
+        initial_values : dict(str, nineml.Quantity | pq.Quantity) | None
+            Initial values of the state variables
+        regime : str | None
+            Initial regime, can be omitted if the model has a single regime
+        play : dict(str, neo.AnalogSignal | neo.SpikeTrain) | None
+            Signals to play into the receive ports of the model
+        seed : int | None
+            The seed of the simulation
+        build_version : str | None
+            Version appended to the name of the built model
+
+        Returns
+        -------
+        recordings : dict(str, Recording)
+            The recorded times and values (None for event ports) of each port
+        """
+        component_class, props = self._load(model)
+        play = play if play is not None else {}
+        if regime is None:
+            if component_class.num_regimes == 1:
+                regime = next(component_class.regime_names)
+            else:
+                raise Pype9UsageError(
+                    "Need to specify initial regime as dynamics has more than "
+                    "one '{}'".format("', '".join(
+                        component_class.regime_names)))
+        external_currents = tuple(sorted(
+            p for p in play
+            if component_class.port(p).dimension == nineml.units.current))
+        Cell = self._cell_class(component_class, build_version,
+                                external_currents)
+        values = dict(properties) if properties is not None else {}
+        if initial_values is not None:
+            values.update(initial_values)
+        with self._Simulation(dt=dt, seed=seed,
+                              code_generator=self._code_generator) as sim:
+            if props is not None:
+                cell = Cell(props, regime_=regime, lazy_=True, **values)
+            else:
+                cell = Cell(regime_=regime, lazy_=True, **values)
+            for port_name, signal in play.items():
+                cell.play(port_name, signal)
+            for port_name in record:
+                cell.record(port_name)
+            sim.run(duration)
+        return dict((p, self._to_arrays(cell.recording(p))) for p in record)
+
+    def _load(self, model_ref):
+        try:
+            return self._models[model_ref]
+        except KeyError:
+            model = nineml_document(model_ref)
+            if isinstance(model, nineml.DynamicsProperties):
+                loaded = (model.component_class, model)
+            elif isinstance(model, nineml.Dynamics):
+                loaded = (model, None)
+            else:
+                raise Pype9UsageError(
+                    "Model reference '{}' does not refer to a Dynamics or "
+                    "DynamicsProperties object ({})".format(model_ref, model))
+            self._models[model_ref] = loaded
+            return loaded
+
+    def _cell_class(self, component_class, build_version, external_currents):
+        key = (component_class.url, component_class.name, build_version,
+               external_currents)
+        try:
+            return self._cell_classes[key]
+        except KeyError:
+            Cell = self._CellMetaClass(
+                component_class, build_mode=self._build_mode,
+                build_version=build_version,
+                external_currents=list(external_currents),
+                code_generator=self._code_generator)
+            self._cell_classes[key] = Cell
+            return Cell
+
+    @classmethod
+    def _to_arrays(cls, recording):
+        if isinstance(recording, neo.SpikeTrain):
+            return Recording(
+                numpy.asarray(recording.rescale('ms').magnitude), None, None)
+        return Recording(
+            numpy.asarray(recording.times.rescale('ms').magnitude),
+            numpy.asarray(recording.magnitude).ravel(),
+            recording.units.dimensionality.string)
+
+
+class Client(object):
+    """
+    Submits simulation jobs to running 'pype9 serve' workers
+
+    Parameters
+    ----------
+    addresses : list(tuple(str, int) | str)
+        The addresses of the workers
+    authkey : bytes | str | None
+        The key used to authenticate with the workers. If None it is loaded
+        from the environment or the key file (see load_authkey)
+    authkey_path : str | None
+        Path of the key file. If None DEFAULT_AUTHKEY_PATH is used
+    """
+
+    def __init__(self, addresses=(DEFAULT_ADDRESS,), authkey=None,
+                 authkey_path=None):
+        if not addresses:
+            raise Pype9UsageError(
+                "At least one worker address needs to be provided")
+        self._addresses = list(addresses)
+        self._authkey = load_authkey(authkey, authkey_path)
+        # Workers that aren't running a job of the client, which jobs wait
+        # for if they are all busy
+        self._free = Queue()
+        for address in self._addresses:
+            self._free.put(address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):  # @UnusedVariable
+        self.close()
+
+    @property
+    def addresses(self):
+        return self._addresses
+
+    def simulate(self, model, duration, dt, record, **kwargs):
+        """
+        Runs a single-cell simulation on one of the workers. See
+        Server.simulate for a description of the arguments
+        """
+        job = dict(model=model, duration=duration, dt=dt, record=list(record))
+        job.update(kwargs)
+        return self._submit(job)
+
+    def simulate_many(self, jobs):
+        """
+        Runs simulation jobs concurrently over all workers, yielding the
+        results in the order of the jobs
+
+        Parameters
+        ----------
+        jobs : iterable(dict(str, object))
+            The keyword arguments of each job passed to Server.simulate
+        """
+        pool = ThreadPool(len(self._addresses))
+        try:
+            for result in pool.imap(self._submit, jobs):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def ping(self, address):
+        "Returns the name of the simulator of the worker at the address"
+        return self._request(address, 'ping', None)
+
+    def shutdown(self):
+        "Shuts down all the workers"
+        for address in self._addresses:
+            self._request(address, 'shutdown', None)
+
+    def close(self):
+        """
+        Kept for use as a context manager, as a new connection is opened for
+        each request (so clients don't block each other on a worker)
+        """
+
+    def _submit(self, job):
+        # Use a free worker so concurrent jobs run on separate workers
+        address = self._free.get()
+        try:
+            return self._request(address, 'simulate', job)
+        finally:
+            self._free.put(address)
+
+    def _request(self, address, msg, job):
+        conn = Connection(address, authkey=self._authkey)
+        try:
+            conn.send((msg, job))
+            status, result = conn.recv()
+        finally:
+            conn.close()
+        if status == 'error':
+            raise Pype9RuntimeError(
+                "Simulation worker failed to run job: {}".format(result))
+        return result
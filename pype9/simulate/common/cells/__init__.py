@@ -1,4 +1,5 @@
 from .base import Cell, CellMetaClass
+from .reducers import Reducer, Mean, Envelope, Histogram
 from .with_synapses import (
     DynamicsWithSynapses, DynamicsWithSynapsesProperties, WithSynapses,
     MultiDynamicsWithSynapses, MultiDynamicsWithSynapsesProperties,
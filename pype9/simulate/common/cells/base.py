@@ -13,16 +13,19 @@
 """
 from builtins import next
 from builtins import object
+from builtins import zip
+from collections import namedtuple
 from itertools import chain
 import numpy as np
 import quantities as pq
 import neo
 import nineml
+from nineml import units as un
 from nineml.abstraction import Dynamics, Regime
 from nineml.user import Property, Initial
 from pype9.utils.mpi import mpi_comm, is_mpi_master
 from nineml.exceptions import NineMLNameError
-from pype9.annotations import PYPE9_NS
+from pype9.annotations import PYPE9_NS, TIME_PROPS, ABSOLUTE_TIME
 from pype9.exceptions import (
     Pype9RuntimeError, Pype9AttributeError, Pype9DimensionError,
     Pype9UsageError, Pype9BuildMismatchError, Pype9NoActiveSimulationError,
@@ -38,6 +41,42 @@ logger = logging.Logger("Pype9")
 BUILD_NAME_SUFFIX = '9ML'
 
 
+# Entry of the accessor table precomputed for each cell class, holding
+# everything required to get/set a parameter or state variable without
+# resolving its dimension and units on every access.
+#   name      - name of the variable in the 9ML component class
+#   dimension - 9ML dimension of the variable
+#   units     - 9ML units the value is stored in within the simulator
+#   exponent  - power of ten of 'units', used to scale quantities in other
+#               units with a single multiplication
+#   pq_units  - python-quantities units the value is returned in
+#   is_state  - whether the variable is a state variable or a parameter
+#   accessor  - name of the variable within the simulator
+#   index     - position of the variable in the value arrays of lazily
+#               constructed cells (parameters followed by state variables)
+CellVariable = namedtuple(
+    'CellVariable',
+    'name dimension units exponent pq_units is_state accessor index')
+
+
+class AccessorTable(dict):
+    """
+    A read-only dictionary mapping the names of the parameters and state
+    variables of a cell class to their CellVariable entries. It is a dict
+    subclass so lookups are as fast as they are for a regular dict.
+    """
+
+    def _read_only(self, *args, **kwargs):  # @UnusedVariable
+        raise Pype9RuntimeError(
+            "Accessor tables of cell classes cannot be modified")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
 class CellMetaClass(type):
     """
     Metaclass for creating simulator-specific cell classes from 9ML Dynamics
@@ -128,7 +167,16 @@ class CellMetaClass(type):
                    'build_component_class': build_component_class,
                    'code_generator': code_generator,
                    'unit_handler': code_generator.UnitHandler(component_class),
-                   'Simulation': cls.Simulation}
+                   'Simulation': cls.Simulation,
+                   'Batch': cls.BatchClass}
+            dct['_accessors'] = cls._accessor_table(
+                component_class, build_component_class, dct['unit_handler'])
+            # Fixed orderings of the state variables and parameters used by
+            # the bulk get/set methods
+            dct['state_vector_names'] = tuple(
+                component_class.state_variable_names)
+            dct['parameter_vector_names'] = tuple(
+                component_class.parameter_names)
             # Create new class using Type.__new__ method
             Cell = super(CellMetaClass, cls).__new__(
                 cls, name, (cls.BaseCellClass,), dct)
@@ -142,6 +190,44 @@ class CellMetaClass(type):
         # (not sure if there is a more elegant way to do this).
         pass
 
+    @classmethod
+    def _accessor_table(cls, component_class, build_component_class,
+                        unit_handler):
+        """
+        Precomputes the dimension, simulator units and simulator accessor of
+        each parameter and state variable of the component class so they
+        don't need to be resolved each time they are accessed.
+        """
+        state_variable_names = set(component_class.state_variable_names)
+        entries = {}
+        for index, name in enumerate(chain(
+                component_class.parameter_names,
+                component_class.state_variable_names)):
+            dimension = component_class.element(
+                name, child_types=Dynamics.nineml_children).dimension
+            exponent, _ = unit_handler.dimension_to_units_compound(dimension)
+            entries[name] = CellVariable(
+                name=name, dimension=dimension,
+                units=unit_handler.dimension_to_units(dimension),
+                exponent=exponent,
+                pq_units=pq.Quantity(1.0, unit_handler.dimension_to_unit_str(
+                    dimension, one_as_dimensionless=True)).units,
+                is_state=(name in state_variable_names),
+                accessor=cls._simulator_accessor(
+                    name, component_class, build_component_class),
+                index=index)
+        return AccessorTable(entries)
+
+    @classmethod
+    def _simulator_accessor(cls, varname, component_class,  # @UnusedVariable
+                            build_component_class):  # @UnusedVariable
+        """
+        Returns the name used to access the variable within the simulator,
+        which can be overridden by derived classes where variables are
+        renamed in the build transform
+        """
+        return varname
+
 
 class Cell(object):
     """
@@ -154,6 +240,12 @@ class Cell(object):
         A dynamics properties object used as the "prototype" for the cell
     regime_ : str
         Name of regime the cell will be initiated in
+    lazy_ : bool
+        If True, the values of the properties and initial state variables are
+        stored in a compact array and the nineml.DynamicsProperties object
+        (along with its validation) is only constructed when it is required,
+        e.g. by 'write', 'serialize' or 'properties'. Useful when creating
+        large numbers of individual cells.
     kwargs : dict(str, nineml.Quantity)
         Properties and initial state variables to initiate the cell with. These
         will override properties/initial-values in the prototype
@@ -161,6 +253,9 @@ class Cell(object):
 
     def __init__(self, *args, **kwargs):
         self._in_array = kwargs.pop('_in_array', False)
+        lazy = kwargs.pop('lazy_', False)
+        self._nineml_props = None
+        self._values = None
         # Flag to determine whether the cell has been initialized or not
         # (it makes a difference to how the state of the cell is updated,
         # either saved until the 'initialze' method is called or directly
@@ -168,6 +263,19 @@ class Cell(object):
         sim = self.Simulation.active()
         self._t_start = sim.t_start
         self._t_stop = None
+        # The offset of the simulation time from the simulator kernel's time
+        # (ms), non-zero if the simulation has been restored from a checkpoint
+        self._t_offset = float(sim.t_offset.in_units(un.ms))
+        self._cache = None
+        self._stream = None
+        self._reducers = {}
+        self._remainders = {}
+        # Recordings made before the checkpoint the simulation was restored
+        # from
+        self._restored = {}
+        # The regime at the start of the restored recordings, which differs
+        # from the regime the cell is restored into
+        self._initial_regime_index = None
         if self.in_array:
             for k, v in kwargs.items():
                 self._set(k, v)  # Values should be in the right units.
@@ -213,6 +321,10 @@ class Cell(object):
                     "'regime_' permitted in Cell __init__ (provided: {})"
                     .format(', '.join(args)))
             self.set_regime(regime)
+            if lazy:
+                self._init_lazy(prototype, kwargs)
+                sim.register_cell(self)
+                return
             properties = []
             initial_values = []
             for name, qty in kwargs.items():
@@ -222,7 +334,7 @@ class Cell(object):
                     initial_values.append(nineml.Initial(name, qty))
                 else:
                     properties.append(nineml.Property(name, qty))
-            self._nineml = nineml.DynamicsProperties(
+            self._nineml_props = nineml.DynamicsProperties(
                 name=self.name + '_properties',
                 definition=prototype,
                 properties=properties, initial_values=initial_values,
@@ -238,6 +350,76 @@ class Cell(object):
                 self._set(p.name, float(self.unit_handler.scale_value(qty)))
             sim.register_cell(self)
 
+    def _init_lazy(self, prototype, kwargs):
+        """
+        Stores the scaled values of the prototype properties/initial-values
+        and keyword arguments in a compact array in place of constructing a
+        nineml.DynamicsProperties object, and sets them in the simulator.
+        Raises a Pype9UsageError if any property or initial value is not
+        provided by either the prototype or the keyword arguments
+        """
+        self._prototype = prototype
+        values = np.empty(len(self._accessors))
+        values.fill(np.nan)
+        for p in chain(getattr(prototype, 'properties', []),
+                       getattr(prototype, 'initial_values', [])):
+            qty = p.quantity
+            if qty.value.nineml_type != 'SingleValue':
+                raise Pype9UsageError(
+                    "Only SingleValue quantities can be used to initiate "
+                    "individual cell classes ({})".format(p))
+            values[self._accessors[p.name].index] = float(
+                self.unit_handler.scale_value(qty))
+        for name, qty in kwargs.items():
+            try:
+                var = self._accessors[name]
+            except KeyError:
+                raise self._accessor_error(name)
+            values[var.index] = self._scale_to_simulator(var, qty)[1]
+        missing = np.isnan(values)
+        if missing.any():
+            raise Pype9UsageError(
+                "Values for '{}' were not provided by the prototype or "
+                "keyword arguments of lazily constructed '{}' cell".format(
+                    "', '".join(sorted(
+                        var.name for var in self._accessors.values()
+                        if missing[var.index])), self.name))
+        self._values = values
+        self._set_multiple(dict(
+            (var.accessor, float(values[var.index]))
+            for var in self._accessors.values()))
+
+    @property
+    def _nineml(self):
+        """
+        The nineml.DynamicsProperties object holding the properties and
+        initial values of the cell, which is constructed from the stored
+        values on demand for lazily constructed cells
+        """
+        if self._nineml_props is None:
+            if self._values is None:
+                raise Pype9UsageError(
+                    "Properties are not stored for cells in arrays")
+            properties = []
+            initial_values = []
+            for var in self._accessors.values():
+                qty = nineml.Quantity(float(self._values[var.index]),
+                                      var.units)
+                if var.is_state:
+                    initial_values.append(nineml.Initial(var.name, qty))
+                else:
+                    properties.append(nineml.Property(var.name, qty))
+            super(Cell, self).__setattr__(
+                '_nineml_props', nineml.DynamicsProperties(
+                    name=self.name + '_properties',
+                    definition=self._prototype, properties=properties,
+                    initial_values=initial_values, check_initial_values=True))
+        return self._nineml_props
+
+    @property
+    def lazy(self):
+        return self._values is not None
+
     @property
     def component_class(self):
         return self._nineml.component_class
@@ -254,27 +436,27 @@ class Cell(object):
         super(Cell, self).__setattr__('_created', flag)
 
     def __contains__(self, varname):
-        return varname in chain(self.component_class.parameter_names,
-                                self.component_class.state_variable_names)
+        return varname in self._accessors
+
+    def _accessor_error(self, varname):
+        return Pype9AttributeError(
+            "'{}' is not an attribute nor parameter or state variable "
+            "of the '{}' component class ('{}')"
+            .format(varname, self.component_class.name,
+                    "', '".join(chain(
+                        self.component_class.parameter_names,
+                        self.component_class.state_variable_names))))
 
     def __getattr__(self, varname):
         """
         Gets the value of parameters and state variables
         """
         if self._created:
-            if varname not in self:
-                raise Pype9AttributeError(
-                    "'{}' is not an attribute nor parameter or state variable "
-                    "of the '{}' component class ('{}')"
-                    .format(varname, self.component_class.name,
-                            "', '".join(chain(
-                                self.component_class.parameter_names,
-                                self.component_class.state_variable_names))))
-            val = self._get(varname)
-            qty = self.unit_handler.assign_units(
-                val, self.component_class.element(
-                    varname, child_types=Dynamics.nineml_children).dimension)
-            return qty
+            try:
+                var = self._accessors[varname]
+            except KeyError:
+                raise self._accessor_error(varname)
+            return pq.Quantity(self._get(var.accessor), var.pq_units)
 
     def __setattr__(self, varname, val):
         """
@@ -289,37 +471,159 @@ class Cell(object):
         """
         if self._created:
             # Once the __init__ method has set all the members
-            if varname not in self:
-                raise Pype9AttributeError(
-                    "'{}' is not a parameter or state variable of the '{}'"
-                    " component class ('{}')"
-                    .format(varname, self.component_class.name,
-                            "', '".join(chain(
-                                self.component_class.parameter_names,
-                                self.component_class.state_variable_names))))
-            if isinstance(val, pq.Quantity):
-                qty = self.unit_handler.from_pq_quantity(val)
-            else:
-                qty = val
-            if qty.units.dimension != self.component_class.dimension_of(
-                    varname):
-                raise Pype9DimensionError(
-                    "Attempting so set '{}', which has dimension {} to "
-                    "{}, which has dimension {}".format(
-                        varname,
-                        self.component_class.dimension_of(varname), qty,
-                        qty.units.dimension))
+            try:
+                var = self._accessors[varname]
+            except KeyError:
+                raise self._accessor_error(varname)
+            qty, value = self._scale_to_simulator(var, val)
             if not self.in_array:
-                # Set the quantity in the nineml class
-                if varname in self.component_class.state_variable_names:
-                    self._nineml.set(Initial(varname, qty))
-                else:
-                    self._nineml.set(Property(varname, qty))
+                # Store the quantity in the nineml class (or value array)
+                self._store_value(var, qty, value)
             # Set the value in the simulator
-            self._set(varname, float(self.unit_handler.scale_value(qty)))
+            self._set(var.accessor, value)
         else:
             super(Cell, self).__setattr__(varname, val)
 
+    def _scale_to_simulator(self, var, val):
+        """
+        Checks the dimension of a value to be assigned to a parameter or state
+        variable and scales it to the units used in the simulator
+
+        Parameters
+        ----------
+        var : CellVariable
+            The accessor table entry of the variable
+        val : pq.Quantity | nineml.Quantity
+            The value to scale
+
+        Returns
+        -------
+        qty : nineml.Quantity
+            The value as a 9ML quantity
+        value : float
+            The value scaled to the units used in the simulator
+        """
+        if isinstance(val, pq.Quantity):
+            qty = self.unit_handler.from_pq_quantity(val)
+        else:
+            qty = val
+        units = qty.units
+        if units.dimension != var.dimension:
+            raise Pype9DimensionError(
+                "Attempting so set '{}', which has dimension {} to "
+                "{}, which has dimension {}".format(
+                    var.name, var.dimension, qty, units.dimension))
+        return qty, float(qty.value) * 10 ** (units.power - var.exponent)
+
+    def _store_value(self, var, qty, value):
+        if self._values is not None:
+            self._values[var.index] = value
+            # Invalidate the nineml properties constructed on demand
+            super(Cell, self).__setattr__('_nineml_props', None)
+        elif var.is_state:
+            self._nineml.set(Initial(var.name, qty))
+        else:
+            self._nineml.set(Property(var.name, qty))
+
+    def get_state_vector(self):
+        """
+        Gets the current values of all state variables in a single simulator
+        call
+
+        Returns
+        -------
+        state : numpy.ndarray
+            The values of the state variables, ordered as in
+            ``state_vector_names`` and in the units used by the simulator (as
+            given by ``unit_handler.dimension_to_units``)
+        """
+        return self._get_vector(self.state_vector_names)
+
+    def set_state_vector(self, state):
+        """
+        Sets the values of all state variables in a single simulator call
+
+        Parameters
+        ----------
+        state : numpy.ndarray
+            The values of the state variables, ordered as in
+            ``state_vector_names`` and in the units used by the simulator (as
+            returned by ``get_state_vector``)
+        """
+        state = np.asarray(state, dtype=float)
+        if state.shape != (len(self.state_vector_names),):
+            raise Pype9UsageError(
+                "Shape of state vector {} does not match the number of state "
+                "variables of '{}' ({}: '{}')".format(
+                    state.shape, self.name, len(self.state_vector_names),
+                    "', '".join(self.state_vector_names)))
+        self._set_vector(zip(self.state_vector_names, state))
+
+    def get_params(self):
+        """
+        Gets the current values of all parameters in a single simulator call
+
+        Returns
+        -------
+        params : dict(str, float)
+            The values of the parameters in the units used by the simulator
+            (as given by ``unit_handler.dimension_to_units``)
+        """
+        return dict(zip(self.parameter_vector_names,
+                        self._get_vector(self.parameter_vector_names)))
+
+    def set_params(self, params):
+        """
+        Sets the values of multiple parameters in a single simulator call
+
+        Parameters
+        ----------
+        params : dict(str, float | pq.Quantity | nineml.Quantity)
+            The values to set. Plain numbers are assumed to be in the units
+            used by the simulator (as returned by ``get_params``)
+        """
+        for name in params:
+            if name not in self.parameter_vector_names:
+                raise Pype9AttributeError(
+                    "'{}' is not a parameter of the '{}' component class "
+                    "('{}')".format(name, self.component_class.name,
+                                    "', '".join(self.parameter_vector_names)))
+        self._set_vector(params.items())
+
+    def _get_vector(self, names):
+        return np.array(
+            self._get_multiple([self._accessors[n].accessor for n in names]),
+            dtype=float)
+
+    def _set_vector(self, items):
+        values = {}
+        for name, val in items:
+            var = self._accessors[name]
+            if isinstance(val, (pq.Quantity, nineml.Quantity)):
+                qty, value = self._scale_to_simulator(var, val)
+            else:
+                value = float(val)
+                qty = nineml.Quantity(value, var.units)
+            if not self.in_array:
+                self._store_value(var, qty, value)
+            values[var.accessor] = value
+        self._set_multiple(values)
+
+    def _get_multiple(self, accessors):
+        """
+        Gets the values of multiple variables from the simulator. Can be
+        overridden by derived classes to retrieve them in a single call.
+        """
+        return [self._get(a) for a in accessors]
+
+    def _set_multiple(self, values):
+        """
+        Sets the values of multiple variables in the simulator. Can be
+        overridden by derived classes to set them in a single call.
+        """
+        for accessor, value in values.items():
+            self._set(accessor, value)
+
     def set_regime(self, regime):
         if regime not in self.component_class.regime_names:
             raise Pype9UsageError(
@@ -380,7 +684,7 @@ class Cell(object):
 
     def __repr__(self):
         return '{}(component_class="{}")'.format(
-            self.__class__.__name__, self._nineml.component_class.name)
+            self.__class__.__name__, self.component_class.name)
 
     def serialize(self, document, **kwargs):  # @UnusedVariable
         return self._nineml.serialize(document, **kwargs)
@@ -408,9 +712,47 @@ class Cell(object):
             index, Regime.nineml_type,
             nineml_children=Dynamics.nineml_children).name
 
+    @classmethod
+    def create_batch(cls, properties_table, regime_=None, prototype_=None,
+                     size=None):
+        """
+        Creates a batch of instances of the cell class within the active
+        simulation, which are set and recorded together. Useful for sweeping
+        the parameter space of a cell model in a single simulation.
+
+        Parameters
+        ----------
+        properties_table : dict(str, list(float) | Quantity)
+            The values of the properties and initial state variables of each
+            instance of the batch. Plain values are assumed to be in the units
+            used by the simulator and single values are used for every
+            instance
+        regime_ : str
+            Name of the regime the instances will be initiated in
+        prototype_ : DynamicsProperties
+            A dynamics properties object used as the "prototype" for values
+            not in the properties table
+        size : int | None
+            The number of instances in the batch. Only required if none of the
+            columns of the properties table are arrays
+
+        Returns
+        -------
+        batch : CellBatch
+            The created batch of instances
+        """
+        return cls.Batch(cls, properties_table, regime_=regime_,
+                         prototype_=prototype_, size=size)
+
     def initialize(self):
-        for iv in self._nineml.initial_values:
-            setattr(self, iv.name, iv.quantity)
+        if self._values is not None:
+            self._set_multiple(dict(
+                (self._accessors[n].accessor,
+                 float(self._values[self._accessors[n].index]))
+                for n in self.state_vector_names))
+        else:
+            for iv in self._nineml.initial_values:
+                setattr(self, iv.name, iv.quantity)
         self._set_regime()
 
     def write(self, file, **kwargs):  # @ReservedAssignment
@@ -434,17 +776,55 @@ class Cell(object):
         if not hasattr(self, '_recorders'):
             self.clear_recorders()
 
-    def record(self, port_name, t_start=None):
+    def record(self, port_name, interval=None, reducer=None):
         """
         Specify the recording of a send port or state-variable before the
         simulation.
+
+        Parameters
+        ----------
+        port_name : str
+            Name of the send port or state variable to record
+        interval : nineml.Quantity (time) | None
+            The sampling interval of analog recordings. If None the time step
+            of the simulation is used
+        reducer : Reducer | None
+            A reducer (e.g. Mean, Envelope or Histogram) used to summarise
+            analog recordings over consecutive windows. The recordings are
+            reduced after each chunk of the simulation (see the
+            'stream_interval' argument of Simulation), so only the reduced
+            values and the samples of the current chunk are kept in memory
         """
         raise NotImplementedError("Should be implemented by derived class")
 
+    def _set_reducer(self, port_name, reducer):
+        if reducer is None:
+            self._reducers.pop(port_name, None)
+        else:
+            if (port_name in self.component_class.send_port_names and
+                    self.component_class.send_port(
+                        port_name).communicates == 'event'):
+                raise Pype9UsageError(
+                    "Reducers can only be applied to analog recordings, not "
+                    "'{}' event port".format(port_name))
+            self._reducers[port_name] = reducer
+        self._remainders.pop(port_name, None)
+
+    def _recording_units(self, port_name, units):
+        """
+        The units of the recording of a port, which are changed by reducers
+        that don't preserve the units of the recording (e.g. Histogram)
+        """
+        reducer = self._reducers.get(port_name)
+        if reducer is not None and reducer.units is not None:
+            units = reducer.units
+        return units
+
     def record_regime(self):
         """
-        Returns the current regime at each timestep. Periods spent in each
-        regimes can be retrieved with the ``regime_epochs`` method.
+        Logs the transitions between regimes of the cell during the
+        simulation. Periods spent in each regime can be retrieved with the
+        ``regime_epochs`` method.
         """
         raise NotImplementedError("Should be implemented by derived class")
 
@@ -464,7 +844,7 @@ class Cell(object):
         seg = neo.Segment(description="Simulation of '{}' cell".format(
             self._nineml.name,
             ('from {}'.format(t_start) if t_start is not None else '')))
-        for port_name in self._recorders:
+        for port_name in self._recorded_keys():
             if port_name == self.code_generator.REGIME_VARNAME:
                 continue
             sig = self.recording(port_name, t_start=t_start)
@@ -478,32 +858,36 @@ class Cell(object):
             pass
         return seg
 
-    def _regime_recording(self):
-        raise NotImplementedError("Should be implemented by derived class")
-
     def regime_epochs(self):
         """
         Retrieves the periods spent in each regime during the simulation
         in a neo.core.EpochArray
         """
         try:
-            rec = self._regime_recording()
+            log, _ = self._recorded(self.code_generator.REGIME_VARNAME)
         except KeyError:
             raise Pype9RegimeTransitionsNotRecordedError(
                 "Regime transitions not recorded, call 'record_regime' before"
                 " simulation")
+        # The log consists of consecutive (time, new regime index) pairs of
+        # the transitions between regimes
+        log = np.reshape(log, (-1, 2))
         cc = self.build_component_class
         index_map = dict((cc.index_of(r), r.name) for r in cc.regimes)
-        trans_inds = np.nonzero(
-            np.asarray(rec[1:]) != np.asarray(rec[:-1]))[0] + 1
-        # Insert initial regime
-        trans_inds = np.insert(trans_inds, 0, 0)
-        labels = [index_map[int(rec[int(i)])] for i in trans_inds]
-        times = rec.times[trans_inds]
-        epochs = np.append(times, rec.t_stop) * times.units
-        durations = epochs[1:] - epochs[:-1]
+        if self.is_dead():
+            t_stop = self._t_stop
+        else:
+            t_stop = self.Simulation.active().t
+        t_start = float(self.unit_handler.to_pq_quantity(
+            self._t_start).rescale(pq.ms))
+        t_stop = float(self.unit_handler.to_pq_quantity(t_stop).rescale(pq.ms))
+        # Insert the initial regime
+        times = np.append(t_start, log[:, 0])
+        labels = [index_map[int(i)]
+                  for i in np.append(self._start_regime_index(), log[:, 1])]
+        durations = np.diff(np.append(times, t_stop))
         return neo.Epoch(
-            times=times, durations=durations, labels=labels,
+            times=times * pq.ms, durations=durations * pq.ms, labels=labels,
             name='{}_regimes'.format(self.name))
 
     def play(self, port_name, signal, properties=[]):
@@ -566,16 +950,352 @@ class Cell(object):
                     .format(prop.name, prop.units.dimension,
                             params_dict[prop.name].dimension))
 
-    def _kill(self, t_stop):
+    def _kill(self, t_stop, dtype=None):
         """
         Caches recording data and sets all references to the actual
         simulator object to None ahead of a simulator reset. This allows cell
         data to be accessed after a simulation has completed, and potentially
         a new simulation to have been started.
+
+        Parameters
+        ----------
+        t_stop : nineml.Quantity (time)
+            The time the simulation was stopped at
+        dtype : numpy.dtype | None
+            The dtype of the arrays the analog recordings are cached in (e.g.
+            numpy.float32 to halve their memory). If None they are cached in
+            double precision. Event times are always cached in double
+            precision.
         """
-        # TODO: Cache has not been implemented yet
+        if self._stream is not None:
+            # Recordings have been streamed to disk
+            self._flush_recordings(self._stream)
+            self._free_recorders()
+        elif getattr(self, '_recorders', None) is not None:
+            cache = {}
+            for key in self._recorder_keys():
+                data, interval = self._live_recording(key)
+                cache[key] = (np.array(
+                    data, dtype=(dtype if (dtype is not None and
+                                           interval is not None)
+                                 else float)), interval)
+            super(Cell, self).__setattr__('_cache', cache)
+            self._free_recorders()
         super(Cell, self).__setattr__('_t_stop', t_stop)
 
+    def _reset(self):
+        """
+        Clears the recordings of the cell and resets its start time ahead of
+        a new trial of the simulation (see Simulation.reset). The initial
+        state and regime of the cell are set again when the simulation is
+        next run
+        """
+        sim = self.Simulation.active()
+        if getattr(self, '_recorders', None) is not None:
+            self.reset_recordings()
+        super(Cell, self).__setattr__('_t_start', sim.t_start)
+        super(Cell, self).__setattr__(
+            '_t_offset', float(sim.t_offset.in_units(un.ms)))
+        super(Cell, self).__setattr__('_stream', None)
+        super(Cell, self).__setattr__('_restored', {})
+        super(Cell, self).__setattr__('_remainders', {})
+        super(Cell, self).__setattr__('_initial_regime_index', None)
+        self._restore_rng(None)
+
+    def _checkpoint(self):
+        """
+        Returns the state of the cell saved in checkpoints of the simulation
+        (see Simulation.checkpoint)
+        """
+        recordings = {}
+        remainders = {}
+        if getattr(self, '_recorders', None) is not None:
+            for key in self._recorder_keys():
+                recordings[key] = self._recorded(key)
+                if key in self._reducers:
+                    # Save the samples of the incomplete final window
+                    data, interval = self._read_recording(key)
+                    window_samples = self._reducers[key].window_samples(
+                        interval)
+                    remainders[key] = np.array(
+                        data[len(data) // window_samples * window_samples:])
+        # Absolute times held in state variables are saved in simulation time
+        state = self.get_state_vector()
+        state[self._absolute_time_indices()] += self._kernel_time_offset()
+        return {'class': self.__class__.name,
+                't_start': float(self._t_start.in_units(un.ms)),
+                'state': state,
+                'regime': self._current_regime_index(),
+                'initial_regime': self._start_regime_index(),
+                'rng': self._rng_state(),
+                'recordings': recordings,
+                'remainders': remainders}
+
+    def _restore(self, state):
+        """
+        Restores the state of the cell from a checkpoint of the simulation
+        (see Simulation.restore)
+
+        Parameters
+        ----------
+        state : dict(str, object)
+            The state of the cell returned by _checkpoint
+        """
+        if state['class'] != self.__class__.name:
+            raise Pype9UsageError(
+                "Cell class of restored cell, '{}', does not match that of "
+                "the checkpointed cell, '{}'".format(self.__class__.name,
+                                                     state['class']))
+        # Convert absolute times held in state variables to the time of the
+        # kernel of the restored simulation
+        state_vector = np.array(state['state'], dtype=float)
+        state_vector[self._absolute_time_indices()] -= (
+            self._kernel_time_offset())
+        self.set_state_vector(state_vector)
+        self.set_regime(self.from_regime_index(state['regime']))
+        super(Cell, self).__setattr__('_initial_regime_index',
+                                      state['initial_regime'])
+        self._restore_rng(state['rng'])
+        super(Cell, self).__setattr__('_t_start', state['t_start'] * un.ms)
+        super(Cell, self).__setattr__('_restored', state['recordings'])
+        super(Cell, self).__setattr__('_remainders',
+                                      dict(state['remainders']))
+
+    def _absolute_time_indices(self):
+        """
+        The indices of the state variables (in ``state_vector_names``) that
+        hold absolute times (e.g. the end of a refractory period), which need
+        to be marked explicitly in the component class with the annotation
+
+            state_variable.annotations.set((TIME_PROPS, PYPE9_NS),
+                                           ABSOLUTE_TIME, True)
+
+        as state variables holding durations can't be told apart from them
+        """
+        cc = self.component_class
+        # NB: Annotation values are read back from file as strings
+        return [i for i, n in enumerate(self.state_vector_names)
+                if str(cc.state_variable(n).annotations.get(
+                    (TIME_PROPS, PYPE9_NS), ABSOLUTE_TIME,
+                    default=False)) == 'True']
+
+    def _kernel_time_offset(self):
+        """
+        The offset of the simulation time from the time of the simulator
+        kernel in the units of the simulator
+        """
+        return float(self.unit_handler.scale_value(self._t_offset * un.ms))
+
+    def _current_regime_index(self):
+        """
+        The index of the regime the cell is currently in
+        """
+        raise NotImplementedError("Should be implemented by derived class")
+
+    def _start_regime_index(self):
+        """
+        The index of the regime the cell was in at the start of its
+        recordings, which precede the restored regime if the simulation was
+        restored from a checkpoint
+        """
+        if self._initial_regime_index is not None:
+            return self._initial_regime_index
+        return self._regime_index
+
+    def _rng_state(self):
+        """
+        The state of the random stream of the cell that is saved in
+        checkpoints, None if it can't be saved
+        """
+        return None
+
+    def _restore_rng(self, rng_state):  # @UnusedVariable
+        """
+        Restores the state of the random stream of the cell saved by
+        _rng_state
+        """
+        pass
+
+    def _kernel_signal(self, signal, t_min=0.0):
+        """
+        Converts the times of a signal played into the cell from the
+        simulation time to the time of the simulator kernel, which differ if
+        the simulation has been restored from a checkpoint. Parts of the
+        signal before the checkpoint, which have already been played into the
+        cell, are dropped, as are those within the minimum time that can be
+        played into the kernel (e.g. the device delay).
+
+        Parameters
+        ----------
+        signal : neo.AnalogSignal | neo.SpikeTrain
+            The signal to convert
+        t_min : float
+            The minimum kernel time that can be played into the cell (ms)
+
+        Returns
+        -------
+        signal : neo.AnalogSignal | neo.SpikeTrain | None
+            The converted signal, None if no part of an analog signal is left
+            to play
+        """
+        if not self._t_offset:
+            return signal
+        t_min = (self._t_offset + t_min) * pq.ms
+        offset = self._t_offset * pq.ms
+        if isinstance(signal, neo.SpikeTrain):
+            times = signal.times.rescale(pq.ms)
+            times = times[times > t_min] - offset
+            t_stop = signal.t_stop.rescale(pq.ms) - offset
+            return neo.SpikeTrain(times, t_start=(times[0] if len(times)
+                                                  else t_stop),
+                                  t_stop=t_stop)
+        start = int(np.searchsorted(signal.times.rescale(pq.ms), t_min,
+                                    side='right'))
+        if start == len(signal):
+            return None
+        return neo.AnalogSignal(
+            signal[start:], sampling_period=signal.sampling_period,
+            t_start=signal.times[start].rescale(pq.ms) - offset)
+
+    def _recorder_keys(self):
+        """
+        The names of the ports, state variables (and regime) that are
+        recorded
+        """
+        raise NotImplementedError("Should be implemented by derived class")
+
+    def _read_recorder(self, key):
+        """
+        Reads the recorded data from the simulator
+
+        Parameters
+        ----------
+        key : str
+            Name of the recorded port, state variable or regime
+
+        Returns
+        -------
+        data : numpy.ndarray
+            The recorded event times (ms) or analog samples (in the units of
+            the simulator)
+        interval : float | None
+            The sampling interval (ms) of analog recordings, None for events
+        """
+        raise NotImplementedError("Should be implemented by derived class")
+
+    def _free_recorders(self):
+        """
+        Releases the recording devices of the simulator once their data has
+        been cached
+        """
+        self.clear_recorders()
+
+    def _flush_recordings(self, store):
+        """
+        Appends the data recorded since the last flush to an on-disk store
+        and clears it from the recorders of the simulator
+
+        Parameters
+        ----------
+        store : RecordingStore
+            The store to append the recorded data to
+        """
+        if getattr(self, '_recorders', None) is None:
+            return
+        if self._stream is None:
+            super(Cell, self).__setattr__('_stream', store)
+            super(Cell, self).__setattr__(
+                '_stream_prefix', store.new_prefix(self.component_class.name))
+            # Prepend the recordings made before the checkpoint the
+            # simulation was restored from
+            for key, (data, interval) in self._restored.items():
+                store.append(self._stream_prefix + '/' + key, data, interval)
+        for key in self._recorder_keys():
+            data, interval = self._read_recording(key)
+            if key in self._reducers:
+                # Carry the samples of incomplete windows over to the next
+                # flush
+                window_samples = self._reducers[key].window_samples(
+                    interval)
+                num_samples = len(data) // window_samples * window_samples
+                # Copied as the data can be a view of the recorder, which is
+                # reset below
+                self._remainders[key] = np.array(data[num_samples:])
+                data = data[:num_samples]
+            data, interval = self._reduce(key, data, interval)
+            store.append(self._stream_prefix + '/' + key, data, interval)
+        self.reset_recordings()
+
+    def _recorded_keys(self):
+        if self._cache is not None:
+            return list(self._cache)
+        elif self._stream is not None and self.is_dead():
+            return self._stream.keys(self._stream_prefix)
+        return list(self._recorders)
+
+    def _recorded(self, key):
+        """
+        Returns the recorded data and sampling interval (see _read_recorder)
+        from the cache if the cell is dead or otherwise from the simulator,
+        prepended by any data that has been streamed to disk
+        """
+        if self._cache is not None:
+            return self._cache[key]
+        if self._stream is not None:
+            stream_key = self._stream_prefix + '/' + key
+            if self.is_dead():
+                return self._stream.read(stream_key)
+            elif stream_key in self._stream:
+                streamed, _ = self._stream.read(stream_key)
+                data, interval = self._reduce(key, *self._read_recording(key))
+                return np.concatenate((streamed, data)), interval
+        return self._live_recording(key)
+
+    def _live_recording(self, key):
+        """
+        Returns the (reduced) data recorded by the simulator, prepended by
+        the data recorded before the checkpoint the simulation was restored
+        from, if applicable
+        """
+        data, interval = self._reduce(key, *self._read_recording(key))
+        if key in self._restored:
+            data = np.concatenate((self._restored[key][0], data))
+        return data, interval
+
+    def _read_recording(self, key):
+        """
+        Reads the recorded data from the simulator (see _read_recorder),
+        prepended by the samples of incomplete reducer windows carried over
+        from previous flushes and with event times converted from the time
+        of the simulator kernel to the simulation time
+        """
+        data, interval = self._read_recorder(key)
+        if interval is None:
+            if self._t_offset:
+                data = np.array(data, dtype=float)
+                if key == self.code_generator.REGIME_VARNAME:
+                    # Only shift the times of the (time, regime index) pairs
+                    data[::2] += self._t_offset
+                else:
+                    data += self._t_offset
+        elif key in self._remainders:
+            data = np.concatenate((self._remainders[key], data))
+        return data, interval
+
+    def _reduce(self, key, data, interval):
+        """
+        Reduces the recorded data if a reducer has been set for the
+        recording, returning the reduced data and the window length (ms)
+        """
+        reducer = self._reducers.get(key)
+        if reducer is None:
+            return data, interval
+        window_samples = reducer.window_samples(interval)
+        num_windows = len(data) // window_samples
+        return (reducer(np.reshape(data[:num_windows * window_samples],
+                                   (num_windows, window_samples))),
+                reducer.window_ms)
+
     def is_dead(self):
         return self._t_stop is not None
 
@@ -599,3 +1319,261 @@ class Cell(object):
     # This has to go last to avoid clobbering the property decorators
     def property(self, name):
         return self._nineml.property(name)
+
+
+class CellBatch(object):
+    """
+    A batch of instances of the same cell class that are created, set and
+    recorded together in a single simulation (typically to sweep the
+    parameter space of the cell model). Batches should be created with the
+    ``create_batch`` class method of the cell class.
+
+    By default each instance is a lazily constructed cell (see the 'lazy_'
+    option of Cell), derived classes can override '_create' and the
+    get/set/record methods to use the bulk creation and access methods of the
+    simulator.
+
+    Parameters
+    ----------
+    cell_class : Cell
+        The cell class to create the instances of
+    properties_table : dict(str, list(float) | pq.Quantity | nineml.Quantity)
+        The values of the properties and initial state variables of each
+        instance. Plain values are assumed to be in the units used by the
+        simulator and single values are used for every instance
+    regime_ : str
+        Name of the regime the instances will be initiated in
+    prototype_ : DynamicsProperties
+        A dynamics properties object used as the "prototype" for values
+        not in the properties table
+    size : int | None
+        The number of instances in the batch. Only required if none of the
+        columns of the properties table are arrays
+    """
+
+    # Whether the recordings of the batch are streamed to the store of the
+    # simulation (true when the instances are individual cell objects)
+    STREAMS_RECORDINGS = True
+
+    def __init__(self, cell_class, properties_table, regime_=None,
+                 prototype_=None, size=None):
+        self._cell_class = cell_class
+        sim = cell_class.Simulation.active()
+        self._t_start = sim.t_start
+        self._t_stop = None
+        if prototype_ is None:
+            prototype_ = cell_class.component_class
+        self._prototype = prototype_
+        component_class = cell_class.component_class
+        if regime_ is None:
+            if component_class.num_regimes == 1:
+                regime_ = next(component_class.regime_names)
+            else:
+                raise Pype9UsageError(
+                    "Need to specify initial regime using 'regime_' "
+                    "keyword arg for component class with multiple "
+                    "regimes ('{}')".format(
+                        "', '".join(component_class.regime_names)))
+        elif regime_ not in component_class.regime_names:
+            raise Pype9UsageError(
+                "'{}' is not a name of a regime in '{} cells "
+                "(regimes are '{}')".format(
+                    regime_, cell_class.name,
+                    "', '".join(component_class.regime_names)))
+        self._regime = regime_
+        self._regime_index = cell_class.regime_index(regime_)
+        # Scale the values of the prototype and properties table to the
+        # units of the simulator
+        columns = {}
+        for p in chain(getattr(prototype_, 'properties', []),
+                       getattr(prototype_, 'initial_values', [])):
+            if p.name not in properties_table:
+                columns[p.name] = self._scale_column(p.name, p.quantity)
+        for name, values in properties_table.items():
+            columns[name] = self._scale_column(name, values)
+        sizes = set(len(c) for c in columns.values() if c.ndim)
+        if size is not None:
+            sizes.add(size)
+        if len(sizes) > 1:
+            raise Pype9UsageError(
+                "Mismatching numbers of values provided in properties table "
+                "of '{}' batch ({})".format(
+                    cell_class.name, ', '.join(str(s) for s in sorted(sizes))))
+        self._size = sizes.pop() if sizes else 1
+        self._create(dict((n, c * np.ones(self._size))
+                          for n, c in columns.items()))
+        sim.register_batch(self)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def cell_class(self):
+        return self._cell_class
+
+    @property
+    def regime(self):
+        return self._regime
+
+    def _scale_column(self, varname, values):
+        """
+        Checks the dimension of the values to be assigned to a parameter or
+        state variable and scales them to the units used in the simulator
+        """
+        try:
+            var = self._cell_class._accessors[varname]
+        except KeyError:
+            raise Pype9AttributeError(
+                "'{}' is not a parameter or state variable of the '{}' "
+                "component class".format(varname, self._cell_class.name))
+        unit_handler = self._cell_class.unit_handler
+        if isinstance(values, pq.Quantity):
+            dimension = unit_handler.pq_units_to_nineml(values.units).dimension
+        elif isinstance(values, nineml.Quantity):
+            dimension = values.units.dimension
+        else:
+            return np.asarray(values, dtype=float)
+        if dimension != var.dimension:
+            raise Pype9DimensionError(
+                "Attempting so set '{}', which has dimension {} to "
+                "values with dimension {}".format(varname, var.dimension,
+                                                  dimension))
+        return np.asarray(unit_handler.scale_values(values), dtype=float)
+
+    def _create(self, columns):
+        """
+        Creates the instances of the batch in the simulator
+
+        Parameters
+        ----------
+        columns : dict(str, numpy.ndarray)
+            The values of the properties and initial states of each instance
+            in the units of the simulator
+        """
+        accessors = self._cell_class._accessors
+        self._cells = []
+        for i in range(self._size):
+            self._cells.append(self._cell_class(
+                self._prototype, self._regime, lazy_=True, **dict(
+                    (n, nineml.Quantity(float(c[i]), accessors[n].units))
+                    for n, c in columns.items())))
+
+    @property
+    def cells(self):
+        """
+        The cell objects of the instances in the batch
+        """
+        return self._cells
+
+    def get(self, varname):
+        """
+        Gets the values of a parameter or state variable of every instance
+
+        Parameters
+        ----------
+        varname : str
+            Name of the parameter or state variable
+
+        Returns
+        -------
+        values : pq.Quantity
+            The values of the variable for each instance
+        """
+        var = self._cell_class._accessors[varname]
+        return pq.Quantity(self._get_column(var.accessor), var.pq_units)
+
+    def set(self, varname, values):
+        """
+        Sets the values of a parameter or state variable of every instance
+
+        Parameters
+        ----------
+        varname : str
+            Name of the parameter or state variable
+        values : list(float) | pq.Quantity | nineml.Quantity
+            The values to set. Plain values are assumed to be in the units
+            used by the simulator and single values are used for every
+            instance
+        """
+        values = self._scale_column(varname, values) * np.ones(self._size)
+        self._set_column(self._cell_class._accessors[varname], values)
+
+    def _get_column(self, accessor):
+        return np.array([c._get(accessor) for c in self._cells], dtype=float)
+
+    def _set_column(self, var, values):
+        for cell, value in zip(self._cells, values):
+            value = float(value)
+            cell._store_value(var, nineml.Quantity(value, var.units), value)
+            cell._set(var.accessor, value)
+
+    def record(self, port_name, interval=None):
+        """
+        Records a send port or state variable of every instance during the
+        simulation
+
+        Parameters
+        ----------
+        port_name : str
+            Name of the send port or state variable to record
+        interval : nineml.Quantity (time) | None
+            The sampling interval of analog recordings. If None the
+            recording is sampled at every time step
+        """
+        for cell in self._cells:
+            cell.record(port_name, interval=interval)
+
+    def recording(self, port_name):
+        """
+        Returns the recordings of a send port or state variable of every
+        instance
+
+        Parameters
+        ----------
+        port_name : str
+            Name of the port or state variable to retrieve the recording for
+
+        Returns
+        -------
+        recording : pq.Quantity | list(neo.SpikeTrain)
+            An (N x T) array of the analog recordings of the N instances
+            or a list of the spike trains emitted from each instance for
+            event ports
+        """
+        recordings = [c.recording(port_name) for c in self._cells]
+        if isinstance(recordings[0], neo.SpikeTrain):
+            return recordings
+        return pq.Quantity(
+            np.vstack([np.asarray(r).ravel() for r in recordings]),
+            recordings[0].units)
+
+    def recording_times(self, port_name):
+        """
+        Returns the times that a send port or state variable of the instances
+        was sampled at
+        """
+        return self._cells[0].recording(port_name).times
+
+    def initialize(self):
+        """
+        Just in time initialisations that are performed before the simulation
+        starts running. The default instances are registered with the
+        simulation and initialize themselves.
+        """
+        pass
+
+    def _reset(self):
+        """
+        Resets the start time of the batch ahead of a new trial of the
+        simulation (see Simulation.reset). The default instances are
+        registered with the simulation and reset themselves.
+        """
+        self._t_start = self._cell_class.Simulation.active().t_start
+
+    def _kill(self, t_stop, dtype=None):  # @UnusedVariable
+        # The default instances are registered with the simulation and cache
+        # their own recordings
+        self._t_stop = t_stop
+
+    def is_dead(self):
+        return self._t_stop is not None
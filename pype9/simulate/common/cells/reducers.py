@@ -0,0 +1,132 @@
+"""
+Reducers that summarise analog recordings of cells over consecutive windows
+of time, so that full-resolution traces don't need to be kept in memory (or
+streamed to disk) when only summaries of them are required, e.g.::
+
+    cell.record('V', interval=0.1 * un.ms, reducer=Mean(1.0 * un.ms))
+
+  Author: Thomas G. Close (tclose@oist.jp)
+  Copyright: 2012-2014 Thomas G. Close.
+  License: This file is part of the "NineLine" package, which is released under
+           the MIT Licence, see LICENSE for details.
+"""
+from builtins import object
+import numpy
+import nineml.units as un
+from pype9.exceptions import Pype9UsageError
+
+
+class Reducer(object):
+    """
+    Base class of reducers, which summarise the samples of an analog
+    recording within consecutive windows of time. Samples in the final window
+    of the recording are discarded if the window isn't complete.
+
+    Parameters
+    ----------
+    window : nineml.Quantity (time)
+        The length of the windows the recording is reduced over. Must be an
+        integer multiple of the sampling interval of the recording
+    """
+
+    # The units of the reduced recording, None if the same as the recording
+    units = None
+
+    def __init__(self, window):
+        if window.units.dimension != un.time:
+            raise Pype9UsageError(
+                "Reducer window must have dimension of time ({})"
+                .format(window))
+        self._window = window
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def window_ms(self):
+        return float(self._window.in_units(un.ms))
+
+    def window_samples(self, interval):
+        """
+        The number of samples in each window
+
+        Parameters
+        ----------
+        interval : float
+            The sampling interval of the recording (ms)
+        """
+        ratio = self.window_ms / interval
+        num_samples = int(round(ratio))
+        if num_samples < 1 or abs(num_samples - ratio) > 1e-6:
+            raise Pype9UsageError(
+                "Reducer window ({}) is not an integer multiple of the "
+                "sampling interval of the recording ({} ms)".format(
+                    self._window, interval))
+        return num_samples
+
+    def __call__(self, windows):
+        """
+        Reduces the samples in each window
+
+        Parameters
+        ----------
+        windows : numpy.ndarray
+            The samples of the recording arranged in a
+            (num_windows x samples_per_window) array
+
+        Returns
+        -------
+        reduced : numpy.ndarray
+            The reduced values of each window (one row per window)
+        """
+        raise NotImplementedError("Should be implemented by derived class")
+
+
+class Mean(Reducer):
+    """
+    The mean of the recording within each window
+    """
+
+    def __call__(self, windows):
+        return windows.mean(axis=1)
+
+
+class Envelope(Reducer):
+    """
+    The minimum and maximum of the recording within each window (as the two
+    channels of the reduced recording)
+    """
+
+    def __call__(self, windows):
+        return numpy.column_stack((windows.min(axis=1), windows.max(axis=1)))
+
+
+class Histogram(Reducer):
+    """
+    The number of samples of the recording within each bin of a histogram
+    for each window (as the channels of the reduced recording)
+
+    Parameters
+    ----------
+    window : nineml.Quantity (time)
+        The length of the windows the recording is reduced over
+    bins : list(float)
+        The edges of the bins of the histogram in the units the recording is
+        returned in
+    """
+
+    units = 'dimensionless'
+
+    def __init__(self, window, bins):
+        super(Histogram, self).__init__(window)
+        self._bins = numpy.asarray(bins, dtype=float)
+
+    @property
+    def bins(self):
+        return self._bins
+
+    def __call__(self, windows):
+        return numpy.array(
+            [numpy.histogram(w, self._bins)[0] for w in windows],
+            dtype=float).reshape((len(windows), len(self._bins) - 1))
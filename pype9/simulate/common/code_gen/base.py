@@ -23,14 +23,17 @@ from os.path import join
 from jinja2 import Environment, FileSystemLoader, StrictUndefined
 from future.utils import with_metaclass
 from abc import ABCMeta, abstractmethod
+import numpy
 import sympy
 from nineml import units
 from nineml.exceptions import NineMLNameError, NineMLSerializationError
+from nineml.abstraction import Expression
 from pype9.exceptions import (
     Pype9BuildError, Pype9CommandNotFoundError, Pype9RuntimeError)
 from ..cells.with_synapses import read
 import pype9.annotations
-from pype9.annotations import PYPE9_NS, BUILD_PROPS
+from pype9.annotations import (
+    PYPE9_NS, BUILD_PROPS, BUILD_TRANS, MEMBRANE_VOLTAGE, TABULATED_ALIASES)
 from os.path import expanduser
 import re
 from nineml.serialization import url_re
@@ -54,6 +57,10 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
         base_dir : str | None
             The base directory for the generated code. If None a directory
             will be created in user's home directory.
+        build_profile : str | None
+            The optimisation profile used to compile the generated code, can
+            be one of 'debug', 'release' or 'native'. If None the default
+            flags of the simulator's toolchain are used.
     """
 
     BUILD_MODE_OPTIONS = ['lazy',  # Build iff source has been updated
@@ -64,6 +71,19 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
                           'purge'  # Remove all configure files and rebuild
                           ]
 
+    BUILD_PROFILE_OPTIONS = ['debug',  # No optimisation, debug symbols
+                             'release',  # Full optimisation
+                             'native'  # Host CPU tuning and link-time opt.
+                             ]
+
+    # Compile and link flags appended to the simulator defaults for each
+    # build profile
+    _BUILD_PROFILE_FLAGS = {
+        'debug': (['-O0', '-g', '-fno-omit-frame-pointer'], ['-g']),
+        'release': (['-O3', '-DNDEBUG'], []),
+        'native': (['-O3', '-march=native', '-flto', '-DNDEBUG'],
+                   ['-O3', '-march=native', '-flto'])}
+
     _PARAMS_DIR = 'params'
     _SRC_DIR = 'src'
     _INSTL_DIR = 'install'
@@ -84,20 +104,38 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
     # units
     DEFAULT_UNITS = {}
 
-    def __init__(self, base_dir=None, **kwargs):  # @UnusedVariable
+    # Default range and resolution (in mV) of the lookup tables used for
+    # aliases that only depend on the membrane voltage (see 'tabulate' build
+    # option), and the relative interpolation error above which a warning is
+    # logged
+    TABLE_V_MIN_DEFAULT = -100.0
+    TABLE_V_MAX_DEFAULT = 100.0
+    TABLE_V_STEP_DEFAULT = 0.1
+    TABLE_TOLERANCE_DEFAULT = 1e-3
+
+    def __init__(self, base_dir=None, build_profile=None, **kwargs):  # @UnusedVariable @IgnorePep8
         if base_dir is None:
             base_dir = BASE_BUILD_DIR
         self._base_dir = os.path.join(
             base_dir, self.SIMULATOR_NAME + self.SIMULATOR_VERSION)
+        if (build_profile is not None and
+                build_profile not in self.BUILD_PROFILE_OPTIONS):
+            raise Pype9BuildError(
+                "Unrecognised build profile '{}', must be one of ('{}')"
+                .format(build_profile,
+                        "', '".join(self.BUILD_PROFILE_OPTIONS)))
+        self._build_profile = build_profile
 
     def __repr__(self):
-        return "{}CodeGenerator(base_dir='{}')".format(
-            self.SIMULATOR_NAME.capitalize(), self.base_dir)
+        return "{}CodeGenerator(base_dir='{}', build_profile={})".format(
+            self.SIMULATOR_NAME.capitalize(), self.base_dir,
+            repr(self.build_profile))
 
     def __eq__(self, other):
         try:
             return (self.SIMULATOR_NAME == other.SIMULATOR_NAME and
-                    self.base_dir == other.base_dir)
+                    self.base_dir == other.base_dir and
+                    self.build_profile == other.build_profile)
         except AttributeError:
             return False
 
@@ -108,6 +146,28 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
     def base_dir(self):
         return self._base_dir
 
+    @property
+    def build_profile(self):
+        return self._build_profile
+
+    @property
+    def compile_flags(self):
+        """
+        Compiler flags appended to the simulator defaults by the build profile
+        """
+        if self.build_profile is None:
+            return []
+        return list(self._BUILD_PROFILE_FLAGS[self.build_profile][0])
+
+    @property
+    def link_flags(self):
+        """
+        Linker flags appended to the simulator defaults by the build profile
+        """
+        if self.build_profile is None:
+            return []
+        return list(self._BUILD_PROFILE_FLAGS[self.build_profile][1])
+
     @abstractmethod
     def generate_source_files(self, dynamics, src_dir, name, **kwargs):
         """
@@ -246,6 +306,7 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
         os.chdir(orig_dir)
         # Cache any dimension maps that were calculated during the generation
         # process
+        self.UnitHandler.save_cache()
         return install_dir
 
     def get_build_dir(self, name, url):
@@ -402,9 +463,173 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
         # ---------------------------------------------------------------------
         component_class = component_class.clone()
         component_class.name = name
+        kwargs = self._table_build_props(**kwargs)
         self._set_build_props(component_class, **kwargs)
         return component_class
 
+    def _table_build_props(self, **kwargs):
+        """
+        Fills in the defaults of the table range and resolution if the
+        'tabulate' build option is set so they are saved with the other build
+        properties
+        """
+        if kwargs.get('tabulate', False):
+            kwargs.setdefault('table_v_min', self.TABLE_V_MIN_DEFAULT)
+            kwargs.setdefault('table_v_max', self.TABLE_V_MAX_DEFAULT)
+            kwargs.setdefault('table_v_step', self.TABLE_V_STEP_DEFAULT)
+            if kwargs['table_v_max'] <= kwargs['table_v_min']:
+                raise Pype9BuildError(
+                    "Maximum of table range ({}) must be greater than its "
+                    "minimum ({})".format(kwargs['table_v_max'],
+                                          kwargs['table_v_min']))
+            if kwargs['table_v_step'] <= 0.0:
+                raise Pype9BuildError(
+                    "Table step ({}) must be greater than 0"
+                    .format(kwargs['table_v_step']))
+        return kwargs
+
+    def _annotate_tabulated_aliases(self, component_class, voltage):
+        """
+        Finds the aliases that only depend on the membrane voltage (and
+        constants) and saves their names in the annotations of the build
+        component class so they can be generated as lookup tables
+
+        Parameters
+        ----------
+        component_class : Dynamics
+            The build component class
+        voltage : str
+            The name of the membrane voltage in the component class
+        """
+        allowed = set(chain([voltage], component_class.constant_names))
+        tabulated = []
+        # Loop until no more aliases can be added as they can depend on each
+        # other
+        added = True
+        while added:
+            added = False
+            for alias in component_class.aliases:
+                if (alias.name not in tabulated and
+                        not list(component_class.overridden_in_regimes(
+                            alias)) and
+                        set(alias.rhs_symbol_names) <= allowed and
+                        (voltage in alias.rhs_symbol_names or
+                         any(s in tabulated for s in alias.rhs_symbol_names))):
+                    tabulated.append(alias.name)
+                    allowed.add(alias.name)
+                    added = True
+        component_class.annotations.set((BUILD_TRANS, PYPE9_NS),
+                                        MEMBRANE_VOLTAGE, voltage)
+        component_class.annotations.set((BUILD_TRANS, PYPE9_NS),
+                                        TABULATED_ALIASES, ','.join(tabulated))
+        logger.info("Tabulating aliases '{}' of '{}' over '{}'".format(
+            "', '".join(tabulated), component_class.name, voltage))
+
+    def tabulation(self, component_class):
+        """
+        Returns the lookup tables to generate for the aliases of the build
+        component class that only depend on the membrane voltage.
+
+        Parameters
+        ----------
+        component_class : Dynamics
+            The build component class
+
+        Returns
+        -------
+        tabulation : dict | None
+            The voltage variable name ('voltage'), the range and resolution of
+            the tables ('v_min', 'v_max', 'v_step' and 'size') and a list of
+            (alias, scaled_expr, units) tuples ('aliases'), where 'scaled_expr'
+            is the scaled alias expression with all tabulated aliases it
+            depends on substituted so it is only a function of the voltage.
+            None if no aliases are tabulated.
+        """
+        names = component_class.annotations.get(
+            (BUILD_TRANS, PYPE9_NS), TABULATED_ALIASES, default='')
+        names = [n for n in names.split(',') if n]
+        if not names:
+            return None
+        unit_handler = self.UnitHandler(component_class)
+        aliases = []
+        expanded = {}
+        # Names are in dependency order so the expanded versions of the
+        # aliases an alias depends on will have already been calculated
+        for name in names:
+            alias = component_class.alias(name)
+            scaled_expr, units_str = unit_handler.scale_alias(alias)
+            rhs = scaled_expr.rhs.subs(
+                dict((sympy.Symbol(n), e) for n, e in expanded.items()))
+            expanded[name] = rhs
+            aliases.append((alias, Expression(rhs), units_str))
+        get = component_class.annotations.get
+        v_min = float(get((BUILD_PROPS, PYPE9_NS), 'table_v_min'))
+        v_max = float(get((BUILD_PROPS, PYPE9_NS), 'table_v_max'))
+        v_step = float(get((BUILD_PROPS, PYPE9_NS), 'table_v_step'))
+        return {'voltage': get((BUILD_TRANS, PYPE9_NS), MEMBRANE_VOLTAGE),
+                'v_min': v_min, 'v_max': v_max, 'v_step': v_step,
+                'size': int(round((v_max - v_min) / v_step)) + 1,
+                'aliases': aliases}
+
+    def tabulation_errors(self, component_class):
+        """
+        Checks the accuracy of the lookup tables generated for the build
+        component class against the untabulated alias expressions by
+        evaluating the relative error of linear interpolation midway between
+        each pair of table entries (where it is largest). Only the aliases
+        themselves are compared, not the simulated output, so the effect of
+        the errors on the dynamics of the cell is not checked
+
+        Parameters
+        ----------
+        component_class : Dynamics
+            The build component class
+
+        Returns
+        -------
+        errors : dict(str, float)
+            The maximum relative error of each tabulated alias
+        """
+        tabulation = self.tabulation(component_class)
+        if tabulation is None:
+            return {}
+        unit_handler = self.UnitHandler(component_class)
+        constants = dict(
+            (sympy.Symbol(c.name), v) for c, v, _ in
+            unit_handler.assign_units_to_constants(component_class.constants))
+        v = sympy.Symbol(tabulation['voltage'])
+        # Calculated the same way as in the generated code
+        table_v = (tabulation['v_min'] +
+                   numpy.arange(tabulation['size']) * tabulation['v_step'])
+        mid_v = (table_v[:-1] + table_v[1:]) / 2.0
+        errors = {}
+        for alias, scaled_expr, _ in tabulation['aliases']:
+            func = sympy.lambdify(v, scaled_expr.rhs.subs(constants),
+                                  modules='numpy')
+            table = numpy.broadcast_to(func(table_v), table_v.shape)
+            exact = numpy.broadcast_to(func(mid_v), mid_v.shape)
+            interp = (table[:-1] + table[1:]) / 2.0
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                rel_error = numpy.abs(interp - exact) / numpy.abs(exact)
+            rel_error[exact == interp] = 0.0
+            errors[alias.name] = float(numpy.nanmax(rel_error))
+        return errors
+
+    def _check_tabulation(self, component_class, **kwargs):
+        """
+        Logs a warning for each tabulated alias with a relative error larger
+        than the 'table_tolerance' build option (see tabulation_errors)
+        """
+        tolerance = kwargs.get('table_tolerance', self.TABLE_TOLERANCE_DEFAULT)
+        for name, error in sorted(
+                self.tabulation_errors(component_class).items()):
+            if error > tolerance:
+                logger.warning(
+                    "Relative error of lookup table for '{}' alias of '{}' "
+                    "({}) exceeds tolerance ({}), consider reducing the "
+                    "'table_v_step' build option".format(
+                        name, component_class.name, error, tolerance))
+
     def _set_build_props(self, component_class, **build_props):
         """
         Sets the build properties in the component class annotations
@@ -417,6 +642,10 @@ class BaseCodeGenerator(with_metaclass(ABCMeta, object)):
             Build properties to save into the annotations of the build
             component class
         """
+        # Include the build profile so that modules compiled with different
+        # flags are not mistaken for each other
+        if self.build_profile is not None:
+            build_props['build_profile'] = self.build_profile
         for k, v in list(build_props.items()) + [
                 ('version', pype9.__version__)]:
             component_class.annotations.set((BUILD_PROPS, PYPE9_NS), k, v)
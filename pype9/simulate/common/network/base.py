@@ -74,11 +74,15 @@ class Network(object):
                 name = "Anonymous"
             nineml_model = nineml_model.as_network(name=name)
         self._nineml = nineml_model.clone()
-        # Get RNG for random distribution values and connectivity
-        rng = self.Simulation.active().properties_rng
+        # Resample the connectivity of each projection from its own random
+        # stream
+        sim = self.Simulation.active()
         if build_mode != 'build_only':
-            self.nineml.resample_connectivity(
-                connectivity_class=self.ConnectivityClass, rng=rng)
+            for projection in self.nineml.projections:
+                projection.resample_connectivity(
+                    connectivity_class=self.ConnectivityClass,
+                    rng=sim.derived_properties_rng('connectivity',
+                                                   projection.name))
         (flat_comp_arrays, flat_conn_groups,
          flat_selections) = self._flatten_to_arrays_and_conns(self._nineml)
         self._component_arrays = {}
@@ -600,7 +604,8 @@ class ComponentArray(object):
             initial_regime=dynamics_properties.initial_regime,
             build_mode=build_mode, **kwargs)
         if build_mode != 'build_only':
-            rng = self.Simulation.active().properties_rng
+            rng = self.Simulation.active().derived_properties_rng(
+                'component_array', nineml_model.name)
             cellparams = dict(
                 (p.name, get_pyNN_value(p, self.UnitHandler, rng))
                 for p in dynamics_properties.properties)
@@ -617,6 +622,7 @@ class ComponentArray(object):
                 label=nineml_model.name)
             self._inputs = {}
         self._t_stop = None
+        self._cached_segment = None
         self.Simulation.active().register_array(self)
 
     @property
@@ -790,7 +796,10 @@ class ComponentArray(object):
             The recorded data in a neo.Segment
         """
 
-        pyNN_data = self.get_data().segments[0]
+        if self._cached_segment is not None:
+            pyNN_data = self._cached_segment
+        else:
+            pyNN_data = self.get_data().segments[0]
         recording = neo.Segment()
         communicates, _ = self._get_port_details(port_name)
         if communicates == 'event':
@@ -808,18 +817,49 @@ class ComponentArray(object):
                     recording.analogsignals.append(asig)
         return recording
 
-    def _kill(self, t_stop):
+    def _kill(self, t_stop, dtype=None):
         """
         Caches all recording data and sets all references to the actual
         simulator object to None ahead of a simulator reset. This allows
         data to be accessed after a simulation has completed, and potentially
         a new simulation to have been started.
+
+        Parameters
+        ----------
+        t_stop : nineml.Quantity (time)
+            The time the simulation was stopped at
+        dtype : numpy.dtype | None
+            The dtype of the arrays the analog recordings are cached in (e.g.
+            numpy.float32 to halve their memory). If None they are cached in
+            double precision.
         """
+        if any(self.recorder.recorded.values()):
+            # Clearing the recorded data releases it from the simulator
+            segment = self.get_data(clear=True).segments[0]
+            if dtype is not None:
+                signals = []
+                for asig in segment.analogsignals:
+                    compact = neo.AnalogSignal(
+                        asig.magnitude, units=asig.units, dtype=dtype,
+                        t_start=asig.t_start,
+                        sampling_period=asig.sampling_period,
+                        name=asig.name)
+                    compact.annotations.update(asig.annotations)
+                    signals.append(compact)
+                segment.analogsignals = signals
+            self._cached_segment = segment
         self._t_stop = t_stop
 
+    def _reset(self):
+        """
+        Clears the recordings of the array ahead of a new trial of the
+        simulation (see Simulation.reset)
+        """
+        self.recorder.clear()
+
     @property
     def is_dead(self):
-        return self._t_stop is None
+        return self._t_stop is not None
 
 
 class Selection(object):
@@ -911,7 +951,8 @@ class ConnectionGroup(object):
     """
 
     def __init__(self, nineml_model, source, destination):
-        rng = self.Simulation.active().properties_rng
+        rng = self.Simulation.active().derived_properties_rng(
+            'connection_group', nineml_model.name)
         if not isinstance(nineml_model, EventConnectionGroup9ML):
             raise Pype9RuntimeError(
                 "Expected a connection group model, found {}"
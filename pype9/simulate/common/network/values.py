@@ -23,8 +23,7 @@ def get_pyNN_value(qty, unit_handler, rng):
     if isinstance(qty.value, SingleValue):
         val = unit_handler.scale_value(qty)
     elif isinstance(qty.value, ArrayValue):
-        scalar = unit_handler.scalar(qty.units)
-        val = Sequence(v * scalar for v in qty.value)
+        val = Sequence(unit_handler.scale_values(qty))
     elif isinstance(qty.value, RandomDistributionValue):
         if unit_handler.scalar(qty.units) != 1.0:
             raise NotImplementedError(
@@ -1,12 +1,17 @@
-from builtins import object
+from builtins import object, zip
 from abc import ABCMeta, abstractmethod
 from nineml import units as un
+import os
+import pickle
+import zlib
 import numpy
 import time
 from pype9.exceptions import Pype9UsageError, Pype9NoActiveSimulationError
 from pyNN.random import NumpyRNG
 from future.utils import with_metaclass
 from pype9.utils.logging import logger
+from pype9.utils.seeds import child_seed
+from .stream import RecordingStore, MemoryStore
 
 
 class Simulation(with_metaclass(ABCMeta, object)):
@@ -45,9 +50,9 @@ class Simulation(with_metaclass(ABCMeta, object)):
     properties_seed : int | None
         The seed used for random number generator used to set properties and
         generate connectivity. If not provided it will be derived from the
-        'seed' argument.
-        NB: This seed will only reproduce constant results if the number
-        of MPI nodes is constant
+        'seed' argument. The properties and connectivity of each object of a
+        network are drawn from their own stream of this seed, so they are
+        reproduced regardless of the number of MPI nodes
     min_delay : nineml.Quantity (time) | None
         The minimum delay in the network. If None the min delay will be
         calculated from the first network to be created (if a single cell
@@ -56,15 +61,44 @@ class Simulation(with_metaclass(ABCMeta, object)):
         The maximum delay in the network. If None the max delay will be
         calculated from the first network to be created (if a single cell
         then it will be the same as the timestep)
+    recording_dtype : numpy.dtype | None
+        The dtype of the arrays analog recordings are cached in when the
+        simulation context exits and the simulator-side recorders are freed
+        (e.g. numpy.float32 to halve their memory). If None they are cached
+        in double precision
+    stream_to : str | None
+        Path to a directory in which to stream the recordings of cells to
+        during the simulation (see RecordingStore). If provided, the
+        simulation is advanced in chunks of 'stream_interval' and the new
+        data recorded in each chunk is appended to the store and cleared from
+        the recorders of the simulator so memory use stays flat during long
+        simulations. Only the recordings of stand-alone cells can be
+        streamed, so simulations containing cell arrays or batches that
+        record through shared devices can't be run with 'stream_to'
+    stream_interval : nineml.Quantity (time)
+        The length of the chunks the simulation is advanced in when streaming
+        recordings to disk (rounded down to a multiple of the min delay). If
+        recordings aren't streamed to disk but reducers are applied to them,
+        the simulation is advanced in chunks of this length and the
+        recordings are reduced into memory after each one (see MemoryStore)
     options : dict(str, object)
         Options passed to the simulator-specific methods
     """
 
     max_seed = 2 ** 32 - 1
 
+    # Keys of the independent streams of the base seeds that the seeds of the
+    # simulation are derived from (see pype9.utils.seeds)
+    PROPERTIES_STREAM = 0
+    DYNAMICS_STREAM = 1
+    GLOBAL_STREAM = 2
+    OBJECT_PROPERTIES_STREAM = 3
+
     def __init__(self, dt, t_start=0.0 * un.s, seed=None, properties_seed=None,
                  min_delay=1 * un.ms, max_delay=10 * un.ms,
-                 code_generator=None, build_base_dir=None, **options):
+                 code_generator=None, build_base_dir=None,
+                 recording_dtype=None, stream_to=None,
+                 stream_interval=1.0 * un.s, **options):
         self._check_units('dt', dt, un.time)
         self._check_units('t_start', dt, un.time)
         self._check_units('min_delay', dt, un.time, allow_none=True)
@@ -75,8 +109,17 @@ class Simulation(with_metaclass(ABCMeta, object)):
         self._min_delay = min_delay if min_delay > dt else dt
         self._max_delay = max_delay if max_delay > dt else dt
         self._options = options
+        self._recording_dtype = recording_dtype
+        self._check_units('stream_interval', stream_interval, un.time)
+        self._stream_to = stream_to
+        self._stream_interval = stream_interval
+        self._stream = None
+        self._t_offset = 0.0 * un.ms
+        self._restored_cells = None
         self._registered_cells = None
         self._registered_arrays = None
+        self._registered_batches = None
+        self._properties_rng = None
         if seed is not None and (seed < 0 or seed > self.max_seed):
             raise Pype9UsageError(
                 "Provided seed {} is out of range, must be between (0 and {})"
@@ -117,6 +160,13 @@ class Simulation(with_metaclass(ABCMeta, object)):
         self._prepare()
         self._registered_cells = []
         self._registered_arrays = []
+        self._registered_batches = []
+        if self._stream_to is not None:
+            self._stream = RecordingStore(self._stream_to)
+        else:
+            self._stream = None
+        self._t_offset = 0.0 * un.ms
+        self._restored_cells = None
         self.__class__._active = self
 
     def deactivate(self, kill_cells=True):
@@ -124,14 +174,17 @@ class Simulation(with_metaclass(ABCMeta, object)):
         self.__class__._active = None
         if kill_cells:
             for cell in self._registered_cells:
-                cell._kill(t_stop)
+                cell._kill(t_stop, dtype=self._recording_dtype)
             for array in self._registered_arrays:
-                array._kill(t_stop)
+                array._kill(t_stop, dtype=self._recording_dtype)
+            for batch in self._registered_batches:
+                batch._kill(t_stop, dtype=self._recording_dtype)
         else:
             logger.warning(
                 "Not killing cells as an uncaught exception was thrown")
         self._registered_cells = None
         self._registered_arrays = None
+        self._registered_batches = None
 
     @property
     def dt(self):
@@ -145,6 +198,15 @@ class Simulation(with_metaclass(ABCMeta, object)):
     def t_start(self):
         return self._t_start
 
+    @property
+    def t_offset(self):
+        """
+        The offset of the simulation time from the time of the simulator
+        kernel, i.e. the time the simulation was restored from (see
+        ``restore``)
+        """
+        return self._t_offset
+
     @property
     def min_delay(self):
         return self._min_delay
@@ -204,37 +266,88 @@ class Simulation(with_metaclass(ABCMeta, object)):
 
     def _set_seeds(self):
         """
-        Generate seeds for each process/thread
+        Generate seeds for each process/thread from independent child streams
+        of the base seeds (see ``_spawn_seeds``), so the seed of each
+        thread doesn't depend on the total number of processes/threads
         """
         seed = self.gen_seed() if self._base_seed is None else self._base_seed
-        seed_gen_rng = numpy.random.RandomState(seed)
         if self._base_properties_seed is None:
             logger.info("Using {} as seed for both properties and dynamics of "
                         "{} simulation".format(seed, self.name))
-            prop_seed_gen_rng = seed_gen_rng
+            properties_seed = seed
         else:
             logger.info("Using {} as seed for properties and {} as seed for "
                         "dynamics of {} simulation"
                         .format(self._base_properties_seed, seed, self.name))
-            prop_seed_gen_rng = numpy.random.RandomState(
-                self._base_properties_seed)
-        # Properties seeds are drawn before dynamics_seeds
-        self._properties_seeds = numpy.asarray(
-            prop_seed_gen_rng.uniform(low=0, high=self.max_seed,
-                                        size=self.num_threads()), dtype=int)
-        self._dynamics_seeds = numpy.asarray(
-            seed_gen_rng.uniform(low=0, high=self.max_seed,
-                                 size=self.num_threads()), dtype=int)
-        self._global_seed = int(seed_gen_rng.uniform(low=0, high=self.max_seed,
-                                                     size=1,))
+            properties_seed = self._base_properties_seed
+        self._properties_entropy = properties_seed
+        self._properties_seeds = self._spawn_seeds(
+            properties_seed, self.PROPERTIES_STREAM, self.num_threads())
+        self._set_dynamics_seeds(seed)
         self._properties_rng = NumpyRNG(int(self.properties_seed))
 
+    def _set_dynamics_seeds(self, seed):
+        """
+        Generate the seeds of the random dynamic processes of each
+        process/thread and the global seed
+        """
+        self._dynamics_seeds = self._spawn_seeds(
+            seed, self.DYNAMICS_STREAM, self.num_threads())
+        self._global_seed = int(self._spawn_seeds(
+            seed, self.GLOBAL_STREAM, 1)[0])
+
+    @classmethod
+    def _spawn_seeds(cls, seed, stream, num_seeds):
+        """
+        Generates seeds from the first children of a stream of a base seed
+        (see pype9.utils.seeds.child_seed). As the children are generated in
+        order, the first seeds don't depend on the number of seeds generated
+
+        Parameters
+        ----------
+        seed : int
+            The base seed
+        stream : int
+            The key of the stream of the base seed to spawn the children from
+        num_seeds : int
+            The number of seeds to generate
+        """
+        return numpy.array([child_seed(seed, (stream, i))
+                            for i in range(num_seeds)], dtype=int)
+
+    def derived_properties_rng(self, category, name):
+        """
+        Returns a random number generator for the properties or connectivity
+        of a single object of a network, drawn from its own child stream of
+        the properties seed. So the values generated for each object don't
+        depend on the order the objects are constructed in, or on the number
+        of processes (as the parallel-safe RNGs draw the values of all cells
+        and connections on every process and keep the local ones)
+
+        Parameters
+        ----------
+        category : str
+            The category of the object (e.g. 'component_array' or
+            'connectivity')
+        name : str
+            The name of the object
+        """
+        if self._properties_rng is None:
+            raise Pype9UsageError(
+                "Can only access rng inside simulation context")
+        key = zlib.crc32('{}/{}'.format(category, name).encode('utf-8'))
+        return NumpyRNG(
+            child_seed(self._properties_entropy,
+                       (self.OBJECT_PROPERTIES_STREAM, key & 0xffffffff)),
+            parallel_safe=True)
+
     @property
     def derived_properties_seed(self):
         return int(self.properties_rng.uniform(low=0, high=self.max_seed,
                                                size=1))
 
-    def run(self, t_stop, **kwargs):
+    def run(self, t_stop, checkpoint_every=None, checkpoint_path=None,
+            **kwargs):
         """
         Run the simulation until time ``t_stop``.
 
@@ -242,14 +355,244 @@ class Simulation(with_metaclass(ABCMeta, object)):
         ----------
         t_stop : nineml.Quantity (time)
             The time to run the simulation until
+        checkpoint_every : nineml.Quantity (time) | None
+            If provided, the simulation is advanced in chunks of this length
+            (rounded down to a multiple of the min delay) and a checkpoint of
+            the simulation is saved to 'checkpoint_path' after each one (see
+            ``checkpoint``)
+        checkpoint_path : str | None
+            The path the checkpoints are saved to (overwriting the previous
+            checkpoint)
         """
         self._check_units('t_stop', t_stop, un.time)
+        if checkpoint_every is not None:
+            self._check_units('checkpoint_every', checkpoint_every, un.time)
+            if checkpoint_path is None:
+                raise Pype9UsageError(
+                    "A 'checkpoint_path' needs to be provided to save "
+                    "checkpoints to")
+            # Check before running so the simulation isn't run in vain
+            self._check_checkpointable()
+        if self._stream_to is not None and (
+                self._registered_arrays or
+                not all(b.STREAMS_RECORDINGS
+                        for b in self._registered_batches)):
+            raise Pype9UsageError(
+                "Recordings of cell arrays and of cell batches recorded "
+                "through shared devices are not streamed to disk, so they "
+                "would be held in memory for the whole simulation. Create "
+                "stand-alone cells instead or don't provide 'stream_to'")
         if not self._running:
             self._initialize()
             self._running = True
-        self._run(t_stop, **kwargs)
+        if self._stream is None and any(c._reducers
+                                        for c in self._registered_cells):
+            # Reduce the recordings after each chunk of the simulation so
+            # their full-resolution data isn't kept for the whole simulation
+            self._stream = MemoryStore(dtype=self._recording_dtype)
+        # Advance the simulation in chunks, flushing the recordings to disk
+        # and saving checkpoints at the end of the respective chunks
+        stream_ms = (self._chunk_ms(self._stream_interval)
+                     if self._stream is not None else None)
+        checkpoint_ms = (self._chunk_ms(checkpoint_every)
+                         if checkpoint_every is not None else None)
+        offset_ms = float(self._t_offset.in_units(un.ms))
+        t_ms = float(self._t.in_units(un.ms))
+        t_stop_ms = float(t_stop.in_units(un.ms))
+        next_flush_ms = (t_ms + stream_ms if stream_ms is not None
+                         else float('inf'))
+        next_checkpoint_ms = (t_ms + checkpoint_ms
+                              if checkpoint_ms is not None else float('inf'))
+        while t_ms < t_stop_ms:
+            t_ms = min(next_flush_ms, next_checkpoint_ms, t_stop_ms)
+            self._run((t_ms - offset_ms) * un.ms, **kwargs)
+            self._t = t_ms * un.ms
+            if self._stream is not None and (t_ms == next_flush_ms or
+                                             t_ms == t_stop_ms):
+                self._flush_recordings()
+                next_flush_ms += stream_ms
+            if t_ms == next_checkpoint_ms:
+                self.checkpoint(checkpoint_path)
+                next_checkpoint_ms += checkpoint_ms
         self._t = t_stop
 
+    def _chunk_ms(self, interval):
+        """
+        Rounds the length of a chunk the simulation is advanced in down to a
+        multiple of the min delay (ms)
+        """
+        min_delay = (self.min_delay if self.min_delay is not None
+                     else self.dt)
+        min_delay_ms = float(min_delay.in_units(un.ms))
+        return min_delay_ms * max(numpy.floor(
+            float(interval.in_units(un.ms)) / min_delay_ms), 1)
+
+    def checkpoint(self, path):
+        """
+        Saves the state of the simulation, i.e. the time, the state vectors,
+        regimes and random-stream states of the registered cells and their
+        recordings so far, so that it can be resumed after an interruption
+        with ``restore``. The checkpoint is written to a temporary file first
+        so an interruption while it is saved doesn't corrupt the previous
+        checkpoint.
+
+        Only simulations of stand-alone cells can be checkpointed, and cells
+        with random dynamics only if the state of their random stream can be
+        saved (currently only for artificial cells in NEURON). Events in
+        transit (e.g. within the delays of connections) are not saved. State
+        variables holding absolute times (e.g. the end of a refractory
+        period) need to be annotated with the ABSOLUTE_TIME annotation (see
+        pype9.annotations) so they are shifted to the time of the kernel of
+        the restored simulation.
+
+        Parameters
+        ----------
+        path : str
+            The path to save the checkpoint to
+        """
+        self._check_checkpointable()
+        if self._stream is not None:
+            self._flush_recordings()
+        checkpoint = {
+            't': float(self._t.in_units(un.ms)),
+            'cells': [c._checkpoint() for c in self._registered_cells]}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=2)
+        os.rename(tmp_path, path)
+
+    def _check_checkpointable(self):
+        """
+        Checks that the simulation only contains stand-alone cells and that
+        the states of the random streams of random cells can be saved
+        """
+        if self._registered_arrays or self._registered_batches:
+            raise Pype9UsageError(
+                "Only simulations of stand-alone cells can be checkpointed "
+                "(not of arrays or batches of cells)")
+        unsaved = set(c.component_class.name for c in self._registered_cells
+                      if c.component_class.is_random and
+                      c._rng_state() is None)
+        if unsaved:
+            raise Pype9UsageError(
+                "The states of the random streams of '{}' cells can't be "
+                "saved in {} checkpoints, so restored simulations would not "
+                "reproduce them".format("', '".join(sorted(unsaved)),
+                                        self.name))
+
+    def restore(self, path):
+        """
+        Restores a simulation from a checkpoint saved by ``checkpoint``. Must
+        be called before any cells are created in the simulation, and the
+        same cells need to be created (in the same order), played into and
+        recorded from as in the checkpointed simulation. The saved states
+        are applied to the cells when the simulation starts running, and the
+        simulation resumes from the time of the checkpoint.
+
+        As the clock of the simulator kernel starts from zero, times of the
+        kernel are offset by the time of the checkpoint (see ``t_offset``).
+        Parts of the signals played into the cells before the checkpoint are
+        dropped.
+
+        Parameters
+        ----------
+        path : str
+            The path of the saved checkpoint
+        """
+        if self._running or self._registered_cells:
+            raise Pype9UsageError(
+                "Simulations can only be restored before any cells are "
+                "created")
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self._t = checkpoint['t'] * un.ms
+        self._t_offset = self._t
+        self._restored_cells = checkpoint['cells']
+
+    def reset(self, t_start=None, dynamics_seed=None):
+        """
+        Resets the simulation to the start of a new trial, keeping the cells,
+        arrays and connections that have been created (and the signals played
+        into them) in place, so that repeated trials don't need to construct
+        them again. The clock of the simulator is reset, the state variables
+        and regimes of the cells are reset to their initial values (when the
+        simulation is next run) and the recordings of the previous trial are
+        cleared, so they should be retrieved before the simulation is reset.
+        The initial states and regimes of batches of cells are reapplied in
+        the same way.
+        If recordings are streamed to disk, the recordings of each trial are
+        stored under new prefixes in the store.
+
+        Parameters
+        ----------
+        t_start : nineml.Quantity (time) | None
+            The time to start the new trial from. If None the start time of
+            the simulation is used
+        dynamics_seed : int | None
+            The seed the random dynamic processes are reseeded with, which
+            gives the same dynamics as a simulation constructed with it as its
+            'seed'. If None the processes aren't reseeded, i.e. NEST continues
+            its random streams whereas NEURON restarts them
+        """
+        if self.__class__._active is not self:
+            raise Pype9UsageError(
+                "Can only reset simulations while their context is active")
+        if t_start is None:
+            t_start = self._t_start
+        self._check_units('t_start', t_start, un.time)
+        if dynamics_seed is not None:
+            if dynamics_seed < 0 or dynamics_seed > self.max_seed:
+                raise Pype9UsageError(
+                    "Provided dynamics seed {} is out of range, must be "
+                    "between (0 and {})".format(dynamics_seed, self.max_seed))
+            logger.info("Reseeding dynamics of {} simulation with {}"
+                        .format(self.name, dynamics_seed))
+            self._set_dynamics_seeds(dynamics_seed)
+        if isinstance(self._stream, MemoryStore):
+            # The recordings of the previous trial are discarded
+            self._stream = None
+        elif self._stream is not None and self._running:
+            self._flush_recordings()
+        # The recordings of arrays are cleared before the kernel is reset so
+        # PyNN doesn't keep them as a separate segment
+        for array in self._registered_arrays:
+            array._reset()
+        self._reset(reseed=(dynamics_seed is not None))
+        self._t_start = t_start
+        self._t = t_start
+        self._t_offset = 0.0 * un.ms
+        self._restored_cells = None
+        self._running = False
+        for cell in self._registered_cells:
+            cell._reset()
+        for batch in self._registered_batches:
+            batch._reset()
+
+    @abstractmethod
+    def _reset(self, reseed):
+        """
+        Resets the clock and the dynamic state of the simulator kernel
+
+        Parameters
+        ----------
+        reseed : bool
+            Whether the random number generators of the kernel need to be
+            reseeded with the dynamics seeds
+        """
+
+    @property
+    def stream(self):
+        """
+        The store the recordings are streamed into (None if recordings are
+        not streamed). A MemoryStore if the recordings aren't streamed to
+        disk but are reduced during the simulation
+        """
+        return self._stream
+
+    def _flush_recordings(self):
+        for cell in self._registered_cells:
+            cell._flush_recordings(self._stream)
+
     @abstractmethod
     def _run(self, t_stop, **kwargs):  # @UnusedVariable
         """
@@ -271,8 +614,20 @@ class Simulation(with_metaclass(ABCMeta, object)):
         Just in time initialisations that are performed before the simulation
         starts running.
         """
+        if self._restored_cells is not None:
+            if len(self._restored_cells) != len(self._registered_cells):
+                raise Pype9UsageError(
+                    "Number of cells in restored simulation ({}) does not "
+                    "match the number in the checkpoint ({})".format(
+                        len(self._registered_cells),
+                        len(self._restored_cells)))
+            for cell, state in zip(self._registered_cells,
+                                   self._restored_cells):
+                cell._restore(state)
         for cell in self._registered_cells:
             cell.initialize()
+        for batch in self._registered_batches:
+            batch.initialize()
         # Array initialisation is handled by PyNN
 
     @abstractmethod
@@ -308,6 +663,15 @@ class Simulation(with_metaclass(ABCMeta, object)):
                 .format(cell_code_gen, self.code_generator))
         self._registered_arrays.append(array)
 
+    def register_batch(self, batch):
+        cell_code_gen = batch.cell_class.code_generator
+        if cell_code_gen != self.code_generator:
+            raise Pype9UsageError(
+                "Equivlent code generators must be provided to both the "
+                "CellMetaClass and Simulation objects ({} and {})"
+                .format(cell_code_gen, self.code_generator))
+        self._registered_batches.append(batch)
+
     @classmethod
     def active(cls):
         if cls._active is not None:
@@ -0,0 +1,174 @@
+"""
+Append-only stores that recordings are streamed into during long
+simulations, so the recorders of the simulator can be cleared after each
+chunk of the simulation is run.
+
+  Author: Thomas G. Close (tclose@oist.jp)
+  Copyright: 2012-2014 Thomas G. Close.
+  License: This file is part of the "NineLine" package, which is released under
+           the MIT Licence, see LICENSE for details.
+"""
+from builtins import object
+from builtins import range
+import os
+import json
+from collections import defaultdict
+import numpy
+from pype9.exceptions import Pype9UsageError
+
+
+class RecordingStore(object):
+    """
+    Stores each recording as a sequence of chunks saved in '.npy' files within
+    a directory of the store, i.e. '<path>/<prefix>/<key>/<chunk-index>.npy',
+    along with the sampling interval of the recording in a 'meta.json' file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory to save the store in. Must not exist or be
+        empty
+    """
+
+    CHUNK_FNAME = '{:08d}.npy'
+    META_FNAME = 'meta.json'
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            if os.listdir(path):
+                raise Pype9UsageError(
+                    "Directory to stream recordings into, '{}', is not "
+                    "empty".format(path))
+        else:
+            os.makedirs(path)
+        self._path = path
+        self._num_chunks = {}
+        self._intervals = {}
+        self._num_prefixes = defaultdict(int)
+
+    @property
+    def path(self):
+        return self._path
+
+    def new_prefix(self, name):
+        """
+        Returns a unique prefix for the recordings of an object in the store
+
+        Parameters
+        ----------
+        name : str
+            The name of the object (e.g. its component class)
+        """
+        prefix = '{}{}'.format(name, self._num_prefixes[name])
+        self._num_prefixes[name] += 1
+        return prefix
+
+    def __contains__(self, key):
+        return key in self._num_chunks
+
+    def keys(self, prefix=None):
+        """
+        The keys of the recordings in the store, optionally only those that
+        start with the given prefix (with the prefix stripped)
+        """
+        if prefix is None:
+            return list(self._num_chunks)
+        prefix += '/'
+        return [k[len(prefix):] for k in self._num_chunks
+                if k.startswith(prefix)]
+
+    def append(self, key, data, interval=None):
+        """
+        Appends data to a recording
+
+        Parameters
+        ----------
+        key : str
+            The key of the recording ('<prefix>/<port-name>')
+        data : numpy.ndarray
+            The recorded event times or analog samples to append
+        interval : float | None
+            The sampling interval of analog recordings, None for events
+        """
+        directory = self._directory(key)
+        try:
+            num_chunks = self._num_chunks[key]
+        except KeyError:
+            os.makedirs(directory)
+            with open(os.path.join(directory, self.META_FNAME), 'w') as f:
+                json.dump({'interval': interval}, f)
+            num_chunks = self._num_chunks[key] = 0
+            self._intervals[key] = interval
+        if len(data):
+            numpy.save(os.path.join(directory,
+                                    self.CHUNK_FNAME.format(num_chunks)),
+                       numpy.asarray(data))
+            self._num_chunks[key] = num_chunks + 1
+
+    def read(self, key):
+        """
+        Reads the chunks of a recording back into memory
+
+        Parameters
+        ----------
+        key : str
+            The key of the recording ('<prefix>/<port-name>')
+
+        Returns
+        -------
+        data : numpy.ndarray
+            The recorded event times or analog samples
+        interval : float | None
+            The sampling interval of analog recordings, None for events
+        """
+        directory = self._directory(key)
+        chunks = [numpy.load(os.path.join(directory,
+                                          self.CHUNK_FNAME.format(i)))
+                  for i in range(self._num_chunks[key])]
+        data = numpy.concatenate(chunks) if chunks else numpy.zeros(0)
+        return data, self._intervals[key]
+
+    def _directory(self, key):
+        return os.path.join(self._path, *key.split('/'))
+
+
+class MemoryStore(RecordingStore):
+    """
+    Keeps the chunks of each recording in memory instead of on disk. Used to
+    apply the reducers of recordings after each chunk of simulations that
+    aren't streamed to disk, so the full-resolution recordings aren't kept
+    in the recorders of the simulator for the whole simulation
+
+    Parameters
+    ----------
+    dtype : numpy.dtype | None
+        The dtype the chunks of analog recordings are kept in. If None they
+        are kept in double precision
+    """
+
+    def __init__(self, dtype=None):
+        self._path = None
+        self._dtype = dtype
+        self._chunks = {}
+        self._num_chunks = {}
+        self._intervals = {}
+        self._num_prefixes = defaultdict(int)
+
+    def append(self, key, data, interval=None):
+        if key not in self._chunks:
+            self._chunks[key] = []
+            self._num_chunks[key] = 0
+            self._intervals[key] = interval
+        if len(data):
+            self._chunks[key].append(numpy.array(
+                data, dtype=(self._dtype if (self._dtype is not None and
+                                             interval is not None)
+                             else float)))
+            self._num_chunks[key] += 1
+
+    def read(self, key):
+        chunks = self._chunks[key]
+        data = numpy.concatenate(chunks) if chunks else numpy.zeros(0)
+        # Keep the concatenated chunks so they aren't concatenated again
+        self._chunks[key] = [data] if len(data) else []
+        return data, self._intervals[key]
@@ -5,6 +5,12 @@ from builtins import next  # @IgnorePep8
 from builtins import zip  # @IgnorePep8
 from builtins import str  # @IgnorePep8
 from past.builtins import basestring  # @IgnorePep8
+import os  # @IgnorePep8
+import errno  # @IgnorePep8
+import atexit  # @IgnorePep8
+import tempfile  # @IgnorePep8
+import hashlib  # @IgnorePep8
+import pickle  # @IgnorePep8
 import operator  # @IgnorePep8
 from itertools import chain  # @IgnorePep8
 from operator import xor  # @IgnorePep8
@@ -17,6 +23,7 @@ import quantities as pq  # @IgnorePep8
 import diophantine  # @IgnorePep8
 from nineml import units as un  # @IgnorePep8
 from nineml.user.component import Quantity  # @IgnorePep8
+from nineml.values import ArrayValue  # @IgnorePep8
 from nineml.abstraction import Expression  # @IgnorePep8
 from nineml.abstraction.dynamics.visitors.queriers import (  # @IgnorePep8
     DynamicsDimensionResolver)
@@ -31,6 +38,30 @@ from future.utils import with_metaclass  # @IgnorePep8
 from pype9.utils.logging import logger  # @IgnorePep8
 numpy.seterr(all='raise')
 
+# Unit handler classes with projections that haven't been saved to their
+# cache files yet (see UnitHandler.save_cache)
+_unsaved_handlers = set()
+
+
+class ScaledExpression(Expression):
+    """
+    An expression returned by the scaling methods of a unit handler, which
+    memoises its C string representation in the unit handler so it is only
+    generated once for each scaled expression
+    """
+
+    def __init__(self, rhs, cstr_memo):
+        Expression.__init__(self, rhs)
+        self._cstr_memo = cstr_memo
+
+    @property
+    def rhs_cstr(self):
+        try:
+            cstr = self._cstr_memo[self.rhs]
+        except KeyError:
+            cstr = self._cstr_memo[self.rhs] = Expression.rhs_cstr.fget(self)
+        return cstr
+
 
 class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
     """
@@ -45,6 +76,16 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
 
     _CACHE_FILENAME = '.unit_handler_cache.pkl'
 
+    def __init__(self, component_class):
+        # Memos of flattened sub-expressions, scaled expressions and their C
+        # strings, which are shared between the templates and regimes that
+        # request them (need to be created before the dimensions of the
+        # component class are resolved in the base class)
+        self._flatten_memo = {}
+        self._scaled_memo = {}
+        self._cstr_memo = {}
+        super(UnitHandler, self).__init__(component_class)
+
     def assign_units_to_alias(self, alias):
         dims = self._flatten(sympify(alias))[1]
         units = self.dimension_to_units_compound(dims)[1]
@@ -98,18 +139,20 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
             yield param, self.assign_units_to_variable(param)
 
     def scale_expr(self, expr):
-        scaled, dims = self._flatten(sympify(expr))
-        units_str = self._units_for_code_gen(
-            self.dimension_to_units_compound(dims)[1])
-        return Expression(scaled), units_str
+        expr = sympify(expr)
+        try:
+            scaled, units_str = self._scaled_memo[expr]
+        except KeyError:
+            scaled, dims = self._flatten(expr)
+            units_str = self._units_for_code_gen(
+                self.dimension_to_units_compound(dims)[1])
+            self._scaled_memo[expr] = scaled, units_str
+        return ScaledExpression(scaled, self._cstr_memo), units_str
 
     def scale_alias(self, element):
         if isinstance(element, basestring):
             element = self.component_class.element(element)
-        scaled, dims = self._flatten(sympify(element.rhs))
-        units_str = self._units_for_code_gen(
-            self.dimension_to_units_compound(dims)[1])
-        return Expression(scaled), units_str
+        return self.scale_expr(element.rhs)
 
     def scale_aliases(self, elements):
         for elem in elements:
@@ -123,6 +166,16 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         """
         if isinstance(element, basestring):
             element = self.component_class[element]
+        key = (element.variable, element.rhs)
+        try:
+            expr, units_str = self._scaled_memo[key]
+        except KeyError:
+            expr, units_str = self._scaled_memo[key] = (
+                self._scale_time_derivative_rhs(element))
+        return ScaledExpression(expr, self._cstr_memo), units_str
+
+    def _scale_time_derivative_rhs(self, element):
+        "Scales the RHS of the time derivative (see scale_time_derivative)"
         expr, dims = self._flatten(sympify(element.rhs))
         state_var_dims = self.component_class.state_variable(
             element.variable).dimension
@@ -143,7 +196,7 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         # Scale expression to match target expression
         expr = 10 ** scale * expr
         units_str = self._units_for_code_gen(compound)
-        return Expression(expr), units_str
+        return expr, units_str
 
     def scale_time_derivatives(self, elements):
         for elem in elements:
@@ -178,54 +231,123 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         """
         if dimension == 1 or dimension == un.dimensionless:
             return 0, []
+        memo = cls._get_class_dict('_compound_memo')
+        # Sympy dimensions are memoised separately to avoid converting them
+        # to nineml.Dimension objects on every call
         if isinstance(dimension, sympy.Basic):
-            dimension = un.Dimension.from_sympy(dimension)
-        else:
-            assert isinstance(dimension, un.Dimension), (
-                "'{}' is not a Dimension".format(dimension))
+            try:
+                exponent, compound = memo[dimension]
+            except KeyError:
+                exponent, compound = cls.dimension_to_units_compound(
+                    un.Dimension.from_sympy(dimension))
+                memo[dimension] = exponent, compound
+            return exponent, list(compound)
+        assert isinstance(dimension, un.Dimension), (
+            "'{}' is not a Dimension".format(dimension))
+        dim_tuple = tuple(dimension)
+        try:
+            exponent, compound = memo[dim_tuple]
+            return exponent, list(compound)
+        except KeyError:
+            pass
         # Check to see if unit dimension, or some integer power thereof,
         # has been stored in the cache (the basis and compounds are preloaded)
-        dim_vector = array(list(dimension), dtype='float')
-        # mask of units in compound
-        mask = (dim_vector != 0)
-        # Get the coefficients required to transform the basis dim elements
-        # into the provided dimension, and test to see if they are constant
-        with_scalars = [(x, numpy.unique(dim_vector[mask] /
-                                         numpy.asarray(d)[mask]))
-                        for d, x in cls.cache.items()
-                        if ((numpy.asarray(d) != 0) == mask).all()]
-        matches = [(u, int(s[0])) for u, s in with_scalars
-                   if len(s) == 1 and float(s[0]).is_integer()]
-        assert len(matches) <= 1, (
-            "There should not be matches for multiple basis/compound units, "
-            "the dimension vector of one must be a factor of an another")
+        key, scalar = cls._normalise_dimension(dim_tuple)
+        try:
+            base_x = next(x * (scalar // s)
+                          for s, x in cls._get_cache_index().get(key, [])
+                          if scalar % s == 0)
+        except StopIteration:
+            base_x = None
         # If there is a match and the scalar is an integer then use that unit
         # basis/compound.
-        if matches and float(matches[0][1]).is_integer():
-            base_x, scalar = matches[0]
-            scalar = int(scalar)
+        if base_x is not None:
             num_compounds = len(nonzero(base_x[len(cls.basis):])[0])
             assert num_compounds <= 1, (
                 "Multiple compound indices matched (x={})".format(base_x))
             assert xor(base_x[:len(cls.basis)].any(), num_compounds != 0), (
                 "Mix of basis vectors and compounds (x={})".format(base_x))
-            x = base_x * scalar
+            x = base_x
         # If there is not a direct relationship to a basis vector or special
         # compound, project the dimension onto the basis vectors, finding
         # the "minimal" solution (see _select_best_compound)
         else:
             # Get projection of dimension onto basis units
-            b = array(list(dimension))
+            b = array(dim_tuple)
             xs = diophantine.solve(cls.A, b)
             min_x = cls._select_best_compound(xs)
             x = numpy.concatenate((min_x, numpy.zeros(len(cls.compounds),
                                                       dtype='int')))
-            cls.cache[tuple(dimension)] = x / int(abs(reduce(gcd, x)))
+            x_gcd = int(abs(reduce(gcd, x)))
+            cls._add_to_cache(tuple(d // x_gcd for d in dim_tuple),
+                              x // x_gcd)
+            # Saved in one go after code generation (or at exit) instead of
+            # rewriting the cache file for every new projection
+            _unsaved_handlers.add(cls)
         # Get list of compound units with the powers
-        compound = [(u, p) for u, p in zip(cls.specified_units, x) if p]
+        compound = [(u, int(p)) for u, p in zip(cls.specified_units, x) if p]
         # Calculate the appropriate scale for the new compound quantity
         exponent = int(x.dot([b.power for b in cls.specified_units]))
-        return exponent, compound
+        memo[dim_tuple] = exponent, compound
+        return exponent, list(compound)
+
+    @classmethod
+    def _normalise_dimension(cls, dim_tuple):
+        """
+        Divides a dimension vector by the GCD of its elements, signed so that
+        its first non-zero element is positive, so that all integer powers of
+        a dimension share the same normalised vector
+
+        Returns
+        -------
+        normalised : tuple(int)
+            The normalised dimension vector
+        scalar : int
+            The (signed) GCD the dimension vector was divided by
+        """
+        scalar = int(abs(reduce(gcd, dim_tuple)))
+        if next(d for d in dim_tuple if d) < 0:
+            scalar = -scalar
+        return tuple(d // scalar for d in dim_tuple), scalar
+
+    @classmethod
+    def _get_class_dict(cls, name):
+        """
+        Returns a dictionary stored in the class's own namespace (i.e. not
+        inherited from a base unit handler), creating it if required
+        """
+        try:
+            return cls.__dict__[name]
+        except KeyError:
+            setattr(cls, name, {})
+            return cls.__dict__[name]
+
+    @classmethod
+    def _get_cache_index(cls):
+        """
+        Returns the index of the cached projections, which maps normalised
+        dimension vectors (see _normalise_dimension) onto a list of the
+        scalars of the cached dimensions that share them, and their
+        projections
+        """
+        index = cls._get_class_dict('_cache_index')
+        if not index:
+            for dim_tuple, x in cls.cache.items():
+                key, scalar = cls._normalise_dimension(dim_tuple)
+                index.setdefault(key, []).append(
+                    (scalar, numpy.asarray(x, dtype='int')))
+        return index
+
+    @classmethod
+    def _add_to_cache(cls, dim_tuple, x):
+        """
+        Adds a projection to the cache and its index
+        """
+        index = cls._get_cache_index()
+        cls.cache[dim_tuple] = x
+        key, scalar = cls._normalise_dimension(dim_tuple)
+        index.setdefault(key, []).append((scalar,
+                                          numpy.asarray(x, dtype='int')))
 
     @classmethod
     def dimension_to_units(cls, dimension):
@@ -277,12 +399,7 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
     def scale_value(cls, qty):
         if isinstance(qty, pq.Quantity):
             value = numpy.asarray(qty)
-            # Get the first or only value of the quantity
-            try:
-                elem = qty[0]
-            except IndexError:
-                elem = qty
-            units = cls.from_pq_quantity(elem).units
+            units = cls.pq_units_to_nineml(qty.units)
         else:
             try:
                 units = qty.units
@@ -303,6 +420,46 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         scaled = value * cls.scalar(units)
         return scaled
 
+    @classmethod
+    def scale_values(cls, values, units=None):
+        """
+        Scales an array of values into the units used by the simulator, with
+        a single unit resolution and multiplication for the whole array
+
+        Parameters
+        ----------
+        values : quantities.Quantity | nineml.Quantity | numpy.ndarray
+            The values to scale, either a python-quantities array, a
+            nineml.Quantity with an ArrayValue or SingleValue, or an array of
+            plain values, in which case 'units' must be provided
+        units : nineml.Unit | None
+            The units of the values if they are provided as a plain array
+
+        Returns
+        -------
+        scaled : numpy.ndarray
+            The scaled values
+        """
+        if isinstance(values, pq.Quantity):
+            units = cls.pq_units_to_nineml(values.units)
+            values = numpy.asarray(values, dtype=float)
+        elif isinstance(values, Quantity):
+            units = values.units
+            if values.value.nineml_type == 'ArrayValue':
+                values = numpy.asarray(values.value.values, dtype=float)
+            elif values.value.nineml_type == 'SingleValue':
+                values = numpy.asarray(float(values.value))
+            else:
+                raise Pype9RuntimeError(
+                    "Cannot scale values of {}, only ArrayValue and "
+                    "SingleValue quantities can be scaled".format(values))
+        elif units is None:
+            raise Pype9RuntimeError(
+                "Units need to be provided to scale a plain array of values")
+        else:
+            values = numpy.asarray(values, dtype=float)
+        return values * cls.scalar(units)
+
     @classmethod
     def scalar(cls, units):
         exponent, _ = cls.dimension_to_units_compound(units.dimension)
@@ -321,6 +478,22 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         units_str = cls.compound_to_units_str(compound)
         return pq.Quantity(10 ** scale * float(qty.value), units_str)
 
+    @classmethod
+    def to_pq_quantities(cls, qty):
+        """
+        Converts a nineml.Quantity with an ArrayValue (or SingleValue) into a
+        python-quantities array in the units used by the simulator
+        """
+        exponent, compound = cls.dimension_to_units_compound(
+            qty.units.dimension)
+        scale = qty.units.power - exponent
+        units_str = cls.compound_to_units_str(compound)
+        if qty.value.nineml_type == 'ArrayValue':
+            values = numpy.asarray(qty.value.values, dtype=float)
+        else:
+            values = numpy.asarray(float(qty.value))
+        return pq.Quantity(10 ** scale * values, units_str)
+
     @classmethod
     def from_pq_quantity(cls, qty):
         if isinstance(qty, Quantity):
@@ -328,17 +501,7 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         elif isinstance(qty, (int, float)):
             units = un.unitless
         elif isinstance(qty, pq.Quantity):
-            unit_name = str(qty.units).split()[1].replace(
-                '/', '_per_').replace('**', '').replace('*', '_').replace(
-                    '(', '').replace(')', '')
-            if unit_name.startswith('_per_'):
-                unit_name = unit_name[1:]  # strip leading underscore
-            powers = dict(
-                (cls._pq_si_to_dim[type(u)], p)
-                for u, p in qty.units.simplified._dimensionality.items())
-            dimension = un.Dimension(unit_name + 'Dimension', **powers)
-            units = un.Unit(unit_name, dimension=dimension,
-                            power=int(log10(float(qty.units.simplified))))
+            units = cls.pq_units_to_nineml(qty.units)
         else:
             raise Pype9RuntimeError(
                 "Cannot '{}' to nineml.Quantity (can only convert "
@@ -346,6 +509,42 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
                 .format(qty))
         return Quantity(float(qty), units)
 
+    @classmethod
+    def from_pq_quantities(cls, qty):
+        """
+        Converts a python-quantities array into a nineml.Quantity with an
+        ArrayValue
+        """
+        return Quantity(ArrayValue(numpy.asarray(qty, dtype=float).ravel()),
+                        cls.pq_units_to_nineml(qty.units))
+
+    @classmethod
+    def pq_units_to_nineml(cls, pq_units):
+        """
+        Resolves python-quantities units into the equivalent nineml.Unit.
+        Resolutions are cached by the signature of the units as they are
+        relatively expensive.
+        """
+        memo = cls._get_class_dict('_pq_units_memo')
+        signature = pq_units.dimensionality.string
+        try:
+            return memo[signature]
+        except KeyError:
+            pass
+        unit_name = signature.replace(
+            '/', '_per_').replace('**', '').replace('*', '_').replace(
+                '(', '').replace(')', '')
+        if unit_name.startswith('_per_'):
+            unit_name = unit_name[1:]  # strip leading underscore
+        powers = dict(
+            (cls._pq_si_to_dim[type(u)], p)
+            for u, p in pq_units.simplified._dimensionality.items())
+        dimension = un.Dimension(unit_name + 'Dimension', **powers)
+        units = memo[signature] = un.Unit(
+            unit_name, dimension=dimension,
+            power=int(log10(float(pq_units.simplified))))
+        return units
+
     @classmethod
     def _init_matrices_and_cache(cls, basis, compounds):
         """
@@ -360,6 +559,8 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         cls._A = array([list(b.dimension) for b in basis]).T
         logger.info("Initialising unit conversion cache")
         cls._cache = cls._init_cache(basis, compounds)
+        # Add the projections calculated by previous processes
+        cls._cache.update(cls._load_cache(basis, compounds))
 
         # The lengths in terms of SI dimension bases of each of the unit
         # basis compounds.
@@ -384,6 +585,83 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
             cache[tuple(unit.dimension)] = x
         return cache
 
+    @classmethod
+    def _cache_path(cls, basis, compounds):
+        """
+        The path of the file the cache of unit projections is saved to, which
+        is specific to the basis and compound units (the build root it is
+        saved in is specific to the PyPe9 version)
+        """
+        # Imported here to avoid importing code generation modules when
+        # importing unit handlers
+        from pype9.simulate.common.code_gen import BASE_BUILD_DIR
+        signature = repr([(u.name, tuple(u.dimension), u.power)
+                          for u in chain(basis, compounds)])
+        digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+        name, ext = os.path.splitext(cls._CACHE_FILENAME)
+        return os.path.join(BASE_BUILD_DIR, '{}_{}{}'.format(name, digest,
+                                                               ext))
+
+    @classmethod
+    def _load_cache(cls, basis, compounds):
+        """
+        Loads the unit projections saved by previous processes. If the cache
+        file is missing or can't be read an empty dictionary is returned.
+        """
+        path = cls._cache_path(basis, compounds)
+        try:
+            with open(path, 'rb') as f:
+                cache = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError) as e:
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                logger.warning("Could not load unit conversion cache from "
+                               "'{}' ({}), ignoring".format(path, e))
+            return {}
+        num_units = len(basis) + len(compounds)
+        return dict((d, x) for d, x in cache.items() if len(x) == num_units)
+
+    @classmethod
+    def save_cache(cls):
+        """
+        Saves the unit projections to file if any have been added since they
+        were last saved
+        """
+        if cls in _unsaved_handlers:
+            _unsaved_handlers.discard(cls)
+            cls._save_cache()
+
+    @classmethod
+    def _save_cache(cls):
+        """
+        Saves the unit projections to file so they don't need to be
+        recalculated by subsequent processes. The cache file is updated
+        atomically (by renaming a temporary file over it), after merging in
+        the projections saved by other processes in the meantime, so it is
+        never left partially written.
+        """
+        path = cls._cache_path(cls.basis, cls.compounds)
+        cache = cls._load_cache(cls.basis, cls.compounds)
+        cache.update(cls.cache)
+        try:
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(cache, f, protocol=2)
+                os.rename(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        except (IOError, OSError) as e:
+            logger.warning("Could not save unit conversion cache to '{}' "
+                           "({})".format(path, e))
+
     @classmethod
     def clear_cache(cls):
         """
@@ -392,6 +670,8 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         """
         # Create a new cache with the specified units entered into it
         cls.cache = cls._init_cache(cls.basis, cls.compounds)
+        cls._get_class_dict('_cache_index').clear()
+        cls._get_class_dict('_compound_memo').clear()
 
     @classmethod
     def _select_best_compound(cls, xs):
@@ -444,6 +724,17 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
     # sub expressions where it is required (i.e. when there is a change of
     # units and the new units power is different)
 
+    def _flatten(self, expr, **kwargs):
+        expr = sympify(expr)
+        if kwargs:
+            return super(UnitHandler, self)._flatten(expr, **kwargs)
+        try:
+            flattened = self._flatten_memo[expr]
+        except KeyError:
+            flattened = self._flatten_memo[expr] = super(
+                UnitHandler, self)._flatten(expr)
+        return flattened
+
     def _flatten_symbol(self, sym, **kwargs):  # @UnusedVariable
         try:
             dims = self._dims[sym]
@@ -498,3 +789,13 @@ class UnitHandler(with_metaclass(ABCMeta, DynamicsDimensionResolver)):
         base, exponent = expr.args
         scaled_base, dims = self._flatten(base)
         return scaled_base ** exponent, dims ** exponent
+
+
+@atexit.register
+def _save_unsaved_caches():
+    """
+    Saves the projections calculated outside of code generation (e.g. when
+    cell classes are loaded) at exit
+    """
+    for handler in list(_unsaved_handlers):
+        handler.save_cache()
@@ -8,6 +8,7 @@
            the MIT Licence, see LICENSE for details.
 """
 from __future__ import absolute_import
+from itertools import chain
 import numpy
 import neo
 import nest
@@ -15,12 +16,11 @@ import quantities as pq
 from nineml.exceptions import NineMLNameError
 from nineml import units as un
 from ..code_gen import CodeGenerator
-from pype9.simulate.nest.simulation import Simulation
+from pype9.simulate.nest.simulation import Simulation, SharedMultimeter
 from pype9.simulate.common.cells import base
 from pype9.annotations import PYPE9_NS, MEMBRANE_VOLTAGE, BUILD_TRANS
 from pype9.exceptions import (
     Pype9UsageError, Pype9Unsupported9MLException)
-from pype9.utils.logging import logger
 
 basic_nineml_translations = {
     'Voltage': 'V_m', 'Diameter': 'diam', 'Length': 'L'}
@@ -43,15 +43,30 @@ class Cell(base.Cell):
     def _set(self, varname, value):
         nest.SetStatus(self._cell, varname, value)
 
+    def _get_multiple(self, varnames):
+        if not varnames:
+            return []
+        return nest.GetStatus(self._cell, keys=list(varnames))[0]
+
+    def _set_multiple(self, values):
+        if values:
+            nest.SetStatus(self._cell, values)
+
     def _set_regime(self):
         nest.SetStatus(self._cell, self.code_generator.REGIME_VARNAME,
                        self._regime_index)
 
-    def record(self, port_name, interval=None, **kwargs):  # @UnusedVariable @IgnorePep8
+    def _current_regime_index(self):
+        # The name of the current regime is returned by the NEST model
+        return self.regime_index(
+            self._get(self.code_generator.REGIME_VARNAME))
+
+    def record(self, port_name, interval=None, reducer=None, **kwargs):  # @UnusedVariable @IgnorePep8
         # Create dictionaries for storing local recordings. These are not
         # created initially to save memory if recordings are not required or
         # handled externally
         self._initialize_local_recording()
+        self._set_reducer(port_name, reducer)
         try:
             port = self.component_class.send_port(port_name)
         except NineMLNameError:
@@ -70,30 +85,24 @@ class Cell(base.Cell):
                 "spike_detector", params={"precise_times": True})
             nest.Connect(self._cell, recorder)
         else:
+            sim = Simulation.active()
             if interval is None:
-                interval = Simulation.active().dt
+                interval = sim.dt
             interval = float(interval.in_units(un.ms))
-            variable_name = self.build_name(port_name)
-            self._recorders[port_name] = recorder = nest.Create(
-                'multimeter', 1, {"interval": interval})
-            nest.SetStatus(recorder, {'record_from': [variable_name]})
-            nest.Connect(
-                recorder, self._cell,
-                syn_spec={'delay': self.device_delay_ms})
+            # Analog recordings are made by multimeters shared between all
+            # cells of the same class recorded at the same interval
+            self._recorders[port_name] = sim.multimeter(
+                self.__class__.name, interval).add(self._cell[0],
+                                                   self.build_name(port_name))
 
-    def record_regime(self, interval=None):
+    def record_regime(self):
         self._initialize_local_recording()
-        if interval is None:
-            interval = Simulation.active().dt
-        interval = float(interval.in_units(un.ms))
-        self._recorders[
-            self.code_generator.REGIME_VARNAME] = recorder = nest.Create(
-            'multimeter', 1, {"interval": interval})
-        nest.SetStatus(recorder,
-                       {'record_from': [self.code_generator.REGIME_VARNAME]})
-        nest.Connect(
-            recorder, self._cell,
-            syn_spec={'delay': self.device_delay_ms})
+        # Transitions are logged by the cell itself (instead of sampling the
+        # regime with a multimeter), with the log held in place of a recorder
+        self._recorders[self.code_generator.REGIME_VARNAME] = None
+        nest.SetStatus(self._cell, {
+            self.code_generator.LOG_REGIMES_VARNAME: True,
+            self.code_generator.REGIME_LOG_VARNAME: []})
 
     def recording(self, port_name, t_start=None):
         """
@@ -115,50 +124,72 @@ class Cell(base.Cell):
         t_start = pq.Quantity(t_start, 'ms')
         t_stop = self.unit_handler.to_pq_quantity(t_stop)
         if port.nineml_type in ('EventSendPort', 'EventSendPortExposure'):
-            spikes = nest.GetStatus(
-                self._recorders[port_name], 'events')[0]['times']
+            spikes, _ = self._recorded(port_name)
             data = neo.SpikeTrain(
                 self._trim_spike_train(spikes * pq.ms, t_start),
                 t_start=t_start, t_stop=t_stop, name=port_name)
         else:
-            port_name = self.build_name(port_name)
-            events, interval = nest.GetStatus(self._recorders[port_name],
-                                              ('events', 'interval'))[0]
-            try:
-                port = self._nineml.component_class.port(port_name)
-            except NineMLNameError:
-                port = self._nineml.component_class.state_variable(port_name)
-            unit_str = self.unit_handler.dimension_to_unit_str(
-                port.dimension, one_as_dimensionless=True)
-            variable_name = self.build_name(port_name)
-            signal = self._trim_analog_signal(events[variable_name],
-                                              t_start, interval * pq.ms)
+            signal, interval = self._recorded(port_name)
+            unit_str = self._recording_units(
+                port_name, self.unit_handler.dimension_to_unit_str(
+                    port.dimension, one_as_dimensionless=True))
+            signal = self._trim_analog_signal(signal, t_start,
+                                              interval * pq.ms)
             data = neo.AnalogSignal(
                 signal, sampling_period=interval * pq.ms,
                 t_start=t_start, units=unit_str, name=port_name)
         return data
 
-    def _regime_recording(self):
-        events, interval = nest.GetStatus(
-            self._recorders[self.code_generator.REGIME_VARNAME],
-            ('events', 'interval'))[0]
-        return neo.AnalogSignal(
-            events[self.code_generator.REGIME_VARNAME],
-            sampling_period=interval * pq.ms, units='dimensionless',
-            t_start=self.unit_handler.to_pq_quantity(self._t_start),
-            name=self.code_generator.REGIME_VARNAME)
-
-    def build_name(self, varname):
+    def _recorder_keys(self):
+        return list(self._recorders)
+
+    def _read_recorder(self, key):
+        recorder = self._recorders[key]
+        if key == self.code_generator.REGIME_VARNAME:
+            return (numpy.asarray(nest.GetStatus(
+                self._cell, self.code_generator.REGIME_LOG_VARNAME)[0],
+                dtype=float), None)
+        if (key in self.component_class.send_port_names and
+                self.component_class.send_port(key).communicates == 'event'):
+            return (numpy.asarray(
+                nest.GetStatus(recorder, 'events')[0]['times']), None)
+        return (recorder.read(self._cell[0], self.build_name(key)),
+                recorder.interval)
+
+    def _free_recorders(self):
+        # Recording devices can't be deleted from the NEST kernel so their
+        # recorded events are cleared instead
+        self.reset_recordings()
+        if self.code_generator.REGIME_VARNAME in self._recorders:
+            nest.SetStatus(self._cell,
+                           self.code_generator.LOG_REGIMES_VARNAME, False)
+        super(Cell, self)._free_recorders()
+
+    @classmethod
+    def build_name(cls, varname):
         # Get mapped port name if port corresponds to membrane voltage
-        if varname == self.component_class.annotations.get(
+        if varname == cls.component_class.annotations.get(
                 (BUILD_TRANS, PYPE9_NS), MEMBRANE_VOLTAGE, default=None):
-            varname = self.build_component_class.annotations.get(
+            varname = cls.build_component_class.annotations.get(
                 (BUILD_TRANS, PYPE9_NS), MEMBRANE_VOLTAGE)
         return varname
 
     def reset_recordings(self):
-        logger.warning("Haven't worked out how to implement reset recordings "
-                       "for NEST yet")
+        """
+        Clears the events recorded by the recording devices of the cell
+        """
+        if self._recorders:
+            detectors = []
+            for recorder in self._recorders.values():
+                if isinstance(recorder, SharedMultimeter):
+                    recorder.clear(self._cell[0])
+                elif recorder is not None:
+                    detectors.extend(recorder)
+            if detectors:
+                nest.SetStatus(detectors, 'n_events', 0)
+            if self.code_generator.REGIME_VARNAME in self._recorders:
+                nest.SetStatus(self._cell,
+                               self.code_generator.REGIME_LOG_VARNAME, [])
 
     def play(self, port_name, signal, properties=[]):
         """
@@ -174,6 +205,9 @@ class Cell(base.Cell):
             The connection properties of the event port
         """
         port = self.component_class.receive_port(port_name)
+        signal = self._kernel_signal(signal, t_min=self.device_delay_ms)
+        if signal is None:
+            return
         if port.nineml_type in ('EventReceivePort',
                                 'EventReceivePortExposure'):
             # Shift the signal times to account for the minimum delay and
@@ -300,9 +334,173 @@ class Cell(base.Cell):
         return Simulation.active().device_delay_ms
 
 
+class CellBatch(base.CellBatch):
+    """
+    A batch of instances of a NEST cell class, which are created with a single
+    call to nest.Create and set and recorded with single calls to
+    nest.SetStatus and shared recording devices
+    """
+
+    # The shared recording devices are not streamed
+    STREAMS_RECORDINGS = False
+
+    def _create(self, columns):
+        self._cells = nest.Create(self._cell_class.name, self._size)
+        accessors = self._cell_class._accessors
+        names = list(columns)
+        if names:
+            nest.SetStatus(self._cells, [
+                dict((accessors[n].accessor, float(columns[n][i]))
+                     for n in names) for i in range(self._size)])
+        # The initial states are kept so they can be set again when the
+        # simulation is reset
+        self._initial_states = dict(
+            (accessors[n].accessor, [float(v) for v in columns[n]])
+            for n in names if accessors[n].is_state)
+        self._set_initial_states()
+        self._reset_states = False
+        self._recorders = {}
+        self._cache = None
+
+    def _set_initial_states(self):
+        for accessor, values in self._initial_states.items():
+            nest.SetStatus(self._cells, accessor, values)
+        nest.SetStatus(self._cells,
+                       self._cell_class.code_generator.REGIME_VARNAME,
+                       self._regime_index)
+
+    def initialize(self):
+        """
+        Sets the initial states and regime of the instances again if the
+        simulation has been reset (as NEST resets the nodes to the defaults
+        of their model)
+        """
+        if self._reset_states:
+            self._set_initial_states()
+            self._reset_states = False
+
+    def _reset(self):
+        super(CellBatch, self)._reset()
+        if self._recorders:
+            nest.SetStatus(list(chain(*self._recorders.values())),
+                           'n_events', 0)
+        self._reset_states = True
+
+    @property
+    def cells(self):
+        """
+        The NEST node IDs of the instances in the batch
+        """
+        return self._cells
+
+    def _get_column(self, accessor):
+        return numpy.asarray(nest.GetStatus(self._cells, accessor),
+                             dtype=float)
+
+    def _set_column(self, var, values):
+        values = [float(v) for v in values]
+        nest.SetStatus(self._cells, var.accessor, values)
+        if var.is_state:
+            self._initial_states[var.accessor] = values
+
+    def _port(self, port_name):
+        component_class = self._cell_class.component_class
+        try:
+            return component_class.send_port(port_name)
+        except NineMLNameError:
+            return component_class.state_variable(port_name)
+
+    def record(self, port_name, interval=None):
+        """
+        Records a send port or state variable of every instance during the
+        simulation with a single recording device
+
+        Parameters
+        ----------
+        port_name : str
+            Name of the send port or state variable to record
+        interval : nineml.Quantity (time) | None
+            The sampling interval of analog recordings. If None the
+            recording is sampled at every time step
+        """
+        port = self._port(port_name)
+        if port.nineml_type in ('EventSendPort', 'EventSendPortExposure'):
+            self._recorders[port_name] = recorder = nest.Create(
+                "spike_detector", params={"precise_times": True})
+            nest.Connect(self._cells, recorder)
+        else:
+            sim = Simulation.active()
+            if interval is None:
+                interval = sim.dt
+            interval = float(interval.in_units(un.ms))
+            self._recorders[port_name] = recorder = nest.Create(
+                'multimeter', 1, {
+                    "interval": interval,
+                    'record_from': [self._cell_class.build_name(port_name)]})
+            nest.Connect(recorder, self._cells,
+                         syn_spec={'delay': sim.device_delay_ms})
+
+    def _events(self, port_name):
+        """
+        Returns the recorded events sorted by instance and time along with the
+        index of the instance each event belongs to
+        """
+        if self._cache is not None:
+            events = self._cache[port_name]
+        else:
+            events = nest.GetStatus(self._recorders[port_name], 'events')[0]
+        indices = numpy.asarray(events['senders']) - self._cells[0]
+        times = numpy.asarray(events['times'])
+        order = numpy.lexsort((times, indices))
+        return events, indices[order], times[order], order
+
+    def recording(self, port_name):
+        port = self._port(port_name)
+        events, indices, times, order = self._events(port_name)
+        if port.nineml_type in ('EventSendPort', 'EventSendPortExposure'):
+            if self.is_dead():
+                t_stop = self._t_stop
+            else:
+                t_stop = Simulation.active().t
+            t_start = self._cell_class.unit_handler.to_pq_quantity(
+                self._t_start)
+            t_stop = self._cell_class.unit_handler.to_pq_quantity(t_stop)
+            return [neo.SpikeTrain(times[indices == i] * pq.ms,
+                                   t_start=t_start, t_stop=t_stop,
+                                   name=port_name)
+                    for i in range(self._size)]
+        unit_str = self._cell_class.unit_handler.dimension_to_unit_str(
+            port.dimension, one_as_dimensionless=True)
+        values = numpy.asarray(
+            events[self._cell_class.build_name(port_name)])[order]
+        return pq.Quantity(values.reshape((self._size, -1)), unit_str)
+
+    def recording_times(self, port_name):
+        _, indices, times, _ = self._events(port_name)
+        return times[indices == 0] * pq.ms
+
+    def _kill(self, t_stop, dtype=None):
+        cache = {}
+        for port_name, recorder in self._recorders.items():
+            events = nest.GetStatus(recorder, 'events')[0]
+            build_name = self._cell_class.build_name(port_name)
+            cache[port_name] = dict(
+                (k, numpy.array(v, dtype=(
+                    dtype if dtype is not None and k == build_name
+                    else None)))
+                for k, v in events.items())
+        if self._recorders:
+            nest.SetStatus(list(chain(*self._recorders.values())),
+                           'n_events', 0)
+        self._cache = cache
+        self._recorders = {}
+        super(CellBatch, self)._kill(t_stop)
+
+
 class CellMetaClass(base.CellMetaClass):
 
     _built_types = {}  # Stores previously created types for reuse
     CodeGenerator = CodeGenerator
     BaseCellClass = Cell
+    BatchClass = CellBatch
     Simulation = Simulation
@@ -18,10 +18,12 @@ import shutil
 from datetime import datetime
 import errno
 import nest
+import nineml.units as un
 from pype9.simulate.nest.units import UnitHandler
 from pype9.simulate.common.code_gen import BaseCodeGenerator
 from pype9.utils.paths import remove_ignore_missing, add_lib_path
 from pype9.exceptions import Pype9BuildError
+from pype9.annotations import PYPE9_NS, BUILD_PROPS
 import pype9
 from pype9.utils.logging import logger
 
@@ -34,6 +36,8 @@ class CodeGenerator(BaseCodeGenerator):
     SIMULATOR_VERSION = nest.version().split()[1]
     ODE_SOLVER_DEFAULT = 'gsl'
     REGIME_VARNAME = '__regime__'
+    REGIME_LOG_VARNAME = '__regime_log__'
+    LOG_REGIMES_VARNAME = '__log_regimes__'
     SS_SOLVER_DEFAULT = None
     MAX_STEP_SIZE_DEFAULT = 0.01  # Used for CVODE/IDA, FIXME: not sure best value!!! @IgnorePep8
     ABS_TOLERANCE_DEFAULT = 1e-3
@@ -87,7 +91,15 @@ class CodeGenerator(BaseCodeGenerator):
             'parameter_scales': [],
             'v_threshold': kwargs.get('v_threshold', self.V_THRESHOLD_DEFAULT),
             'regime_varname': self.REGIME_VARNAME,
-            'debug_print': [] if debug_print is None else debug_print}
+            'regime_log_varname': self.REGIME_LOG_VARNAME,
+            'log_regimes_varname': self.LOG_REGIMES_VARNAME,
+            # NB: Annotation values are read back from file as strings
+            'archive_spikes': str(component_class.annotations.get(
+                (BUILD_PROPS, PYPE9_NS), 'archive_spikes',
+                default=True)) == 'True',
+            'debug_print': [] if debug_print is None else debug_print,
+            'tabulation': self.tabulation(component_class)}
+        self._check_tabulation(component_class, **kwargs)
         ode_solver = kwargs.get('ode_solver', self.ODE_SOLVER_DEFAULT)
         ss_solver = kwargs.get('ss_solver', self.SS_SOLVER_DEFAULT)
         if ode_solver is None:
@@ -111,8 +123,74 @@ class CodeGenerator(BaseCodeGenerator):
                              name + 'Module-init.sli',
                              path.join(src_dir, 'sli'))
 
+    def transform_for_build(self, name, component_class,
+                            archive_spikes=None, tabulate=False,
+                            membrane_voltage=None, **kwargs):
+        """
+        Copies the component class and determines whether the generated node
+        needs to archive its spike history
+
+        Parameters
+        ----------
+        name : str
+            The name of the transformed component class
+        component_class : nineml.Dynamics
+            The component class to be transformed
+        archive_spikes : bool | None
+            Whether the generated node derives from nest::Archiving_Node,
+            which keeps the spike history read by plastic synapses (e.g.
+            STDP), or the lighter nest::Node. If None, the history is only
+            archived if the component class has synapses that can't be
+            flattened into the cell dynamics (i.e. non-linear synapses, which
+            include plastic ones).
+        tabulate : bool
+            Whether to generate lookup tables (linearly interpolated over the
+            range set by the 'table_v_min', 'table_v_max' and 'table_v_step'
+            build options) for aliases that only depend on the membrane
+            voltage and constants
+        membrane_voltage : str | None
+            The name of the state variable holding the membrane voltage, which
+            the tabulated aliases are functions of. If None, the only state
+            variable with voltage dimension is used.
+        """
+        if archive_spikes is None:
+            archive_spikes = bool(component_class.num_synapses)
+        trfrm = super(CodeGenerator, self).transform_for_build(
+            name, component_class, archive_spikes=archive_spikes,
+            tabulate=tabulate, **kwargs)
+        if tabulate:
+            if membrane_voltage is None:
+                voltages = [sv.name for sv in trfrm.state_variables
+                            if sv.dimension == un.voltage]
+                if len(voltages) != 1:
+                    raise Pype9BuildError(
+                        "Could not guess the membrane voltage of '{}' to "
+                        "tabulate aliases over from state variables with "
+                        "voltage dimension ('{}'), please specify it with "
+                        "the 'membrane_voltage' build option"
+                        .format(component_class.name, "', '".join(voltages)))
+                membrane_voltage = voltages[0]
+            self._annotate_tabulated_aliases(trfrm, membrane_voltage)
+        return trfrm
+
     def configure_build_files(self, name, src_dir, compile_dir, install_dir,
                               **kwargs):  # @UnusedVariable
+        # This is only called when the source is regenerated. In 'lazy' build
+        # mode that includes changes of build profile, because the profile
+        # is saved in the build properties of the build component class, so
+        # the class no longer matches the saved one. The CMakeLists.txt is
+        # re-rendered here and the existing Makefile re-runs cmake when it is
+        # modified, so the new profile flags are picked up
+        config_args = {'name': name, 'src_dir': src_dir,
+                       # NB: ODE solver currently ignored
+                       # 'ode_solver': kwargs.get('ode_solver',
+                       #                          self.ODE_SOLVER_DEFAULT),
+                       'version': pype9.__version__,
+                       'executable': sys.executable,
+                       'compile_flags': ' '.join(self.compile_flags),
+                       'link_flags': ' '.join(self.link_flags)}
+        self.render_to_file('CMakeLists.txt.tmpl', config_args,
+                            'CMakeLists.txt', src_dir)
         # Generate Makefile if it is not present
         if not path.exists(path.join(compile_dir, 'Makefile')):
             if not path.exists(compile_dir):
@@ -120,14 +198,6 @@ class CodeGenerator(BaseCodeGenerator):
             logger.info("Configuring build files in '{}' directory"
                         .format(compile_dir))
             orig_dir = os.getcwd()
-            config_args = {'name': name, 'src_dir': src_dir,
-                           # NB: ODE solver currently ignored
-                           # 'ode_solver': kwargs.get('ode_solver',
-                           #                          self.ODE_SOLVER_DEFAULT),
-                           'version': pype9.__version__,
-                           'executable': sys.executable}
-            self.render_to_file('CMakeLists.txt.tmpl', config_args,
-                                 'CMakeLists.txt', src_dir)
             os.chdir(compile_dir)
             stdout, stderr = self.run_command(
                 ['cmake',
@@ -1,13 +1,30 @@
+from builtins import object, zip
+import numpy
+import nest
 import nineml.units as un
 from pype9.simulate.common.simulation import Simulation as BaseSimulation
 from pyNN.nest import (
-    setup as pyNN_setup, run as pyNN_run, state as pyNN_state, end as pyNN_end)
+    setup as pyNN_setup, run_until as pyNN_run_until, state as pyNN_state,
+    end as pyNN_end, reset as pyNN_reset)
 from pype9.exceptions import Pype9UsageError
 from .code_gen import CodeGenerator
 
 
 class Simulation(BaseSimulation):
-    """Represent the simulator state."""
+    """
+    Represent the simulator state. In addition to the arguments of the base
+    Simulation class, the following NEST-specific options are accepted
+
+    Parameters
+    ----------
+    device_delay : nineml.Quantity (time) | None
+        The delay of the connections from devices that play signals into and
+        record from cells. If None the min delay is used
+    threads_per_proc : int
+        The number of threads the NEST kernel runs on each MPI process. The
+        total number of threads (and seeds of the random number generators
+        of the kernel) is the number of processes times this number
+    """
 
     _active = None
     name = 'NEST'
@@ -16,6 +33,13 @@ class Simulation(BaseSimulation):
     def __init__(self, *args, **kwargs):
         self._device_delay = kwargs.get('device_delay', None)
         self._threads_per_proc = kwargs.get('threads_per_proc', 1)
+        if int(self._threads_per_proc) != self._threads_per_proc or (
+                self._threads_per_proc < 1):
+            raise Pype9UsageError(
+                "Number of threads per process must be a positive integer "
+                "({})".format(self._threads_per_proc))
+        self._threads_per_proc = int(self._threads_per_proc)
+        self._multimeters = None
         super(Simulation, self).__init__(*args, **kwargs)
 
     @property
@@ -33,6 +57,35 @@ class Simulation(BaseSimulation):
     def device_delay_ms(self):
         return float(self.device_delay.in_units(un.ms))
 
+    def run(self, t_stop, **kwargs):
+        # Connect the multimeters shared by the cells before the (next part of
+        # the) simulation is run, as the variables they record can't be
+        # changed after they are connected
+        for multimeter in self._multimeters.values():
+            if not multimeter.connected:
+                multimeter.connect(self.device_delay_ms)
+        super(Simulation, self).run(t_stop, **kwargs)
+
+    def multimeter(self, model_name, interval):
+        """
+        Returns a multimeter shared by all cells of the given NEST model that
+        are recorded at the same interval
+
+        Parameters
+        ----------
+        model_name : str
+            Name of the NEST model of the cells
+        interval : float
+            The sampling interval of the recordings (ms)
+        """
+        key = (model_name, interval)
+        multimeter = self._multimeters.get(key)
+        if multimeter is None or multimeter.connected:
+            # Cells recorded after the simulation has started are recorded
+            # by a new multimeter
+            multimeter = self._multimeters[key] = SharedMultimeter(interval)
+        return multimeter
+
     def _run(self, t_stop, callbacks=None, **kwargs):  # @UnusedVariable
         """
         Run the simulation until time 't'. Typically won't be called explicitly
@@ -48,7 +101,7 @@ class Simulation(BaseSimulation):
             A function callback to allow the update of external objects (e.g.
             progress bar) during the simulation.
         """
-        pyNN_run(float(t_stop.in_units(un.ms)), callbacks=callbacks)
+        pyNN_run_until(float(t_stop.in_units(un.ms)), callbacks=callbacks)
 
     def _prepare(self, **kwargs):
         "Reset the simulation and prepare it for creating new cells/networks"
@@ -70,11 +123,24 @@ class Simulation(BaseSimulation):
                     "more than one thread")
         else:
             max_delay = self._max_delay
+        self._multimeters = {}
+        # NB: The seeds are generated for each thread of each process so
+        # there is a seed for every virtual process of the kernel
         pyNN_setup(timestep=float(self.dt.in_units(un.ms)),
                    min_delay=float(min_delay.in_units(un.ms)),
                    max_delay=float(max_delay.in_units(un.ms)),
+                   threads=self._threads_per_proc,
                    grng_seed=self.global_seed,
-                   rng_seeds=self.all_dynamics_seeds, **kwargs)
+                   rng_seeds=[int(s) for s in self.all_dynamics_seeds],
+                   **kwargs)
+
+    def _reset(self, reseed):
+        "Reset the clock and dynamic state of the kernel for a new trial"
+        pyNN_reset()
+        if reseed:
+            nest.SetKernelStatus({
+                'grng_seed': self.global_seed,
+                'rng_seeds': [int(s) for s in self.all_dynamics_seeds]})
 
     def mpi_rank(self):
         "The rank of the MPI node the code is running on"
@@ -92,3 +158,128 @@ class Simulation(BaseSimulation):
     def quit(cls):
         "Gracefully quit the simulator"
         pyNN_end()
+
+
+class SharedMultimeter(object):
+    """
+    A multimeter that records the variables of many cells (of the same NEST
+    model) at once, instead of each cell and recorded variable requiring its
+    own multimeter. Cells that record the same set of variables share a NEST
+    multimeter device, so each cell only records the variables requested for
+    it. The recorded events are split between the cells by their senders and
+    buffered until they are read or cleared by each cell.
+
+    Parameters
+    ----------
+    interval : float
+        The sampling interval of the recordings (ms)
+    """
+
+    def __init__(self, interval):
+        self._interval = interval
+        # The NEST devices and the variables they record from their cells,
+        # which are created when the multimeter is connected
+        self._devices = None
+        # The variables recorded from each cell (by GID)
+        self._variables = {}
+        # Recorded data of each cell and variable that hasn't been read yet
+        self._buffers = {}
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def connected(self):
+        return self._devices is not None
+
+    def add(self, gid, variable):
+        """
+        Adds a variable of a cell to the recorded variables. Must be called
+        before the multimeter is connected
+
+        Parameters
+        ----------
+        gid : int
+            The GID of the cell
+        variable : str
+            The name of the variable to record
+        """
+        assert not self.connected
+        self._variables.setdefault(gid, set()).add(variable)
+        return self
+
+    def connect(self, delay):
+        """
+        Creates a NEST multimeter for each set of variables recorded from
+        the cells and connects it to the cells that record them
+
+        Parameters
+        ----------
+        delay : float
+            The delay of the connections from the multimeter (ms)
+        """
+        gids = {}
+        for gid, variables in self._variables.items():
+            gids.setdefault(frozenset(variables), []).append(gid)
+        self._devices = []
+        for variables, var_gids in sorted(gids.items(),
+                                          key=lambda i: sorted(i[0])):
+            device = nest.Create('multimeter', 1, {
+                'interval': self._interval,
+                'record_from': sorted(variables)})
+            nest.Connect(device, sorted(var_gids), syn_spec={'delay': delay})
+            self._devices.append((device, variables))
+
+    def read(self, gid, variable):
+        """
+        Returns the data recorded from a variable of a cell
+
+        Parameters
+        ----------
+        gid : int
+            The GID of the cell
+        variable : str
+            The name of the recorded variable
+        """
+        self._collect()
+        buff = self._buffers.get((gid, variable), [])
+        data = numpy.concatenate(buff) if buff else numpy.zeros(0)
+        self._buffers[(gid, variable)] = [data]
+        return data
+
+    def clear(self, gid):
+        """
+        Clears the data recorded from a cell
+
+        Parameters
+        ----------
+        gid : int
+            The GID of the cell
+        """
+        self._collect()
+        for variable in self._variables[gid]:
+            self._buffers.pop((gid, variable), None)
+
+    def _collect(self):
+        """
+        Moves the events recorded by the multimeter devices into the buffers
+        of each cell and variable and clears them from the devices
+        """
+        if not self.connected:
+            return
+        for device, variables in self._devices:
+            events = nest.GetStatus(device, 'events')[0]
+            senders = numpy.asarray(events['senders'])
+            if not len(senders):
+                continue
+            # Group the events by sender (in order of time within each group)
+            order = numpy.lexsort((events['times'], senders))
+            gids, starts = numpy.unique(senders[order], return_index=True)
+            stops = numpy.append(starts[1:], len(order))
+            for variable in variables:
+                values = numpy.asarray(events[variable])[order]
+                for gid, start, stop in zip(gids, starts, stops):
+                    self._buffers.setdefault((int(gid), variable), []).append(
+                        values[start:stop])
+            nest.SetStatus(device, 'n_events', 0)
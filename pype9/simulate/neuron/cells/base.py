@@ -108,6 +108,8 @@ class Cell(base.Cell):
         self.rec = h.NetCon(self.source, None, sec=self._sec)
         self._inputs = {}
         self._input_auxs = []
+        # The counter of the random stream restored from a checkpoint
+        self._restored_rng_counter = None
         # Get a mapping of receptor names to NMODL indices for PyNN projection
         # connection
         assert (set(self.build_component_class.event_receive_port_names) ==
@@ -163,8 +165,7 @@ class Cell(base.Cell):
             object.__setattr__(self, '_regime_index', val)
         elif (varname.endswith('_init') and
               varname[:-5] in self.component_class.state_variable_names):
-            if varname in chain(self.component_class.state_variable_names,
-                                self.component_class.parameter_names):
+            if varname in self._accessors:
                 raise Pype9RuntimeError(
                     "Ambiguous variable '{}' can either be the initial state "
                     "of '{}' or a parameter/state-variable"
@@ -198,6 +199,9 @@ class Cell(base.Cell):
             self._set_regime()
         else:
             super(Cell, self).initialize()
+        if self._restored_rng_counter is not None:
+            setattr(self._hoc, self.code_generator.RNG_COUNTER_VARNAME,
+                    self._restored_rng_counter)
 
     @property
     def surface_area(self):
@@ -240,18 +244,66 @@ class Cell(base.Cell):
     def _set_regime(self):
         setattr(self._hoc, self.code_generator.REGIME_VARNAME, self._regime_index)
 
-    def record(self, port_name, **kwargs):  # @UnusedVariable
+    def _current_regime_index(self):
+        return int(getattr(self._hoc, self.code_generator.REGIME_VARNAME))
+
+    def _rng_state(self):
+        if not (self.component_class.is_random and
+                self.build_component_class.annotations.get(
+                    (BUILD_TRANS, PYPE9_NS), MECH_TYPE) ==
+                ARTIFICIAL_CELL_MECH):
+            return None
+        # The random stream of the mechanism is keyed by the seed, gid and
+        # stream of the cell, so only its counter needs to be saved
+        return int(getattr(self._hoc, self.code_generator.RNG_COUNTER_VARNAME))
+
+    def _restore_rng(self, rng_state):
+        # Set in 'initialize' as the counter is reset by the INITIAL block
+        super(base.Cell, self).__setattr__('_restored_rng_counter', rng_state)
+
+    def _checkpoint(self):
+        state = super(Cell, self)._checkpoint()
+        # Drop the sample at the time of the checkpoint as it is recorded
+        # again at the start of the restored simulation
+        for key, (data, interval) in list(state['recordings'].items()):
+            if interval is None:
+                continue
+            if key not in self._reducers:
+                state['recordings'][key] = (data[:-1], interval)
+            elif len(state['remainders'][key]):
+                state['remainders'][key] = state['remainders'][key][:-1]
+            else:
+                # The sample completes the final window, which is therefore
+                # incomplete once it is dropped and is carried over to the
+                # restored simulation instead
+                raw, raw_interval = self._read_recording(key)
+                window_samples = self._reducers[key].window_samples(
+                    raw_interval)
+                if len(raw) >= window_samples:
+                    state['recordings'][key] = (data[:-1], interval)
+                    state['remainders'][key] = numpy.array(
+                        raw[-window_samples:-1])
+        return state
+
+    def record(self, port_name, interval=None, reducer=None, **kwargs):  # @UnusedVariable @IgnorePep8
         """
         Parameters
         ----------
         port_name : str
             Name of the port to record from
+        interval : nineml.Quantity (time) | None
+            The sampling interval of analog recordings. If None the
+            recording is sampled at every time step
+        reducer : Reducer | None
+            A reducer used to summarise analog recordings over consecutive
+            windows after each chunk of the simulation
         v_thresh_tol : Quantity (voltage)
             A small voltage added to the threshold for determining emitted
             spikes. Used when there is a voltage reset after the time crossing
             that may cause the threshold to be missed.
         """
         self._initialize_local_recording()
+        self._set_reducer(port_name, reducer)
         # Get the port or state variable to record
         try:
             port = self.component_class.send_port(port_name)
@@ -279,19 +331,42 @@ class Cell(base.Cell):
             except AttributeError:
                 self._recorders[port_name] = recorder = getattr(
                     self._sec(0.5), '_ref_' + escaped_port_name)
-            recording.record(recorder)
+            if interval is not None:
+                # Sample the recording in NEURON at the given interval
+                interval = float(interval.in_units(un.ms))
+                self._intervals[port_name] = interval
+                recording.record(recorder, interval)
+            else:
+                recording.record(recorder)
 
     def record_regime(self):
         self._initialize_local_recording()
+        # Transitions are logged into the vector by the mechanism itself
+        # (instead of sampling the regime variable at every time step)
         self._recordings[
             self.code_generator.REGIME_VARNAME] = recording = h.Vector()
-        recording.record(getattr(self._hoc, '_ref_{}'
-                                 .format(self.code_generator.REGIME_VARNAME)))
+        getattr(self._hoc, 'set_' + self.code_generator.REGIME_LOG_VARNAME)(
+            recording)
 
-    def recording(self, port_name, t_start=None):
+    def recording(self, port_name, t_start=None, copy=True):
         """
         Return recorded data as a dictionary containing one numpy array for
         each neuron, ids as keys.
+
+        Parameters
+        ----------
+        port_name : str
+            Name of the port to retrieve the recording for
+        t_start : pq.Quantity (time) | None
+            The time to trim the start of the recording to
+        copy : bool
+            Whether to copy the recorded data into the returned object. If
+            False, analog signals are views of the NEURON vector the data is
+            recorded into (or of the cached recording once the simulation
+            has finished), so callers must guarantee the vector stays alive
+            and is not resized (i.e. the simulation is not continued and the
+            recordings are not reset) while the signal is used. Note that
+            older versions of neo (< 0.13) copy the data regardless.
         """
         if self.is_dead():
             t_stop = self._t_stop
@@ -306,29 +381,56 @@ class Cell(base.Cell):
         except NineMLNameError:
             port = self.component_class.state_variable(port_name)
         if isinstance(port, EventPort):
-            events = numpy.asarray(self._recordings[port_name])
+            events, _ = self._recorded(port_name)
             recording = neo.SpikeTrain(
                 self._trim_spike_train(events, t_start), t_start=t_start,
                 t_stop=t_stop, units='ms')
         else:
-            units_str = self.unit_handler.dimension_to_unit_str(
-                port.dimension, one_as_dimensionless=True)
-            interval = h.dt * pq.ms
-            signal = numpy.asarray(self._recordings[port_name])
+            units_str = self._recording_units(
+                port_name, self.unit_handler.dimension_to_unit_str(
+                    port.dimension, one_as_dimensionless=True))
+            signal, interval = self._recorded(port_name)
+            interval = interval * pq.ms
+            # Trim the start and drop the final timepoint with views of the
+            # recorded data, which is recorded in the units of the simulator
+            # so doesn't need to be scaled
+            signal = self._trim_analog_signal(signal, t_start, interval)
+            if port_name not in self._reducers:
+                # The final window of reduced recordings is already dropped
+                # as it is incomplete
+                signal = signal[:-1]
+            if copy:
+                # Copied explicitly as whether neo copies the array it is
+                # constructed from depends on its version
+                signal = numpy.array(signal)
             recording = neo.AnalogSignal(
-                self._trim_analog_signal(signal, t_start, interval),
-                sampling_period=interval,
-                t_start=t_start, units=units_str, name=port_name)
-            recording = recording[:-1]  # Drop final timepoint
+                signal, sampling_period=interval, t_start=t_start,
+                units=units_str, name=port_name)
         return recording
 
-    def _regime_recording(self):
-        t_start = self.unit_handler.to_pq_quantity(self._t_start)
-        return neo.AnalogSignal(
-            self._recordings[self.code_generator.REGIME_VARNAME],
-            sampling_period=h.dt * pq.ms,
-            t_start=t_start, units='dimensionless',
-            name=self.code_generator.REGIME_VARNAME)
+    def _recorder_keys(self):
+        return list(self._recordings)
+
+    def _read_recorder(self, key):
+        # A view of the vector's data, which is copied when it is cached
+        recording = self._recordings[key].as_numpy()
+        if key == self.code_generator.REGIME_VARNAME:
+            return recording, None
+        if (key in self.component_class.send_port_names and
+                isinstance(self.component_class.send_port(key), EventPort)):
+            return recording, None
+        return recording, self._intervals.get(key, h.dt)
+
+    def _free_recorders(self):
+        for recording in self._recordings.values():
+            # Remove the vectors from the record lists of NEURON so they
+            # are freed along with the recorders
+            recording.play_remove()
+        if self.code_generator.REGIME_VARNAME in self._recordings:
+            # Stop logging regime transitions into the freed vector
+            getattr(self._hoc,
+                    'set_' + self.code_generator.REGIME_LOG_VARNAME)()
+        super(Cell, self)._free_recorders()
 
     def reset_recordings(self):
         """
@@ -344,6 +446,7 @@ class Cell(base.Cell):
         """
         super(Cell, self).clear_recorders()
         super(base.Cell, self).__setattr__('_recordings', {})
+        super(base.Cell, self).__setattr__('_intervals', {})
 
     def play(self, port_name, signal, properties=[]):
         """
@@ -362,6 +465,8 @@ class Cell(base.Cell):
             (BUILD_TRANS, PYPE9_NS), EXTERNAL_CURRENTS).split(',')
         port = self.component_class.port(port_name)
         if isinstance(port, EventPort):
+            # Events are delivered with a delay of 1 ms (see below)
+            signal = self._kernel_signal(signal, t_min=1.0)
             if len(list(self.component_class.event_receive_ports)) > 1:
                 raise Pype9Unsupported9MLException(
                     "Multiple event receive ports ('{}') are not currently "
@@ -391,6 +496,9 @@ class Cell(base.Cell):
                 raise Pype9Unsupported9MLException(
                     "Can only play into external current ports ('{}'), not "
                     "'{}' port.".format("', '".join(ext_is), port_name))
+            signal = self._kernel_signal(signal)
+            if signal is None:
+                return
             iclamp = h.IClamp(0.5, sec=self._sec)
             iclamp.delay = 0.0
             iclamp.dur = 1e12
@@ -564,8 +672,20 @@ class CellMetaClass(base.CellMetaClass):
     _built_types = {}  # Stores previously created types for reuse
     CodeGenerator = CodeGenerator
     BaseCellClass = Cell
+    # The instances of NEURON batches are individual cell objects
+    BatchClass = base.CellBatch
     Simulation = Simulation
 
+    @classmethod
+    def _simulator_accessor(cls, varname, component_class,
+                            build_component_class):
+        # The membrane voltage is renamed to 'v' in the build transform
+        if varname == component_class.annotations.get(
+                (BUILD_TRANS, PYPE9_NS), MEMBRANE_VOLTAGE, default=None):
+            varname = build_component_class.annotations.get(
+                (BUILD_TRANS, PYPE9_NS), MEMBRANE_VOLTAGE)
+        return varname
+
 
 class OuputEventTransitionsFinder(BaseVisitorWithContext):
     """
@@ -36,6 +36,7 @@ from nineml.abstraction.dynamics.visitors.queriers import (
     DynamicsInterfaceInferer)
 from sympy.printing import ccode
 from pype9.utils.mpi import is_mpi_master, mpi_comm
+from pype9.utils.paths import remove_ignore_missing
 from pype9.simulate.neuron.units import UnitHandler
 try:
     from nineml.extensions.kinetics import Kinetics  # @UnusedImport
@@ -60,7 +61,10 @@ class CodeGenerator(BaseCodeGenerator):
     SIMULATOR_VERSION = neuron.h.nrnversion(0)
     ODE_SOLVER_DEFAULT = 'derivimplicit'
     REGIME_VARNAME = 'regime_'
-    SEED_VARNAME = 'seed_'
+    REGIME_LOG_VARNAME = 'regime_log_'
+    RNG_GID_VARNAME = 'rng_gid_'
+    RNG_STREAM_VARNAME = 'rng_stream_'
+    RNG_COUNTER_VARNAME = 'rng_counter_'
     BASE_TMPL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                   'templates'))
     UnitHandler = UnitHandler
@@ -76,9 +80,12 @@ class CodeGenerator(BaseCodeGenerator):
         self.nrnivmodl_path = self.get_neuron_util_path('nrnivmodl')
         self.modlunit_path = self.get_neuron_util_path('modlunit',
                                                        default=None)
-        # Compile wrappers around GSL random distribution functions
+        # Compile wrappers around GSL random distribution functions (again if
+        # the source has been updated since it was last compiled)
         if is_mpi_master():
-            if not os.path.exists(self.libninemlnrn_so):
+            if (not os.path.exists(self.libninemlnrn_so) or
+                os.path.getmtime(self.libninemlnrn_so) < os.path.getmtime(
+                    os.path.join(self.BASE_TMPL_PATH, 'ninemlnrn.cpp'))):
                 self.compile_libninemlnrn()
         mpi_comm.barrier()
         self.nrnivmodl_flags = [
@@ -121,6 +128,7 @@ class CodeGenerator(BaseCodeGenerator):
         if name is None:
             name = component_class.name
         template = 'main.tmpl'
+        self._check_tabulation(component_class, **kwargs)
         self.generate_mod_file(template, component_class, src_dir, name,
                                kwargs)
 
@@ -145,7 +153,11 @@ class CodeGenerator(BaseCodeGenerator):
             'external_ports': [],
             'is_subcomponent': True,
             'regime_varname': self.REGIME_VARNAME,
-            'seed_varname': self.SEED_VARNAME}
+            'regime_log_varname': self.REGIME_LOG_VARNAME,
+            'rng_gid_varname': self.RNG_GID_VARNAME,
+            'rng_stream_varname': self.RNG_STREAM_VARNAME,
+            'rng_counter_varname': self.RNG_COUNTER_VARNAME,
+            'tabulation': self.tabulation(component_class)}
 #             # FIXME: weight_vars needs to be removed or implemented properly
 #             'weight_variables': []}
         tmpl_args.update(template_args)
@@ -164,7 +176,14 @@ class CodeGenerator(BaseCodeGenerator):
             The name of the transformed component class
         component_class : nineml.Dynamics
             The component class to be transformed
+        tabulate : bool
+            Whether to generate NMODL TABLE functions (over the range set by
+            the 'table_v_min', 'table_v_max' and 'table_v_step' build options)
+            for aliases that only depend on the membrane voltage and constants.
+            Raises a Pype9BuildError for artificial cells, which have no
+            membrane voltage
         """
+        kwargs = self._table_build_props(**kwargs)
         self._set_build_props(component_class, **kwargs)
         if not isinstance(component_class, WithSynapses):
             raise Pype9RuntimeError(
@@ -243,10 +262,17 @@ class CodeGenerator(BaseCodeGenerator):
                                                **kwargs)
                 trfrm.annotations.set((BUILD_TRANS, PYPE9_NS),
                                       MECH_TYPE, FULL_CELL_MECH)
+                if kwargs.get('tabulate', False):
+                    self._annotate_tabulated_aliases(trfrm, 'v')
             else:
                 raise NotImplementedError(
                     "Build sub-components is not supported in PyPe9 v0.1")
         else:
+            if kwargs.get('tabulate', False):
+                raise Pype9BuildError(
+                    "Cannot tabulate aliases of '{}' as it has no membrane "
+                    "voltage to tabulate them over (it is built as an "
+                    "artificial cell)".format(component_class.name))
             trfrm.annotations.set((BUILD_TRANS, PYPE9_NS), MECH_TYPE,
                                   ARTIFICIAL_CELL_MECH)
 
@@ -480,7 +506,11 @@ class CodeGenerator(BaseCodeGenerator):
                             "NMODL file: {}\n{}".format(fname, e))
         # Run nrnivmodl command in src directory
         nrnivmodl_cmd = [self.nrnivmodl_path, '-loadflags',
-                         ' '.join(self.nrnivmodl_flags)]
+                         ' '.join(self.nrnivmodl_flags + self.link_flags)]
+        # Flags from the build profile are passed with the include flags as
+        # they are appended after the defaults in nrnmech_makefile
+        if self.compile_flags:
+            nrnivmodl_cmd.extend(['-incflags', ' '.join(self.compile_flags)])
         logger.debug("Building nrnivmodl in {} with {}".format(
             compile_dir, nrnivmodl_cmd))
         self.run_command(nrnivmodl_cmd, fail_msg=(
@@ -577,6 +607,7 @@ class CodeGenerator(BaseCodeGenerator):
                        .format(cc, self.BASE_TMPL_PATH,
                                ' '.join('-I{}/include'.format(p)
                                         for p in gsl_prefixes)))
+        remove_ignore_missing(self.libninemlnrn_dir)
         os.makedirs(self.libninemlnrn_dir)
         self.run_cmd(
             compile_cmd, work_dir=self.libninemlnrn_dir,
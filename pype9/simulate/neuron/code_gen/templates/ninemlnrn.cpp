@@ -1,15 +1,22 @@
 /*
- 
+
 A library that wraps GSL random routines for use in mod-files:
 
-gsl_rng* get_gsl_rng()
-void release_gsl_rng()
+void nineml_seed_rng(unsigned int seed)
+
+double nineml_normal(double m, double s, double gid, double stream, double* counter);
+double nineml_uniform(double a, double b, double gid, double stream, double* counter);
+double nineml_binomial(double p, int n, double gid, double stream, double* counter);
+double nineml_exponential(double mu, double gid, double stream, double* counter);
+double nineml_poisson(double mu, double gid, double stream, double* counter);
 
-double nineml_gsl_normal(double m, double s);
-double nineml_gsl_uniform(double a, double b);
-double nineml_gsl_binomial(double p, int n);
-double nineml_gsl_exponential(double mu);
-double nineml_gsl_poisson(double mu);
+Instead of drawing from a single global generator, whose output would depend
+on the order in which the mechanisms are updated, each mechanism instance
+draws from its own counter-based (Philox4x32-10) stream, keyed by the global
+seed, the gid of the cell and a stream id. The only state of a stream is its
+counter, which is stored in the mechanism instance and incremented on every
+call, so the functions are thread-safe and the random sequences are
+independent of the number of ranks and threads the simulation is run on.
 
 */
 
@@ -17,52 +24,122 @@ double nineml_gsl_poisson(double mu);
 #include <stdio.h>
 #include <stdlib.h>
 #include <assert.h>
+#include <stdint.h>
 
 #include <gsl/gsl_rng.h>
 #include <gsl/gsl_randist.h>
 
 
+// Only set before the simulation is run so it is safe to read from
+// multiple threads
+static uint32_t _seed = 0;
 
 
+/* PHILOX4x32-10 COUNTER-BASED GENERATOR */
 
-gsl_rng* nineml_gsl_rng = NULL;
-unsigned int _seed = 0;
-  
-/* FUNCTIONS FOR ALLOCATING & DEALLOCATING RNG */
-extern "C"
-gsl_rng* get_gsl_rng()
+static const uint32_t PHILOX_M0 = 0xD2511F53;
+static const uint32_t PHILOX_M1 = 0xCD9E8D57;
+static const uint32_t PHILOX_W0 = 0x9E3779B9;
+static const uint32_t PHILOX_W1 = 0xBB67AE85;
+
+static inline void philox4x32_10(const uint32_t ctr[4], const uint32_t key[2],
+                                 uint32_t out[4])
 {
-    if(nineml_gsl_rng == NULL)
-    {
-        nineml_gsl_rng = gsl_rng_alloc (gsl_rng_mt19937);
+    uint32_t c0 = ctr[0], c1 = ctr[1], c2 = ctr[2], c3 = ctr[3];
+    uint32_t k0 = key[0], k1 = key[1];
+    for (int round = 0; round < 10; ++round) {
+        uint64_t p0 = (uint64_t)PHILOX_M0 * c0;
+        uint64_t p1 = (uint64_t)PHILOX_M1 * c2;
+        uint32_t hi0 = (uint32_t)(p0 >> 32), lo0 = (uint32_t)p0;
+        uint32_t hi1 = (uint32_t)(p1 >> 32), lo1 = (uint32_t)p1;
+        c0 = hi1 ^ c1 ^ k0;
+        c1 = lo1;
+        c2 = hi0 ^ c3 ^ k1;
+        c3 = lo0;
+        k0 += PHILOX_W0;
+        k1 += PHILOX_W1;
     }
-    return nineml_gsl_rng;
+    out[0] = c0; out[1] = c1; out[2] = c2; out[3] = c3;
 }
 
-extern "C"
-void release_gsl_rng()
+
+/* GSL RNG TYPE WRAPPING A SINGLE STREAM */
+
+typedef struct {
+    uint32_t key[2];
+    uint32_t ctr[4];
+    uint32_t block[4];
+    int next;  // Index of the next unused word of the block (4 if none)
+    double* counter;  // Counter of the stream stored in the mechanism
+} nineml_stream_state;
+
+static unsigned long int nineml_stream_get(void* vstate)
 {
-    if(nineml_gsl_rng)
-    {
-        gsl_rng_free (nineml_gsl_rng);
-        nineml_gsl_rng = NULL;
+    nineml_stream_state* state = (nineml_stream_state*)vstate;
+    if (state->next == 4) {
+        // Use the next block of the stream
+        uint64_t count = (uint64_t)(*state->counter);
+        state->ctr[0] = (uint32_t)count;
+        state->ctr[1] = (uint32_t)(count >> 32);
+        philox4x32_10(state->ctr, state->key, state->block);
+        *state->counter += 1.0;
+        state->next = 0;
     }
+    return state->block[state->next++];
+}
+
+static double nineml_stream_get_double(void* vstate)
+{
+    return nineml_stream_get(vstate) / 4294967296.0;
+}
+
+static void nineml_stream_set(void* vstate, unsigned long int seed)
+{
+    // Streams are keyed by the arguments passed to the wrapper functions
+    (void)vstate;
+    (void)seed;
+}
+
+static const gsl_rng_type nineml_stream_type = {
+    "nineml_philox4x32_10",
+    0xffffffffUL,
+    0,
+    sizeof(nineml_stream_state),
+    &nineml_stream_set,
+    &nineml_stream_get,
+    &nineml_stream_get_double};
+
+// Initialises a GSL generator that draws from the stream of the given
+// mechanism instance. Both the generator and its state live on the stack of
+// the calling function.
+static inline void nineml_stream_init(gsl_rng* r, nineml_stream_state* state,
+                                      double gid, double stream,
+                                      double* counter)
+{
+    state->key[0] = _seed;
+    state->key[1] = (uint32_t)gid;
+    state->ctr[2] = (uint32_t)stream;
+    state->ctr[3] = 0;
+    state->next = 4;
+    state->counter = counter;
+    r->type = &nineml_stream_type;
+    r->state = state;
 }
 
+
+/* SEEDING */
+
 extern "C"
-void nineml_seed_gsl_rng(unsigned int seed) {
+void nineml_seed_rng(unsigned int seed) {
 
-    gsl_rng* rng = get_gsl_rng();
-    gsl_rng_set(rng, seed);
     _seed = seed;
 
 }
 
 
 extern "C"
-unsigned int nineml_get_gsl_rng_seed() {
+unsigned int nineml_get_rng_seed() {
 
-    printf("%d\n", _seed);
     return _seed;
 
 }
@@ -72,43 +149,54 @@ unsigned int nineml_get_gsl_rng_seed() {
 //
 
 extern "C"
-double nineml_gsl_normal(double m, double s)
+double nineml_normal(double m, double s, double gid, double stream,
+                     double* counter)
 {
-    gsl_rng* r = get_gsl_rng();
-    return m + gsl_ran_gaussian(r, s);
+    gsl_rng r;
+    nineml_stream_state state;
+    nineml_stream_init(&r, &state, gid, stream, counter);
+    return m + gsl_ran_gaussian(&r, s);
 }
 
 
 extern "C"
-double nineml_gsl_uniform(double a, double b)
+double nineml_uniform(double a, double b, double gid, double stream,
+                      double* counter)
 {
-    gsl_rng* r = get_gsl_rng();
-    return gsl_ran_flat(r, a, b);
+    gsl_rng r;
+    nineml_stream_state state;
+    nineml_stream_init(&r, &state, gid, stream, counter);
+    return gsl_ran_flat(&r, a, b);
 }
 
-       
+
 extern "C"
-double nineml_gsl_binomial(double p, int n)
+double nineml_binomial(double p, int n, double gid, double stream,
+                       double* counter)
 {
-    gsl_rng* r = get_gsl_rng();
-    return gsl_ran_binomial(r, p, n);
+    gsl_rng r;
+    nineml_stream_state state;
+    nineml_stream_init(&r, &state, gid, stream, counter);
+    return gsl_ran_binomial(&r, p, n);
 }
-       
-       
+
+
 extern "C"
-double nineml_gsl_exponential(double lambda)
+double nineml_exponential(double lambda, double gid, double stream,
+                          double* counter)
 {
-    gsl_rng* r = get_gsl_rng();
-    return gsl_ran_exponential(r,1.0/lambda);
+    gsl_rng r;
+    nineml_stream_state state;
+    nineml_stream_init(&r, &state, gid, stream, counter);
+    return gsl_ran_exponential(&r, 1.0 / lambda);
 }
-       
-       
+
+
 extern "C"
-double nineml_gsl_poisson(double mu)
+double nineml_poisson(double mu, double gid, double stream, double* counter)
 {
-    gsl_rng* r = get_gsl_rng();
-    return gsl_ran_poisson(r,mu);
+    gsl_rng r;
+    nineml_stream_state state;
+    nineml_stream_init(&r, &state, gid, stream, counter);
+    return gsl_ran_poisson(&r, mu);
 }
-       
-       
-       
@@ -2,7 +2,8 @@ from builtins import object
 from nineml import units as un
 import ctypes
 from pyNN.neuron import (
-    setup as pyNN_setup, run as pyNN_run, end as pyNN_end, state as pyNN_state)
+    setup as pyNN_setup, run_until as pyNN_run_until, end as pyNN_end,
+    state as pyNN_state, reset as pyNN_reset)
 from pyNN.neuron.simulator import initializer as pyNN_initializer
 from pype9.simulate.common.simulation import Simulation as BaseSimulation
 from pype9.simulate.neuron.code_gen import CodeGenerator
@@ -26,9 +27,16 @@ class Simulation(BaseSimulation):
 
     DEFAULT_MAX_DELAY = 10 * un.ms
 
+    # Random stream ids used to distinguish cells created independently of
+    # PyNN populations, whose gids are assigned in order of creation, from
+    # cells in populations, which use their PyNN gids
+    ARRAY_RNG_STREAM = 0
+    INDEPENDENT_CELL_RNG_STREAM = 1
+
     def __init__(self, *args, **kwargs):
         super(Simulation, self).__init__(*args, **kwargs)
         self._has_random_processes = False
+        self._num_independent_cells = 0
 
     def _run(self, t_stop, callbacks=None, **kwargs):  # @UnusedVariable
         """
@@ -45,7 +53,7 @@ class Simulation(BaseSimulation):
             A function callback to allow the update of external objects (e.g.
             progress bar) during the simulation.
         """
-        pyNN_run(float(t_stop.in_units(un.ms)), callbacks=callbacks)
+        pyNN_run_until(float(t_stop.in_units(un.ms)), callbacks=callbacks)
 
     def _prepare(self, **kwargs):
         "Reset the simulation and prepare it for creating new cells/networks"
@@ -72,6 +80,14 @@ class Simulation(BaseSimulation):
                    max_delay=float(max_delay.in_units(un.ms)),
                    **kwargs)
 
+    def _reset(self, reseed):  # @UnusedVariable
+        """
+        Reset the clock and dynamic state of the kernel for a new trial. The
+        random streams of the cells are restarted (from the current global
+        seed) when they are initialized
+        """
+        pyNN_reset()
+
     def _initialize(self):
         """
         Just in time initialisations that are performed before the simulation
@@ -105,6 +121,9 @@ class Simulation(BaseSimulation):
         pyNN_initializer.register(self._DummyID(cell))
         if cell.component_class.is_random:
             self._has_random_processes = True
+            self._set_rng_stream(cell, self._num_independent_cells,
+                                 self.INDEPENDENT_CELL_RNG_STREAM)
+        self._num_independent_cells += 1
 
     def register_array(self, array):
         super(Simulation, self).register_array(array)
@@ -119,6 +138,16 @@ class Simulation(BaseSimulation):
         # a PyNN population and independent.
         for id_ in array:
             self._registered_cells.append(id_._cell)
+            if array.component_class.is_random:
+                self._set_rng_stream(id_._cell, int(id_),
+                                     self.ARRAY_RNG_STREAM)
+
+    def _set_rng_stream(self, cell, gid, stream):
+        """
+        Sets the key of the random stream the cell's mechanism draws from
+        """
+        setattr(cell._hoc, self.code_generator.RNG_GID_VARNAME, gid)
+        setattr(cell._hoc, self.code_generator.RNG_STREAM_VARNAME, stream)
 
     def _seed_libninemlnrn(self):
         """
@@ -128,10 +157,13 @@ class Simulation(BaseSimulation):
         # Could be performed in __enter__ along with the setting of other seeds
         # but there is a problem loading the library with ctypes before it has
         # been loaded by the required mod files, so it is delayed until
-        # initialisation
+        # initialisation. NB: Each cell draws from its own stream keyed by
+        # this seed and its gid, so the global seed (which is the same on all
+        # ranks) is used so the results don't depend on the number of
+        # processes or threads
         libninemlnrn = ctypes.CDLL(self.code_generator.libninemlnrn_so)
-        libninemlnrn.nineml_seed_gsl_rng.arg_types = [ctypes.c_int()]
-        libninemlnrn.nineml_seed_gsl_rng(int(self.dynamics_seed))
+        libninemlnrn.nineml_seed_rng.argtypes = [ctypes.c_uint]
+        libninemlnrn.nineml_seed_rng(int(self.global_seed))
 
     @classmethod
     def quit(cls):
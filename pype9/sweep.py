@@ -0,0 +1,336 @@
+"""
+Runs parameter sweeps of single-cell 9ML models over a pool of worker
+processes. As only one simulation can be active in a process at a time, each
+worker runs its own simulations of the points of the sweep it is sent, after
+the model has been built once by the calling process, e.g.::
+
+    from pype9.sweep import Sweep, grid
+
+    sweep = Sweep(ninemlcatalog.load('neuron/Izhikevich#Izhikevich'), 'nest',
+                  duration=100.0 * un.ms, dt=0.1 * un.ms, record=['V'],
+                  properties=ninemlcatalog.load(
+                      'neuron/Izhikevich#SampleIzhikevich'),
+                  seed=12345)
+    for result in sweep.run(grid(a=[0.02, 0.03] / un.ms,
+                                 d=[2.0, 4.0, 8.0] * un.mV / un.ms)):
+        print(result.point, result.recordings['V'])
+
+Results are yielded as they complete (i.e. not necessarily in the order of
+the points). A reducer function can be supplied to summarise the recordings
+within the worker so that only the summaries are sent back to the calling
+process.
+
+  Author: Thomas G. Close (tclose@oist.jp)
+  Copyright: 2012-2014 Thomas G. Close.
+  License: This file is part of the "NineLine" package, which is released under
+           the MIT Licence, see LICENSE for details.
+"""
+from __future__ import division
+from builtins import range, zip
+from builtins import object
+import os.path
+import shutil
+import tempfile
+import itertools
+import collections
+import multiprocessing
+import numpy
+import nineml
+from pype9.exceptions import Pype9UsageError
+from pype9.utils.logging import logger
+from pype9.utils.seeds import child_seed
+
+
+SIMULATORS = ('nest', 'neuron')
+
+SweepResult = collections.namedtuple('SweepResult',
+                                     'index point seed recordings')
+
+# State of the worker processes, set by the pool initializer
+_worker = None
+
+
+def grid(**axes):
+    """
+    Returns the points of a grid spanned by the values along each axis
+
+    Parameters
+    ----------
+    axes : dict(str, list(nineml.Quantity) | pq.Quantity | nineml.Quantity)
+        The values of each parameter/initial-state along each axis of the grid
+
+    Returns
+    -------
+    points : list(dict(str, nineml.Quantity | pq.Quantity))
+        The points of the grid (the last axis varies fastest)
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in itertools.product(
+        *(_axis_values(axes[n]) for n in names))]
+
+
+def _axis_values(values):
+    if isinstance(values, nineml.Quantity):
+        if values.value.nineml_type == 'ArrayValue':
+            return [nineml.Quantity(v, values.units) for v in values.value]
+        else:
+            return [values]
+    return list(values)
+
+
+class Sweep(object):
+    """
+    Runs simulations of a single-cell model for each point of a parameter
+    sweep over a pool of worker processes
+
+    Parameters
+    ----------
+    model : nineml.Dynamics | nineml.DynamicsProperties
+        The model to simulate
+    simulator : str
+        Name of the simulator to use, either 'nest' or 'neuron'
+    duration : nineml.Quantity (time)
+        The duration of each simulation
+    dt : nineml.Quantity (time)
+        The resolution of each simulation
+    record : list(str)
+        Names of the send ports and state variables to record
+    properties : nineml.DynamicsProperties | None
+        The properties used for values not provided by the points of the
+        sweep. If None and model is a DynamicsProperties object it is used
+    regime : str | None
+        The regime to initiate the cells in, can be omitted if the model has a
+        single regime
+    reducer : callable | None
+        A function taking the point and a dictionary of the recordings and
+        returning a summary that is sent back from the worker in their place.
+        Must be defined at the top level of a module so it can be sent to the
+        worker processes
+    seed : int | None
+        Base seed from which the seed of each simulation is derived from its
+        index in the sweep (so results don't depend on the number of worker
+        processes)
+    processes : int | None
+        Number of worker processes. If None the number of CPUs is used
+    chunk_size : int
+        Number of points sent to a worker process at a time
+    build_mode : str
+        The build mode used to build the model in the calling process (the
+        workers load the pre-built model)
+    build_base_dir : str | None
+        Base build directory
+    build_args : dict(str, object) | None
+        Additional arguments passed to the CellMetaClass of the simulator
+    simulation_args : dict(str, object) | None
+        Additional arguments passed to the Simulation of the simulator
+    """
+
+    def __init__(self, model, simulator, duration, dt, record,
+                 properties=None, regime=None, reducer=None, seed=None,
+                 processes=None, chunk_size=1, build_mode='lazy',
+                 build_base_dir=None, build_args=None, simulation_args=None):
+        if simulator not in SIMULATORS:
+            raise Pype9UsageError(
+                "Unrecognised simulator '{}', can be one of '{}'"
+                .format(simulator, "', '".join(SIMULATORS)))
+        if isinstance(model, nineml.DynamicsProperties):
+            if properties is None:
+                properties = model
+            model = model.component_class
+        if regime is None:
+            if model.num_regimes == 1:
+                regime = next(model.regime_names)
+            else:
+                raise Pype9UsageError(
+                    "Need to specify initial regime as dynamics has more than "
+                    "one '{}'".format("', '".join(model.regime_names)))
+        if chunk_size < 1:
+            raise Pype9UsageError(
+                "Chunk size must be a positive integer ({})"
+                .format(chunk_size))
+        self._model = model
+        self._simulator = simulator
+        self._duration = duration
+        self._dt = dt
+        self._record = list(record)
+        self._properties = properties
+        self._regime = regime
+        self._reducer = reducer
+        # A random base seed is drawn if one isn't provided so the seeds of
+        # the points are consistent between calls to 'seeds'
+        self._seed = (seed if seed is not None
+                      else numpy.random.randint(2 ** 31 - 1))
+        self._processes = (processes if processes is not None
+                           else multiprocessing.cpu_count())
+        self._chunk_size = chunk_size
+        self._build_mode = build_mode
+        self._build_base_dir = build_base_dir
+        self._build_args = dict(build_args) if build_args else {}
+        self._simulation_args = (dict(simulation_args) if simulation_args
+                                 else {})
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def simulator(self):
+        return self._simulator
+
+    def build(self):
+        """
+        Builds the model in the calling process so it can be loaded by the
+        worker processes without rebuilding it
+        """
+        CellMetaClass = _simulator_module(self._simulator).CellMetaClass
+        CellMetaClass(self._model, build_mode=self._build_mode,
+                      build_base_dir=self._build_base_dir,
+                      **self._build_args)
+
+    def seeds(self, num_points):
+        """
+        The seeds of the simulations of each point of the sweep, generated
+        from the children spawned from the base seed (so the seed of each
+        point doesn't depend on the number of points)
+        """
+        return [child_seed(self._seed, (i,)) for i in range(num_points)]
+
+    def run(self, points):
+        """
+        Runs the sweep over the given points, yielding the results as they
+        are completed
+
+        Parameters
+        ----------
+        points : iterable(dict(str, nineml.Quantity | pq.Quantity))
+            The properties and initial states of each point of the sweep,
+            e.g. as generated by the 'grid' function or a sampler
+
+        Returns
+        -------
+        results : generator(SweepResult)
+            The index, point, seed and recordings (or the output of the
+            reducer) of each point of the sweep in the order they complete
+        """
+        points = list(points)
+        jobs = list(zip(range(len(points)), points,
+                        self.seeds(len(points))))
+        chunks = [jobs[i:i + self._chunk_size]
+                  for i in range(0, len(jobs), self._chunk_size)]
+        self.build()
+        # The model is written to file to send it to the worker processes as
+        # 9ML objects cannot be pickled
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            model_path = os.path.join(tmp_dir, self._model.name + '.xml')
+            nineml.write(model_path,
+                         *([self._model] + ([self._properties]
+                                            if self._properties is not None
+                                            else [])))
+            worker_args = (
+                self._simulator, model_path, self._model.name,
+                self._model.url,
+                (self._properties.name if self._properties is not None
+                 else None),
+                self._regime, self._duration, self._dt, self._record,
+                self._reducer, self._build_base_dir, self._build_args,
+                self._simulation_args)
+            logger.info("Running sweep of {} points of '{}' over {} "
+                        "processes".format(len(points), self._model.name,
+                                           self._processes))
+            pool = _pool_context().Pool(
+                processes=min(self._processes, max(len(chunks), 1)),
+                initializer=_init_worker, initargs=worker_args)
+            try:
+                for chunk_results in pool.imap_unordered(_run_chunk, chunks):
+                    for result in chunk_results:
+                        yield result
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _simulator_module(simulator):
+    if simulator == 'nest':
+        import pype9.simulate.nest as module
+    elif simulator == 'neuron':
+        import pype9.simulate.neuron as module
+    else:
+        assert False
+    return module
+
+
+def _pool_context():
+    """
+    Workers are spawned (where supported) instead of forked, as the simulator
+    kernels loaded into the calling process are not safe to fork
+    """
+    try:
+        return multiprocessing.get_context('spawn')
+    except AttributeError:  # Python 2
+        return multiprocessing
+
+
+class _Worker(object):
+    """
+    Holds the loaded model and the simulation settings of a worker process
+    """
+
+    def __init__(self, simulator, model_path, model_name, model_url,
+                 properties_name, regime, duration, dt, record, reducer,
+                 build_base_dir, build_args, simulation_args):
+        module = _simulator_module(simulator)
+        document = nineml.read(model_path)
+        self.properties = (document[properties_name]
+                           if properties_name is not None else None)
+        self.code_generator = module.Simulation.CodeGenerator(
+            base_dir=build_base_dir)
+        model = document[model_name]
+        if model_url is None:
+            # Models constructed in code are built into the 'generated' build
+            # directory, so they are detached from the temporary file they
+            # were sent in, which would otherwise be used as their URL
+            model = model.clone()
+        # Load the model built by the calling process (the URL of the
+        # original model is used to locate the build directory)
+        self.Cell = module.CellMetaClass(
+            model, build_url=model_url, build_mode='require',
+            code_generator=self.code_generator, **build_args)
+        self.Simulation = module.Simulation
+        self.regime = regime
+        self.duration = duration
+        self.dt = dt
+        self.record = record
+        self.reducer = reducer
+        self.simulation_args = simulation_args
+
+    def run(self, index, point, seed):
+        with self.Simulation(dt=self.dt, seed=seed,
+                             code_generator=self.code_generator,
+                             **self.simulation_args) as sim:
+            if self.properties is not None:
+                cell = self.Cell(self.properties, regime_=self.regime,
+                                 lazy_=True, **point)
+            else:
+                cell = self.Cell(regime_=self.regime, lazy_=True, **point)
+            for port_name in self.record:
+                cell.record(port_name)
+            sim.run(self.duration)
+        recordings = dict((p, cell.recording(p)) for p in self.record)
+        if self.reducer is not None:
+            recordings = self.reducer(point, recordings)
+        return SweepResult(index, point, seed, recordings)
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = _Worker(*args)
+
+
+def _run_chunk(chunk):
+    return [_worker.run(*job) for job in chunk]
@@ -0,0 +1,46 @@
+"""
+Derivation of independent seeds from a base seed and a "spawn key" (a tuple
+of integers identifying a stream of the base seed), so that seeds can be
+generated for any number of threads or objects without the seeds of each
+depending on how many are generated.
+
+numpy's SeedSequence is used where it is available (numpy>=1.17). Otherwise
+(e.g. on Python 2.7, which isn't supported by numpy>=1.17) the seeds are
+derived from a hash of the base seed and spawn key, so the seeds generated
+from the same base seed differ between the two cases.
+
+  Author: Thomas G. Close (tclose@oist.jp)
+  Copyright: 2012-2014 Thomas G. Close.
+  License: This file is part of the "NineLine" package, which is released under
+           the MIT Licence, see LICENSE for details.
+"""
+import struct
+import hashlib
+import numpy
+
+
+def child_seed(seed, spawn_key):
+    """
+    Returns a 32-bit seed for the stream of a base seed identified by the
+    spawn key. With numpy>=1.17 it is the first word of the state of the
+    child of numpy.random.SeedSequence(seed) with the given spawn key (e.g.
+    the seed of the i-th child returned by its 'spawn' method is
+    child_seed(seed, (i,)))
+
+    Parameters
+    ----------
+    seed : int
+        The base seed
+    spawn_key : tuple(int)
+        The key identifying the stream
+    """
+    spawn_key = tuple(int(k) for k in spawn_key)
+    try:
+        SeedSequence = numpy.random.SeedSequence
+    except AttributeError:
+        digest = hashlib.sha256('{}:{}'.format(
+            int(seed), ','.join(str(k) for k in spawn_key)).encode(
+                'utf-8')).digest()
+        return int(struct.unpack('<I', digest[:4])[0])
+    return int(SeedSequence(int(seed), spawn_key=spawn_key).generate_state(
+        1)[0])
@@ -1,11 +1,18 @@
 from __future__ import division
 from __future__ import print_function
 import ninemlcatalog
-from nineml.abstraction import Parameter, TimeDerivative, StateVariable
+from nineml.abstraction import (
+    Parameter, TimeDerivative, StateVariable, Dynamics, Regime, Constant,
+    AnalogReceivePort)
 import nineml.units as un
 from pype9.simulate.nest import CellMetaClass
+from pype9.simulate.nest.code_gen import CodeGenerator
+from pype9.simulate.neuron.code_gen import (
+    CodeGenerator as NeuronCodeGenerator)
 from pype9.simulate.common.cells.with_synapses import WithSynapses
-from pype9.exceptions import Pype9BuildMismatchError
+from pype9.annotations import (
+    PYPE9_NS, BUILD_PROPS, BUILD_TRANS, TABULATED_ALIASES)
+from pype9.exceptions import Pype9BuildMismatchError, Pype9BuildError
 from unittest import TestCase  # @Reimport
 import pype9.utils.logging.handlers.sysout  # @UnusedImport
 
@@ -28,3 +35,96 @@ class TestSeeding(TestCase):
             Pype9BuildMismatchError,
             CellMetaClass,
             izhi2_wrap)
+
+    def test_build_profile(self):
+        izhi = ninemlcatalog.load('neuron/Izhikevich.xml#Izhikevich')
+        code_gen = CodeGenerator(build_profile='native')
+        self.assertIn('-march=native', code_gen.compile_flags)
+        self.assertIn('-flto', code_gen.link_flags)
+        self.assertNotEqual(code_gen, CodeGenerator(build_profile='debug'))
+        build_izhi = code_gen.transform_for_build(
+            name='IzhikevichNative', component_class=WithSynapses.wrap(izhi))
+        self.assertEqual(
+            build_izhi.annotations.get((BUILD_PROPS, PYPE9_NS),
+                                       'build_profile'), 'native')
+        # A change of profile makes the build class differ from the one saved
+        # with the generated source so 'lazy' builds regenerate and recompile
+        default_izhi = CodeGenerator().transform_for_build(
+            name='IzhikevichNative', component_class=WithSynapses.wrap(izhi))
+        self.assertFalse(build_izhi.equals(default_izhi,
+                                           annotations_ns=[PYPE9_NS]))
+        self.assertRaises(Pype9BuildError, CodeGenerator,
+                          build_profile='fastest')
+
+    def test_archive_spikes(self):
+        izhi = WithSynapses.wrap(
+            ninemlcatalog.load('neuron/Izhikevich.xml#Izhikevich'))
+        code_gen = CodeGenerator()
+        # No plastic synapses so spike history doesn't need to be archived
+        build_izhi = code_gen.transform_for_build(
+            name='IzhikevichNoArchive', component_class=izhi)
+        self.assertEqual(
+            build_izhi.annotations.get((BUILD_PROPS, PYPE9_NS),
+                                       'archive_spikes'), False)
+        build_izhi = code_gen.transform_for_build(
+            name='IzhikevichArchive', component_class=izhi,
+            archive_spikes=True)
+        self.assertEqual(
+            build_izhi.annotations.get((BUILD_PROPS, PYPE9_NS),
+                                       'archive_spikes'), True)
+
+    def test_tabulate(self):
+        dyn = WithSynapses.wrap(Dynamics(
+            name='TabulatedNa',
+            aliases=[
+                'm_alpha := m_A * (v - m_V0) / (1 - exp((m_V0 - v) / m_K))',
+                'm_beta := m_B * exp((m_V1 - v) / m_K1)',
+                'm_inf := m_alpha / (m_alpha + m_beta)',
+                'm_tau := 1 / (m_alpha + m_beta)',
+                'i_Na := g_Na * m * m * m * (E_Na - v)'],
+            regimes=[Regime('dm/dt = (m_inf - m) / m_tau',
+                            'dv/dt = (i_Na + i_ext) / C_m', name='R')],
+            state_variables=[StateVariable('m', dimension=un.dimensionless),
+                             StateVariable('v', dimension=un.voltage)],
+            parameters=[Parameter('g_Na', un.conductance),
+                        Parameter('E_Na', un.voltage),
+                        Parameter('C_m', un.capacitance)],
+            analog_ports=[AnalogReceivePort('i_ext', dimension=un.current)],
+            constants=[Constant('m_A', 0.1, un.unitless / un.mV / un.ms),
+                       Constant('m_V0', -40.03, un.mV),
+                       Constant('m_K', 10.0, un.mV),
+                       Constant('m_B', 4.0, un.unitless / un.ms),
+                       Constant('m_V1', -65.0, un.mV),
+                       Constant('m_K1', 18.0, un.mV)]))
+        code_gen = CodeGenerator()
+        build_dyn = code_gen.transform_for_build(
+            name='TabulatedNaBuild', component_class=dyn, tabulate=True,
+            table_v_step=0.5)
+        # 'i_Na' depends on state variables and parameters as well as 'v'
+        self.assertEqual(
+            build_dyn.annotations.get((BUILD_TRANS, PYPE9_NS),
+                                      TABULATED_ALIASES),
+            'm_alpha,m_beta,m_inf,m_tau')
+        self.assertEqual(
+            build_dyn.annotations.get((BUILD_PROPS, PYPE9_NS),
+                                      'table_v_step'), 0.5)
+        tabulation = code_gen.tabulation(build_dyn)
+        self.assertEqual(tabulation['voltage'], 'v')
+        self.assertEqual(tabulation['size'], 401)
+        errors = code_gen.tabulation_errors(build_dyn)
+        self.assertEqual(sorted(errors), ['m_alpha', 'm_beta', 'm_inf',
+                                          'm_tau'])
+        self.assertLess(max(errors.values()), 0.01)
+        # The build is not tabulated by default
+        self.assertIsNone(code_gen.tabulation(code_gen.transform_for_build(
+            name='UntabulatedNaBuild', component_class=dyn)))
+        self.assertRaises(
+            Pype9BuildError, code_gen.transform_for_build,
+            name='TabulatedNaBuild2', component_class=dyn, tabulate=True,
+            table_v_min=10.0, table_v_max=-10.0)
+        # Artificial NEURON cells have no membrane voltage to tabulate over
+        poisson = WithSynapses.wrap(ninemlcatalog.load('input/Poisson',
+                                                       'Poisson'))
+        self.assertRaises(
+            Pype9BuildError, NeuronCodeGenerator().transform_for_build,
+            name='TabulatedPoisson', component_class=poisson, tabulate=True)
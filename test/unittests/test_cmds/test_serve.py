@@ -0,0 +1,126 @@
+from __future__ import division
+import os.path
+import tempfile
+import shutil
+import time
+from multiprocessing import Process
+from multiprocessing.connection import Client as Connection
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import ninemlcatalog
+import nineml.units as un
+from pype9.cmd import serve
+from multiprocessing import AuthenticationError
+from pype9.server import Client, Server, load_authkey
+from pype9.exceptions import Pype9UsageError
+from pype9.utils.arguments import CATALOG_PREFIX
+from pype9.simulate.nest import (
+    Simulation as NESTSimulation,
+    CellMetaClass as NESTCellMetaClass)
+if __name__ == '__main__':
+    from pype9.utils.testing import DummyTestCase as TestCase  # @UnusedImport
+else:
+    from unittest import TestCase  # @Reimport
+
+
+class TestServe(TestCase):
+
+    izhi_path = 'neuron/Izhikevich#SampleIzhikevichFastSpiking'
+    t_stop = 100.0 * un.ms
+    dt = 0.01 * un.ms
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmpdir, 'pype9.sock')
+        self.authkey_path = os.path.join(self.tmpdir, 'authkey')
+        self.worker = Process(target=serve.run, args=(
+            ['nest', '--socket', self.socket, '--build_mode', 'lazy',
+             '--authkey_file', self.authkey_path, '--recv_timeout', '1'],))
+        self.worker.start()
+        # Wait for the worker to start listening
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.1)
+
+    def tearDown(self):
+        self.worker.join(10)
+        if self.worker.is_alive():
+            self.worker.terminate()
+        shutil.rmtree(self.tmpdir)
+
+    def test_serve(self):
+        props = ninemlcatalog.load(self.izhi_path)
+        with Client([self.socket], authkey_path=self.authkey_path) as client:
+            self.assertEqual(client.ping(self.socket), 'NEST')
+            results = list(client.simulate_many(
+                dict(model=CATALOG_PREFIX + self.izhi_path,
+                     duration=self.t_stop, dt=self.dt, record=['V'],
+                     regime='subthreshold_regime',
+                     properties={'a': a * un.unitless / un.ms},
+                     initial_values={'V': -65.0 * un.mV,
+                                     'U': -1.625 * un.pA}, seed=1)
+                for a in (0.2, 0.3)))
+            # Jobs submitted from more threads than there are workers wait
+            # for a free worker
+            pool = ThreadPool(3)
+            try:
+                concurrent = pool.map(
+                    lambda seed: client.simulate(
+                        CATALOG_PREFIX + self.izhi_path, 1.0 * un.ms,
+                        self.dt, ['V'], regime='subthreshold_regime',
+                        initial_values={'V': -65.0 * un.mV,
+                                        'U': -1.625 * un.pA}, seed=seed),
+                    range(3))
+            finally:
+                pool.close()
+                pool.join()
+            self.assertEqual(len(concurrent), 3)
+            client.shutdown()
+        self.assertEqual(len(results), 2)
+        # Compare against the same simulation run in this process
+        Izhikevich = NESTCellMetaClass(props.component_class)
+        with NESTSimulation(dt=self.dt, seed=1) as sim:
+            izhi = Izhikevich(props, regime_='subthreshold_regime',
+                              a=0.2 * un.unitless / un.ms,
+                              V=-65.0 * un.mV, U=-1.625 * un.pA)
+            izhi.record('V')
+            sim.run(self.t_stop)
+        v = izhi.recording('V')
+        self.assertTrue(np.allclose(results[0]['V'].times,
+                                    v.times.rescale('ms').magnitude))
+        self.assertTrue(np.allclose(results[0]['V'].signal,
+                                    v.magnitude.ravel()))
+        self.assertFalse(np.allclose(results[0]['V'].signal,
+                                     results[1]['V'].signal))
+
+    def test_multiple_clients(self):
+        client1 = Client([self.socket], authkey_path=self.authkey_path)
+        client2 = Client([self.socket], authkey_path=self.authkey_path)
+        # A client doesn't block other clients of the worker
+        self.assertEqual(client1.ping(self.socket), 'NEST')
+        self.assertEqual(client2.ping(self.socket), 'NEST')
+        self.assertEqual(client1.ping(self.socket), 'NEST')
+        # Connections that don't send a message are dropped after the
+        # receive timeout so they don't block the other clients
+        idle = Connection(self.socket,
+                          authkey=load_authkey(path=self.authkey_path))
+        try:
+            self.assertEqual(client2.ping(self.socket), 'NEST')
+        finally:
+            idle.close()
+        # Clients with the wrong key are rejected
+        with self.assertRaises(AuthenticationError):
+            Client([self.socket], authkey=b'wrong').ping(self.socket)
+        client2.shutdown()
+
+    def test_authkey(self):
+        # Generated keys are only readable by the user
+        self.assertEqual(os.stat(self.authkey_path).st_mode & 0o777, 0o600)
+        with self.assertRaises(Pype9UsageError):
+            Server('nest', address=('0.0.0.0', 6001))
+        with self.assertRaises(Pype9UsageError):
+            Client([self.socket],
+                   authkey_path=os.path.join(self.tmpdir, 'missing'))
+        Client([self.socket],
+               authkey_path=self.authkey_path).shutdown()
@@ -18,6 +18,7 @@ from pype9.simulate.nest import (
     Simulation as NESTSimulation,
     CellMetaClass as NESTCellMetaClass,
     Network as NetworkNEST)
+import nest
 import nineml
 import nineml.units as un
 if __name__ == '__main__':
@@ -217,7 +218,32 @@ class TestSimulateNetwork(TestCase):
                     "No spikes generated for '{}' population using {}."
                     .format(pop_name, simulator))
 
-    def _ref_network(self, simulator, external_input=None, **kwargs):
+    def test_network_threads(self, num_threads=2):
+        argv = (
+            "{model_url}#{model_name} nest {t_stop} {dt} "
+            "--record Exc.spike_output {tmpdir}/Exc-threads.neo.pkl "
+            "--build_mode force "
+            "--seed {seed} "
+            "--threads {threads}"
+            .format(model_url=self.reduced_brunel_path,
+                    model_name=self.brunel_name, tmpdir=self.tmpdir,
+                    t_stop=self.t_stop, dt=self.dt, seed=self.seed,
+                    threads=num_threads))
+        simulate.run(argv.split())
+        self.assertEqual(nest.GetKernelStatus('local_num_threads'),
+                         num_threads)
+        ref_recs = self._ref_network('nest', threads_per_proc=num_threads)
+        rec = neo.io.PickleIO(
+            '{}/Exc-threads.neo.pkl'.format(self.tmpdir)).read()[0].spiketrains
+        ref = ref_recs['Exc'].spiketrains
+        self.assertTrue(
+            all(all(c == f) for c, f in zip(rec, ref)),
+            "'simulate' command produced different results to api reference "
+            "for network using {} threads".format(num_threads))
+        self.assertGreater(sum(len(st) for st in rec), 0)
+
+    def _ref_network(self, simulator, external_input=None,
+                     threads_per_proc=1, **kwargs):
         if simulator == 'nest':
             NetworkClass = NetworkNEST
             Simulation = NESTSimulation
@@ -229,6 +255,7 @@ class TestSimulateNetwork(TestCase):
         model = nineml.read(self.reduced_brunel_path).as_network(
             'ReducedBrunel')
         with Simulation(dt=self.dt * un.ms, seed=self.seed,
+                        threads_per_proc=threads_per_proc,
                         **model.delay_limits()) as sim:
             network = NetworkClass(model, **kwargs)
             if external_input is not None:
@@ -126,6 +126,22 @@ class TestSeeding(TestCase):
                                     list(chain(*ext1_spikes.spiketrains)),
                                     list(chain(*ext4_spikes.spiketrains))))
 
+    def test_thread_seeds(self):
+        for Simulation in (NeuronSimulation, NESTSimulation):
+            seeds = Simulation._spawn_seeds(1, Simulation.DYNAMICS_STREAM, 8)
+            self.assertEqual(len(set(seeds)), 8,
+                             "Thread seeds are not unique")
+            # The seeds of the first threads shouldn't depend on the number
+            # of threads
+            self.assertEqual(
+                list(Simulation._spawn_seeds(1, Simulation.DYNAMICS_STREAM,
+                                             2)), list(seeds[:2]))
+            self.assertNotEqual(
+                list(Simulation._spawn_seeds(1, Simulation.PROPERTIES_STREAM,
+                                             8)), list(seeds))
+            self.assertTrue(all(0 <= s <= Simulation.max_seed
+                                for s in seeds))
+
     def _load_brunel(self, case, order):
         model = ninemlcatalog.load('network/Brunel2000/' + case).as_network(
             'Brunel_{}'.format(case))
@@ -2,7 +2,12 @@
 from __future__ import print_function
 from __future__ import division
 from builtins import zip
+import os
 import sys
+import shutil
+import tempfile
+import numpy
+import neo
 import quantities as pq
 from itertools import chain, repeat
 import logging
@@ -13,7 +18,8 @@ from nineml.user.multi.dynamics import MultiDynamics
 from nineml.user import DynamicsProperties
 from pype9.simulate.common.cells import (
     MultiDynamicsWithSynapses, DynamicsWithSynapsesProperties,
-    ConnectionParameterSet, ConnectionPropertySet)
+    ConnectionParameterSet, ConnectionPropertySet, Mean)
+from pype9.simulate.common.stream import MemoryStore
 from pype9.simulate.neuron import (
     CellMetaClass as NeuronCellMetaClass,
     Simulation as NeuronSimulation)
@@ -22,7 +28,10 @@ from pype9.simulate.nest import (  # @IgnorePep8
     CellMetaClass as NESTCellMetaClass,
     Simulation as NESTSimulation)
 from pype9.utils.testing import Comparer, input_step, input_freq  # @IgnorePep8
+from pype9.exceptions import (  # @IgnorePep8
+    Pype9AttributeError, Pype9DimensionError, Pype9UsageError)
 from pype9.simulate.nest.units import UnitHandler as UnitHandlerNEST  # @IgnorePep8
+from pype9.annotations import PYPE9_NS, TIME_PROPS, ABSOLUTE_TIME  # @IgnorePep8
 import pype9.utils.logging.handlers.sysout  # @IgnorePep8
 if __name__ == '__main__':
     from pype9.utils.testing import DummyTestCase as TestCase  # @UnusedImport
@@ -392,6 +401,598 @@ class TestDynamics(TestCase):
                 comparisons[('9ML-nest', '9ML-neuron')], 0.4 * pq.mV,
                 "Izhikevich 2007 NEURON 9ML simulation did not match NEST 9ML")
 
+    def test_accessors(self, simulators=SIMULATORS_TO_TEST,
+                       build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            self.assertEqual(
+                set(celltype._accessors),
+                set(chain(nineml_model.parameter_names,
+                          nineml_model.state_variable_names)))
+            if sim_name == 'neuron':
+                Simulation = NeuronSimulation(dt=0.1 * un.ms)
+            else:
+                Simulation = NESTSimulation(dt=0.1 * un.ms)
+            with Simulation:
+                cell = celltype(properties, regime_='subthreshold',
+                                **self.liaf_initial_states)
+                # Set in units other than the simulator units
+                cell.v = -0.06 * un.V
+                self.assertAlmostEqual(float(cell.v.rescale(pq.mV)), -60.0)
+                cell.v = -55.0 * pq.mV
+                self.assertAlmostEqual(float(cell.v.rescale(pq.mV)), -55.0)
+                cell.tau = 0.025 * un.s
+                self.assertAlmostEqual(float(cell.tau.rescale(pq.ms)), 25.0)
+                self.assertEqual(cell.property('tau').quantity, 0.025 * un.s)
+                self.assertRaises(Pype9DimensionError, setattr, cell, 'tau',
+                                  1.0 * un.mV)
+                self.assertRaises(Pype9AttributeError, getattr, cell,
+                                  'not_a_variable')
+
+    def test_bulk_vectors(self, simulators=SIMULATORS_TO_TEST,
+                          build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            if sim_name == 'neuron':
+                Simulation = NeuronSimulation(dt=0.1 * un.ms)
+            else:
+                Simulation = NESTSimulation(dt=0.1 * un.ms)
+            with Simulation:
+                cell = celltype(properties, regime_='subthreshold',
+                                **self.liaf_initial_states)
+                state = cell.get_state_vector()
+                self.assertEqual(len(state), len(cell.state_vector_names))
+                v_index = cell.state_vector_names.index('v')
+                self.assertAlmostEqual(state[v_index], -65.0)
+                state[v_index] = -60.0
+                cell.set_state_vector(state)
+                self.assertAlmostEqual(float(cell.v.rescale(pq.mV)), -60.0)
+                self.assertAlmostEqual(cell.get_state_vector()[v_index],
+                                       -60.0)
+                params = cell.get_params()
+                self.assertEqual(set(params),
+                                 set(nineml_model.parameter_names))
+                cell.set_params({'tau': 25.0, 'v_reset': -0.07 * un.V})
+                params = cell.get_params()
+                self.assertAlmostEqual(params['tau'], 25.0)
+                self.assertAlmostEqual(params['v_reset'], -70.0)
+                self.assertEqual(cell.property('tau').quantity, 25.0 * un.ms)
+                self.assertRaises(Pype9UsageError, cell.set_state_vector,
+                                  state[:-1])
+                self.assertRaises(Pype9AttributeError, cell.set_params,
+                                  {'v': -60.0})
+
+    def test_lazy(self, simulators=SIMULATORS_TO_TEST,
+                  build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            if sim_name == 'neuron':
+                Simulation = NeuronSimulation(dt=0.1 * un.ms)
+            else:
+                Simulation = NESTSimulation(dt=0.1 * un.ms)
+            with Simulation:
+                cell = celltype(properties, regime_='subthreshold', lazy_=True,
+                                **self.liaf_initial_states)
+                self.assertTrue(cell.lazy)
+                self.assertIsNone(cell._nineml_props)
+                self.assertAlmostEqual(float(cell.v.rescale(pq.mV)), -65.0)
+                cell.tau = 0.025 * un.s
+                self.assertAlmostEqual(float(cell.tau.rescale(pq.ms)), 25.0)
+                self.assertIsNone(cell._nineml_props)
+                # Properties are constructed on demand
+                self.assertEqual(cell.property('tau').quantity, 25.0 * un.ms)
+                self.assertEqual(
+                    cell.property('v_threshold').quantity,
+                    properties.property('v_threshold').quantity)
+                self.assertEqual(
+                    set(iv.name for iv in cell.initial_values),
+                    set(nineml_model.state_variable_names))
+                # and are invalidated when a value is set
+                cell.v = -60.0 * pq.mV
+                self.assertIsNone(cell._nineml_props)
+                initial_values = dict((iv.name, iv.quantity)
+                                      for iv in cell.initial_values)
+                self.assertEqual(initial_values['v'], -60.0 * un.mV)
+                # Values missing from both the prototype and keyword args
+                missing_states = dict(self.liaf_initial_states)
+                del missing_states['v']
+                self.assertRaises(
+                    Pype9UsageError, celltype, properties,
+                    regime_='subthreshold', lazy_=True, **missing_states)
+
+    def test_batch(self, simulators=SIMULATORS_TO_TEST,
+                   build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        taus = [5.0, 10.0, 20.0] * pq.ms
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            if sim_name == 'neuron':
+                Simulation = NeuronSimulation(dt=0.1 * un.ms)
+            else:
+                Simulation = NESTSimulation(dt=0.1 * un.ms)
+            with Simulation as sim:
+                batch = celltype.create_batch(
+                    {'tau': taus, 'v': -60.0 * pq.mV,
+                     'end_refractory': 0.0 * pq.ms},
+                    regime_='subthreshold', prototype_=properties)
+                self.assertEqual(len(batch), len(taus))
+                self.assertTrue(all(batch.get('tau') == taus))
+                batch.record('v')
+                sim.run(20.0 * un.ms)
+                first_trial = batch.recording('v')
+                # A second trial should repeat the first one
+                sim.reset()
+                sim.run(20.0 * un.ms)
+            v = batch.recording('v')
+            self.assertEqual(v.shape, first_trial.shape)
+            self.assertTrue(numpy.allclose(numpy.asarray(v),
+                                           numpy.asarray(first_trial)))
+            self.assertEqual(v.shape[0], len(taus))
+            self.assertEqual(v.shape[1], len(batch.recording_times('v')))
+            # All instances decay towards the leak reversal potential, the
+            # ones with the shorter time constants more quickly
+            e_leak = float(properties.property('e_leak').quantity.in_units(
+                un.mV))
+            dist = numpy.abs(numpy.asarray(v.rescale(pq.mV))[:, -1] - e_leak)
+            self.assertTrue(all(dist[:-1] < dist[1:]),
+                            "Membrane voltages of batch instances did not "
+                            "decay in order of their time constants ({})"
+                            .format(dist))
+            # Batches are recorded at the given interval by every simulator
+            sim_class = (NeuronSimulation if sim_name == 'neuron'
+                         else NESTSimulation)
+            with sim_class(dt=0.1 * un.ms) as sim:
+                batch = celltype.create_batch(
+                    {'tau': taus, 'v': -60.0 * pq.mV,
+                     'end_refractory': 0.0 * pq.ms},
+                    regime_='subthreshold', prototype_=properties)
+                batch.record('v', interval=1.0 * un.ms)
+                sim.run(20.0 * un.ms)
+            times = numpy.asarray(batch.recording_times('v').rescale(pq.ms))
+            self.assertTrue(numpy.allclose(numpy.diff(times), 1.0))
+            self.assertEqual(batch.recording('v').shape,
+                             (len(taus), len(times)))
+
+    def test_recording_cache(self, simulators=SIMULATORS_TO_TEST,
+                             build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            recordings = []
+            for dtype in (None, numpy.float32):
+                with Simulation(dt=0.1 * un.ms,
+                                recording_dtype=dtype) as sim:
+                    cell = celltype(properties, regime_='subthreshold',
+                                    v=-60.0 * pq.mV,
+                                    end_refractory=0.0 * pq.ms)
+                    cell.record('v')
+                    sim.run(20.0 * un.ms)
+                # Recordings are read from the cache after the simulator-side
+                # recorders have been freed
+                self.assertEqual(cell._recorders, {})
+                recordings.append(cell.recording('v'))
+            self.assertEqual(recordings[0].dtype, numpy.float64)
+            self.assertEqual(recordings[1].dtype, numpy.float32)
+            self.assertTrue(numpy.allclose(
+                numpy.asarray(recordings[0]),
+                numpy.asarray(recordings[1]), rtol=1e-6))
+
+    def test_recording_views(self, build_mode=BUILD_MODE_DEFAULT,
+                             **kwargs):  # @UnusedVariable
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        celltype = NeuronCellMetaClass(nineml_model, build_mode=build_mode)
+        with NeuronSimulation(dt=0.1 * un.ms) as sim:
+            cell = celltype(properties, regime_='subthreshold',
+                            v=-60.0 * pq.mV, end_refractory=0.0 * pq.ms)
+            cell.record('v')
+            sim.run(20.0 * un.ms)
+            live_view = cell.recording('v', copy=False)
+            self.assertTrue(numpy.shares_memory(
+                live_view, cell._recordings['v'].as_numpy()))
+            # The default path copies the recorded data so the returned
+            # signal is unaffected by continuing the simulation
+            live_copy = cell.recording('v')
+            self.assertIsInstance(live_copy, neo.AnalogSignal)
+            self.assertFalse(numpy.shares_memory(
+                live_copy, cell._recordings['v'].as_numpy()))
+            copied_values = numpy.array(live_copy)
+            sim.run(30.0 * un.ms)
+            self.assertTrue(numpy.array_equal(numpy.asarray(live_copy),
+                                              copied_values))
+        view = cell.recording('v', copy=False)
+        copied = cell.recording('v')
+        self.assertTrue(numpy.shares_memory(view, cell._cache['v'][0]))
+        self.assertFalse(numpy.shares_memory(copied, cell._cache['v'][0]))
+        self.assertTrue(numpy.array_equal(numpy.asarray(view),
+                                          numpy.asarray(copied)))
+
+    def test_stream_recordings(self, simulators=SIMULATORS_TO_TEST,
+                               build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/Izhikevich',
+                                          'Izhikevich')
+        properties = ninemlcatalog.load('neuron/Izhikevich',
+                                        'SampleIzhikevich')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            stream_dir = tempfile.mkdtemp()
+            try:
+                recordings = []
+                for stream_to in (None, stream_dir):
+                    with Simulation(dt=0.1 * un.ms, stream_to=stream_to,
+                                    stream_interval=5.0 * un.ms) as sim:
+                        cell = celltype(properties,
+                                        regime_='subthreshold_regime',
+                                        V=-65.0 * pq.mV,
+                                        U=-14.0 * pq.mV / pq.ms)
+                        cell.record('V')
+                        cell.record('spike')
+                        sim.run(100.0 * un.ms)
+                    recordings.append((cell.recording('V'),
+                                       cell.recording('spike')))
+                self.assertTrue(os.listdir(stream_dir))
+                (v, spikes), (streamed_v, streamed_spikes) = recordings
+                self.assertEqual(v.shape, streamed_v.shape)
+                self.assertTrue(numpy.allclose(numpy.asarray(v),
+                                               numpy.asarray(streamed_v)))
+                self.assertTrue(numpy.allclose(numpy.asarray(spikes),
+                                               numpy.asarray(streamed_spikes)))
+                # Batches recorded through shared devices can't be streamed
+                with Simulation(dt=0.1 * un.ms, stream_to=stream_dir,
+                                stream_interval=5.0 * un.ms) as sim:
+                    batch = celltype.create_batch(
+                        {'V': [-65.0, -60.0] * pq.mV,
+                         'U': -14.0 * pq.mV / pq.ms},
+                        regime_='subthreshold_regime', prototype_=properties)
+                    batch.record('V')
+                    if batch.STREAMS_RECORDINGS:
+                        sim.run(10.0 * un.ms)
+                    else:
+                        self.assertRaises(Pype9UsageError, sim.run,
+                                          10.0 * un.ms)
+            finally:
+                shutil.rmtree(stream_dir)
+
+    def test_reduced_recordings(self, simulators=SIMULATORS_TO_TEST,
+                                build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            with Simulation(dt=0.1 * un.ms) as sim:
+                cell = celltype(properties, regime_='subthreshold',
+                                v=-60.0 * pq.mV, end_refractory=0.0 * pq.ms)
+                cell.record('v')
+                sim.run(20.0 * un.ms)
+            full = cell.recording('v')
+            full_times = numpy.asarray(full.times.rescale(pq.ms))
+            full = numpy.asarray(full).ravel()
+            with Simulation(dt=0.1 * un.ms) as sim:
+                cell = celltype(properties, regime_='subthreshold',
+                                v=-60.0 * pq.mV, end_refractory=0.0 * pq.ms)
+                cell.record('v', interval=1.0 * un.ms)
+                sim.run(20.0 * un.ms)
+            decimated = cell.recording('v')
+            self.assertEqual(decimated.sampling_period, 1.0 * pq.ms)
+            # Compare with the full resolution recording at the same times
+            indices = numpy.searchsorted(
+                full_times,
+                numpy.asarray(decimated.times.rescale(pq.ms)) - 1e-6)
+            self.assertTrue(numpy.allclose(
+                numpy.asarray(decimated).ravel(), full[indices]))
+            with Simulation(dt=0.1 * un.ms,
+                            stream_interval=5.0 * un.ms) as sim:
+                cell = celltype(properties, regime_='subthreshold',
+                                v=-60.0 * pq.mV, end_refractory=0.0 * pq.ms)
+                cell.record('v', reducer=Mean(2.0 * un.ms))
+                sim.run(20.0 * un.ms)
+            # The recording is reduced into memory after each chunk
+            self.assertIsInstance(sim.stream, MemoryStore)
+            mean = cell.recording('v')
+            self.assertEqual(mean.sampling_period, 2.0 * pq.ms)
+            self.assertTrue(numpy.allclose(
+                numpy.asarray(mean).ravel(),
+                full[:len(mean) * 20].reshape((-1, 20)).mean(axis=1)))
+
+    def test_stream_reduced_recordings(self, simulators=SIMULATORS_TO_TEST,
+                                       build_mode=BUILD_MODE_DEFAULT,
+                                       **kwargs):  # @UnusedVariable
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            stream_dir = tempfile.mkdtemp()
+            try:
+                recordings = []
+                for stream_to in (None, stream_dir):
+                    # The reducer window doesn't divide the stream interval
+                    # so samples are carried over between flushes
+                    with Simulation(dt=0.1 * un.ms, stream_to=stream_to,
+                                    stream_interval=5.0 * un.ms) as sim:
+                        cell = celltype(properties, regime_='subthreshold',
+                                        v=-65.0 * pq.mV,
+                                        end_refractory=0.0 * pq.ms)
+                        cell.play(*input_step('i_synaptic', 1, 5, 50, 0.1,
+                                              1))
+                        cell.record('v', reducer=Mean(3.0 * un.ms))
+                        sim.run(50.0 * un.ms)
+                    recordings.append(cell.recording('v'))
+                mean, streamed_mean = recordings
+                self.assertEqual(mean.shape, streamed_mean.shape)
+                self.assertTrue(numpy.allclose(numpy.asarray(mean),
+                                               numpy.asarray(streamed_mean)))
+            finally:
+                shutil.rmtree(stream_dir)
+
+    def test_shared_multimeter(self, build_mode=BUILD_MODE_DEFAULT,
+                               **kwargs):  # @UnusedVariable
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        celltype = NESTCellMetaClass(nineml_model, build_mode=build_mode)
+        initial_vs = [-70.0, -65.0, -60.0] * pq.mV
+        with NESTSimulation(dt=0.1 * un.ms) as sim:
+            cells = []
+            for v in initial_vs:
+                cell = celltype(properties, regime_='subthreshold', v=v,
+                                end_refractory=0.0 * pq.ms)
+                cell.record('v')
+                cell.record('end_refractory')
+                cells.append(cell)
+            v_only = celltype(properties, regime_='subthreshold',
+                              v=initial_vs[0], end_refractory=0.0 * pq.ms)
+            v_only.record('v')
+            sim.run(20.0 * un.ms)
+            # All cells are recorded by a single multimeter
+            self.assertEqual(len(sim._multimeters), 1)
+            multimeter = next(iter(sim._multimeters.values()))
+            # with a separate device for each set of recorded variables so
+            # cells only record the variables requested for them
+            self.assertEqual(
+                sorted(sorted(v) for _, v in multimeter._devices),
+                sorted([sorted([celltype.build_name('v'),
+                                celltype.build_name('end_refractory')]),
+                        [celltype.build_name('v')]]))
+            v_only.recording('v')
+            self.assertNotIn(
+                (v_only._cell[0], celltype.build_name('end_refractory')),
+                multimeter._buffers)
+            self.assertTrue(numpy.array_equal(
+                numpy.asarray(v_only.recording('v')),
+                numpy.asarray(cells[0].recording('v'))))
+        for v, cell in zip(initial_vs, cells):
+            with NESTSimulation(dt=0.1 * un.ms) as sim:
+                ref = celltype(properties, regime_='subthreshold', v=v,
+                               end_refractory=0.0 * pq.ms)
+                ref.record('v')
+                sim.run(20.0 * un.ms)
+            self.assertTrue(numpy.array_equal(
+                numpy.asarray(cell.recording('v')),
+                numpy.asarray(ref.recording('v'))))
+            self.assertEqual(len(cell.recording('end_refractory')),
+                             len(ref.recording('v')))
+
+    def test_regime_log(self, simulators=SIMULATORS_TO_TEST,
+                        build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            with Simulation(dt=0.1 * un.ms) as sim:
+                cell = celltype(properties, regime_='subthreshold',
+                                v=-65.0 * pq.mV, end_refractory=0.0 * pq.ms)
+                cell.play(*input_step('i_synaptic', 1, 5, 50, 0.1, 1))
+                cell.record('spike_output')
+                cell.record_regime()
+                sim.run(50.0 * un.ms)
+            spikes = numpy.asarray(cell.recording('spike_output'))
+            self.assertGreater(len(spikes), 1)
+            epochs = cell.regime_epochs()
+            self.assertIn(len(epochs), (2 * len(spikes), 2 * len(spikes) + 1))
+            # Only the (time, regime) pairs of the transitions are stored
+            self.assertEqual(
+                len(cell._cache[cell.code_generator.REGIME_VARNAME][0]),
+                2 * (len(epochs) - 1))
+            self.assertEqual(epochs.labels[0], 'subthreshold')
+            self.assertEqual(epochs.times[0], 0.0 * pq.ms)
+            refractory = epochs.labels == 'refractory'
+            self.assertTrue(numpy.all(epochs.labels[1::2] == 'refractory'))
+            self.assertTrue(numpy.all(epochs.labels[::2] == 'subthreshold'))
+            # Refractory periods start at each spike and last 2 ms
+            self.assertTrue(numpy.allclose(
+                numpy.asarray(epochs.times[refractory].rescale(pq.ms)),
+                spikes, atol=0.1))
+            self.assertTrue(numpy.allclose(
+                numpy.asarray(
+                    epochs.durations[refractory][:-1].rescale(pq.ms)),
+                2.0, atol=0.1))
+
+    def test_checkpoint(self, simulators=SIMULATORS_TO_TEST,
+                        build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire').clone()
+        # Mark the end of the refractory period as an absolute time so it is
+        # shifted by the time of the checkpoint in the restored simulation
+        nineml_model.state_variable('end_refractory').annotations.set(
+            (TIME_PROPS, PYPE9_NS), ABSOLUTE_TIME, True)
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for sim_name in simulators:
+                meta_class = cell_metaclasses[sim_name]
+                celltype = meta_class(nineml_model, build_mode=build_mode,
+                                      build_version='Checkpoint')
+                Simulation = (NeuronSimulation if sim_name == 'neuron'
+                              else NESTSimulation)
+                path = os.path.join(tmp_dir, sim_name + '.pkl')
+
+                def run(t_stop, restore=False, reducer=None, **kwargs):
+                    with Simulation(dt=0.1 * un.ms) as sim:
+                        if restore:
+                            sim.restore(path)
+                        cell = celltype(properties, regime_='subthreshold',
+                                        v=-65.0 * pq.mV,
+                                        end_refractory=0.0 * pq.ms)
+                        cell.play(*input_step('i_synaptic', 1, 5, 50, 0.1,
+                                              1))
+                        cell.record('v', reducer=reducer)
+                        cell.record('spike_output')
+                        cell.record_regime()
+                        sim.run(t_stop, **kwargs)
+                    return cell
+                ref = run(50.0 * un.ms)
+                run(25.0 * un.ms, checkpoint_every=25.0 * un.ms,
+                    checkpoint_path=path)
+                self.assertTrue(os.path.exists(path))
+                restored = run(50.0 * un.ms, restore=True)
+                ref_spikes = numpy.asarray(ref.recording('spike_output'))
+                spikes = numpy.asarray(restored.recording('spike_output'))
+                self.assertGreater(len(ref_spikes), 1)
+                self.assertEqual(len(spikes), len(ref_spikes))
+                self.assertTrue(numpy.allclose(spikes, ref_spikes, atol=0.1))
+                ref_v = ref.recording('v')
+                v = restored.recording('v')
+                self.assertEqual(len(v), len(ref_v))
+                self.assertTrue(numpy.allclose(
+                    numpy.asarray(v.times.rescale(pq.ms)),
+                    numpy.asarray(ref_v.times.rescale(pq.ms))))
+                # The first epoch is labelled with the initial regime of the
+                # cell and not the regime it was restored into
+                ref_epochs = ref.regime_epochs()
+                epochs = restored.regime_epochs()
+                self.assertGreater(len(ref_epochs), 2)
+                self.assertEqual(list(epochs.labels), list(ref_epochs.labels))
+                self.assertTrue(numpy.allclose(
+                    numpy.asarray(epochs.times.rescale(pq.ms)),
+                    numpy.asarray(ref_epochs.times.rescale(pq.ms)),
+                    atol=0.1))
+                self.assertEqual(
+                    [restored.state_vector_names[i]
+                     for i in restored._absolute_time_indices()],
+                    ['end_refractory'])
+                # The 251 samples recorded up to the checkpoint leave an
+                # incomplete final window of 2 ms, whereas they fill the
+                # final window of 25.1 ms
+                for window in (2.0, 25.1):
+                    ref = run(50.0 * un.ms, reducer=Mean(window * un.ms))
+                    run(25.0 * un.ms, checkpoint_every=25.0 * un.ms,
+                        checkpoint_path=path, reducer=Mean(window * un.ms))
+                    restored = run(50.0 * un.ms, restore=True,
+                                   reducer=Mean(window * un.ms))
+                    ref_v = ref.recording('v')
+                    v = restored.recording('v')
+                    self.assertEqual(len(v), len(ref_v))
+                    self.assertTrue(numpy.allclose(
+                        numpy.asarray(v), numpy.asarray(ref_v), atol=0.1))
+            # The state of the random stream of NEST cells can't be saved
+            if 'nest' in simulators:
+                poisson = cell_metaclasses['nest'](
+                    ninemlcatalog.load('input/Poisson', 'Poisson'),
+                    build_mode=build_mode)
+                with NESTSimulation(dt=0.1 * un.ms) as sim:
+                    poisson(rate=100 * un.Hz, t_next=0.0 * un.ms)
+                    self.assertRaises(
+                        Pype9UsageError, sim.run, 10.0 * un.ms,
+                        checkpoint_every=5.0 * un.ms,
+                        checkpoint_path=os.path.join(tmp_dir, 'poisson.pkl'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_reset(self, simulators=SIMULATORS_TO_TEST,
+                   build_mode=BUILD_MODE_DEFAULT, **kwargs):  # @UnusedVariable @IgnorePep8
+        nineml_model = ninemlcatalog.load('neuron/LeakyIntegrateAndFire',
+                                          'PyNNLeakyIntegrateAndFire')
+        properties = ninemlcatalog.load(
+            'neuron/LeakyIntegrateAndFire',
+            'PyNNLeakyIntegrateAndFireProperties')
+        for sim_name in simulators:
+            meta_class = cell_metaclasses[sim_name]
+            celltype = meta_class(nineml_model, build_mode=build_mode)
+            Simulation = (NeuronSimulation if sim_name == 'neuron'
+                          else NESTSimulation)
+            trials = []
+            with Simulation(dt=0.1 * un.ms) as sim:
+                cell = celltype(properties, regime_='subthreshold',
+                                v=-65.0 * pq.mV, end_refractory=0.0 * pq.ms)
+                cell.play(*input_step('i_synaptic', 1, 5, 50, 0.1, 1))
+                cell.record('v')
+                cell.record('spike_output')
+                cell.record_regime()
+                for _ in range(3):
+                    sim.run(50.0 * un.ms)
+                    trials.append((cell.recording('v'),
+                                   cell.recording('spike_output'),
+                                   cell.regime_epochs()))
+                    sim.reset()
+            ref_v, ref_spikes, ref_epochs = trials[0]
+            self.assertGreater(len(ref_spikes), 1)
+            # Each trial should repeat the first one
+            for v, spikes, epochs in trials[1:]:
+                self.assertEqual(len(v), len(ref_v))
+                self.assertTrue(numpy.allclose(numpy.asarray(v),
+                                               numpy.asarray(ref_v)))
+                self.assertTrue(numpy.allclose(numpy.asarray(spikes),
+                                               numpy.asarray(ref_spikes)))
+                self.assertEqual(list(epochs.labels), list(ref_epochs.labels))
+
     def test_poisson(self, duration=100 * un.s, rate=100 * un.Hz,
                      t_next=0.0 * un.ms, print_comparisons=False, dt=0.1,
                      simulators=SIMULATORS_TO_TEST,
@@ -0,0 +1,82 @@
+from __future__ import division
+from __future__ import print_function
+import ninemlcatalog
+import numpy
+import quantities as pq
+from nineml import units as un
+from nineml.abstraction import Dynamics, Regime, StateVariable, Parameter
+from pype9.sweep import Sweep, grid
+from pype9.simulate.nest import (
+    CellMetaClass as NESTCellMetaClass, Simulation as NESTSimulation)
+import pype9.utils.logging.handlers.sysout  # @UnusedImport
+if __name__ == '__main__':
+    from pype9.utils.testing import DummyTestCase as TestCase  # @UnusedImport
+else:
+    from unittest import TestCase  # @Reimport
+
+
+def final_voltage(point, recordings):  # @UnusedVariable
+    return float(recordings['v'][-1])
+
+
+class TestSweep(TestCase):
+
+    liaf_path = ('neuron/LeakyIntegrateAndFire#'
+                 'SampleLeakyIntegrateAndFire')
+
+    def test_grid(self):
+        points = grid(tau=[10.0, 20.0] * pq.ms,
+                      v=un.Quantity([-65.0, -60.0, -55.0], un.mV))
+        self.assertEqual(len(points), 6)
+        self.assertEqual(points[0], {'tau': 10.0 * pq.ms,
+                                     'v': -65.0 * un.mV})
+        self.assertEqual(points[-1], {'tau': 20.0 * pq.ms,
+                                      'v': -55.0 * un.mV})
+
+    def test_nest_sweep(self):
+        properties = ninemlcatalog.load(self.liaf_path)
+        points = grid(tau=[10.0, 20.0, 30.0] * pq.ms,
+                      v=[-65.0, -55.0] * pq.mV)
+        sweep = Sweep(properties, 'nest', duration=10.0 * un.ms,
+                      dt=0.1 * un.ms, record=['v'], regime='subthreshold',
+                      reducer=final_voltage, seed=12345, processes=2,
+                      chunk_size=2, build_args={'build_version': 'Sweep'})
+        results = sorted(sweep.run(points), key=lambda r: r.index)
+        self.assertEqual([r.index for r in results], list(range(len(points))))
+        self.assertEqual([r.seed for r in results], sweep.seeds(len(points)))
+        # Compare against the same simulations run serially
+        LIAF = NESTCellMetaClass(properties.component_class,
+                                 build_version='Sweep')
+        for result, point in zip(results, points):
+            with NESTSimulation(dt=0.1 * un.ms, seed=result.seed) as sim:
+                cell = LIAF(properties, regime_='subthreshold', **point)
+                cell.record('v')
+                sim.run(10.0 * un.ms)
+            self.assertAlmostEqual(result.recordings,
+                                   final_voltage(point,
+                                                 {'v': cell.recording('v')}))
+        self.assertFalse(numpy.allclose([r.recordings for r in results[:2]],
+                                        [r.recordings for r in results[2:4]]))
+
+    def test_nest_sweep_generated_model(self):
+        # Models constructed in code don't have a URL so they are built in
+        # the 'generated' build directory, where the workers need to find
+        # them
+        model = Dynamics(
+            name='SweepLeak',
+            regimes=[Regime('dv/dt = (e_leak - v) / tau', name='R')],
+            state_variables=[StateVariable('v', dimension=un.voltage)],
+            parameters=[Parameter('tau', dimension=un.time),
+                        Parameter('e_leak', dimension=un.voltage)])
+        self.assertIsNone(model.url)
+        points = grid(tau=[5.0, 20.0] * pq.ms, e_leak=[-60.0] * pq.mV,
+                      v=[-65.0] * pq.mV)
+        sweep = Sweep(model, 'nest', duration=10.0 * un.ms, dt=0.1 * un.ms,
+                      record=['v'], reducer=final_voltage, seed=12345,
+                      processes=2, build_mode='lazy')
+        results = sorted(sweep.run(points), key=lambda r: r.index)
+        self.assertEqual([r.index for r in results], list(range(len(points))))
+        final_vs = [r.recordings for r in results]
+        self.assertTrue(all(-65.0 < v < -60.0 for v in final_vs))
+        # The voltage decays more quickly with the shorter time constant
+        self.assertGreater(final_vs[0], final_vs[1])
@@ -10,6 +10,7 @@ from nineml.abstraction import (
     Dynamics, AnalogReceivePort, Parameter, Regime, Expression, Constant,
     StateVariable)
 import numpy
+import quantities as pq
 from nineml.units import Quantity
 import pype9.utils.logging.handlers.sysout  # @UnusedImport
 if __name__ == '__main__':
@@ -142,6 +143,47 @@ class TestUnitAssignment(TestCase):
                              "Dimensions do not match original conversion of "
                              "unit '{}'".format(unit))
 
+    def test_integer_power_lookup(self):
+        TestUnitHandler1.clear_cache()
+        base = (un.mM * un.um ** 3 * un.cd).dimension
+        for power in (-2, 2, -1, 3):
+            exponent, compound = TestUnitHandler1.dimension_to_units_compound(
+                base ** power)
+            base_exponent, base_compound = (
+                TestUnitHandler1.dimension_to_units_compound(base))
+            self.assertEqual(exponent, base_exponent * power)
+            self.assertEqual(compound,
+                             [(u, p * power) for u, p in base_compound])
+        # Repeated calls are memoised but return a new list each time
+        compound = TestUnitHandler1.dimension_to_units_compound(base)[1]
+        compound.append((un.ms, -1))
+        self.assertNotEqual(
+            compound, TestUnitHandler1.dimension_to_units_compound(base)[1])
+
+    def test_persistent_cache(self):
+        dimension = (un.K ** 3 / (un.cd * un.mV)).dimension
+        cache_path = TestUnitHandler1._cache_path(TestUnitHandler1.basis,
+                                                  TestUnitHandler1.compounds)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        TestUnitHandler1.clear_cache()
+        TestUnitHandler1.dimension_to_units_compound(dimension)
+        # New projections are only written when the cache is saved
+        self.assertFalse(os.path.exists(cache_path))
+        TestUnitHandler1.save_cache()
+        # Check the projection was saved to the cache file
+        cache = TestUnitHandler1._load_cache(TestUnitHandler1.basis,
+                                             TestUnitHandler1.compounds)
+        self.assertIn(tuple(dimension), cache)
+        self.assertEqual(list(cache[tuple(dimension)]),
+                         list(TestUnitHandler1.cache[tuple(dimension)]))
+        # Check that different bases are saved to different files
+        self.assertNotEqual(
+            TestUnitHandler1._cache_path(TestUnitHandler1.basis,
+                                         TestUnitHandler1.compounds),
+            TestUnitHandler2._cache_path(TestUnitHandler2.basis,
+                                         TestUnitHandler2.compounds))
+
     def test_scaling_and_assignment(self):
         handler1 = TestUnitHandler1(self.a)
         handler2 = NestUnitHandler(self.a)
@@ -168,6 +210,20 @@ class TestUnitAssignment(TestCase):
         self.assertEqual(handler1.assign_units_to_variable('P2'), '1/uS')
         self.assertEqual(handler1.assign_units_to_variable('P6'), 'um^2')
 
+    def test_scaling_memoisation(self):
+        handler = TestUnitHandler1(self.a)
+        scaled, units = handler.scale_alias('A6')
+        self.assertEqual(scaled.rhs_cstr, '0.001*P9/P10')
+        # Modifying the returned expression shouldn't affect the memo
+        scaled.subs('P9', 'P10')
+        self.assertEqual(handler.scale_alias('A6'),
+                         (Expression('1e-3 * P9/P10'), units))
+        self.assertEqual(handler.scale_alias('A6')[0].rhs_cstr,
+                         '0.001*P9/P10')
+        td = self.a.regime('R1').element('SV3')
+        self.assertIs(handler.scale_time_derivative(td)[0].rhs,
+                      handler.scale_time_derivative(td)[0].rhs)
+
     def test_pq_round_trip(self):
         for unit in self.test_units:
             qty = Quantity(1.0, unit)
@@ -182,6 +238,27 @@ class TestUnitAssignment(TestCase):
                              "scale ({} -> {})".format(unit.name, unit.power,
                                                        new_power))
 
+    def test_batch_conversion(self):
+        pq_values = pq.Quantity([1.0, 2.0, 3.0], 'mV/uF')
+        scaled = TestUnitHandler1.scale_values(pq_values)
+        self.assertEqual(list(scaled),
+                         [TestUnitHandler1.scale_value(v) for v in pq_values])
+        qty = TestUnitHandler1.from_pq_quantities(pq_values)
+        self.assertEqual(qty.value.nineml_type, 'ArrayValue')
+        self.assertEqual(list(TestUnitHandler1.scale_values(qty)),
+                         list(scaled))
+        self.assertEqual(
+            list(TestUnitHandler1.scale_values([1.0, 2.0, 3.0],
+                                               units=qty.units)),
+            list(scaled))
+        round_trip = TestUnitHandler1.to_pq_quantities(qty)
+        self.assertTrue(numpy.allclose(
+            numpy.asarray(round_trip.rescale('mV/uF')),
+            numpy.asarray(pq_values)))
+        # Resolutions of python-quantities units are cached
+        self.assertIs(TestUnitHandler1.pq_units_to_nineml(pq_values.units),
+                      qty.units)
+
 if __name__ == '__main__':
     tester = TestUnitAssignment()
     tester.test_scaling_and_assignment()